@@ -0,0 +1,592 @@
+#!
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: benchmark
+
+Purpose
+=======
+ Measures the speed of individual stages of this Klatt synthesizer
+ implementation, so that optimizations can be compared against the code they
+ replace.
+
+ Every stage is measured over the paragraphs in data/; the text-processing
+ stages are also measured over a synthetic paragraph made by joining the
+ whole corpus end-to-end, repeatedly. Each measurement is reported in samples
+ of audio per second and as a real-time factor, the time taken to process a
+ second of audio, and may be saved as JSON for comparison between revisions.
+
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+
+ (C) Neil Tallim, Sydni Bennie, 2009
+"""
+import array
+import glob
+import json
+import math
+import optparse
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import src.ipa as ipa
+import src.parwave as parwave
+import src.transform as transform
+import src.waveform as waveform
+
+try:
+	import numpy
+except ImportError: #NumPy paths are skipped without it.
+	numpy = None
+	
+_recordings = {} #: The L{_Recording} of each input, keyed by name, made once and shared by every stage.
+
+class _NullSynthesizer(object):
+	"""
+	A stand-in for L{parwave.Synthesizer} that renders nothing, so that the
+	stages before synthesis can be measured on their own.
+	"""
+	def generateSilence(self, milliseconds):
+		"""
+		Produces no silence.
+		
+		@type milliseconds: int
+		@param milliseconds: The number of milliseconds of silence requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		return ()
+		
+	def resetState(self):
+		"""
+		Does nothing, since no state is kept.
+		"""
+		pass
+		
+	def synthesize(self, parameters, f0_multiplier, turbo):
+		"""
+		Renders nothing.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type turbo: bool
+		@param turbo: Whether turbo mode was requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		return ()
+		
+class _RecordingSynthesizer(_NullSynthesizer):
+	"""
+	A stand-in for L{parwave.Synthesizer} that records what it is asked to
+	render, and how many samples that would produce, instead of rendering it.
+	"""
+	samples = 0 #: The number of samples that would have been produced, including silence.
+	sound_samples = 0 #: The number of samples that would have been synthesized, excluding silence.
+	sounds = None #: Every (parameters, f0 multiplier) pair passed to L{synthesize}, in order, if recording.
+	_samples_per_ms = None #: The number of samples produced per millisecond.
+	
+	def __init__(self, sample_rate, record=True):
+		"""
+		Prepares to record sounds.
+		
+		@type sample_rate: int
+		@param sample_rate: The number of samples that would be produced per
+		    second.
+		@type record: bool
+		@param record: If not set, sounds are only counted, so that keeping them
+		    doesn't affect measurements of long inputs.
+		"""
+		if record:
+			self.sounds = []
+		self._samples_per_ms = sample_rate / 1000.0
+		
+	def generateSilence(self, milliseconds):
+		"""
+		Counts the samples a period of silence would produce.
+		
+		@type milliseconds: int
+		@param milliseconds: The number of milliseconds of silence requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		self.samples += int(milliseconds * self._samples_per_ms)
+		return ()
+		
+	def synthesize(self, parameters, f0_multiplier, turbo):
+		"""
+		Records a sound, and counts the samples it would produce.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type turbo: bool
+		@param turbo: Whether turbo mode was requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		samples = int(parameters[-1] * self._samples_per_ms)
+		self.samples += samples
+		self.sound_samples += samples
+		if self.sounds is not None:
+			self.sounds.append((parameters, f0_multiplier))
+		return ()
+		
+class _Recording(object):
+	"""
+	Everything the transform layer produces from one input, captured so that
+	each stage can replay only the work that belongs to it.
+	"""
+	paragraphs = None #: The input's paragraphs, as unicode.
+	phonemes = None #: The arguments of every call to L{transform._phonemeToSound}, in order, minus the synthesizer.
+	samples = 0 #: The number of samples of audio the input produces, including silence.
+	sound_samples = 0 #: The number of samples of audio synthesized from parameters.
+	sounds = None #: Every (parameters, f0 multiplier) pair synthesized, in order.
+	
+	def __init__(self, paragraphs, options):
+		"""
+		Runs the transform layer over every paragraph, recording its output.
+		
+		@type paragraphs: sequence
+		@param paragraphs: The paragraphs to transform, as unicode.
+		@type options: optparse.Values
+		@param options: The options with which synthesis should occur.
+		"""
+		self.paragraphs = paragraphs
+		self.phonemes = []
+		
+		synthesizer = _RecordingSynthesizer(options.rate)
+		phoneme_to_sound = transform._phonemeToSound
+		def recordPhoneme(*arguments):
+			self.phonemes.append(arguments[:-1])
+			return phoneme_to_sound(*arguments)
+		transform._phonemeToSound = recordPhoneme
+		try:
+			for paragraph in paragraphs:
+				for sound in transform.paragraphToSound(paragraph, options, synthesizer):
+					pass
+		finally:
+			transform._phonemeToSound = phoneme_to_sound
+		self.samples = synthesizer.samples
+		self.sound_samples = synthesizer.sound_samples
+		self.sounds = synthesizer.sounds
+		
+def benchmarkTokenization(options):
+	"""
+	Measures how quickly paragraphs are split into marked-up sentences by
+	L{transform._extractSentence}.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	results = []
+	for (name, recording) in _getRecordings(options):
+		def tokenize():
+			for paragraph in recording.paragraphs:
+				tokens = paragraph.split()
+				token_index = sentence_count = 0
+				while token_index < len(tokens):
+					sentence_count += 1
+					(sentence, token_index) = transform._extractSentence(tokens, token_index, sentence_count)
+		results.append((name, recording.samples, _timeBest(tokenize, options.repetitions)))
+	return results
+	
+def benchmarkReduction(options):
+	"""
+	Measures how quickly words are broken into IPA characters by
+	L{ipa.reduceIPAClusters}.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	results = []
+	for (name, recording) in _getRecordings(options):
+		tokens = []
+		for paragraph in recording.paragraphs:
+			paragraph_tokens = paragraph.split()
+			token_index = 0
+			while token_index < len(paragraph_tokens):
+				((words, markup), token_index) = transform._extractSentence(paragraph_tokens, token_index, 1)
+				for (token, word_markup) in words:
+					if token.endswith(u','):
+						token = token[:-1]
+					tokens.append(token)
+		def reduce():
+			reduce_ipa_clusters = ipa.reduceIPAClusters #Cache for speed.
+			for token in tokens:
+				reduce_ipa_clusters(token)
+		results.append((name, recording.samples, _timeBest(reduce, options.repetitions)))
+	return results
+	
+def benchmarkRules(options):
+	"""
+	Measures how quickly the universal and language-specific rules turn each
+	phoneme into parameter-sets, replaying every phoneme the transform layer
+	produced.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	results = []
+	synthesizer = _NullSynthesizer()
+	for (name, recording) in _getRecordings(options):
+		phonemes = [arguments + (synthesizer,) for arguments in recording.phonemes]
+		def applyRules():
+			phoneme_to_sound = transform._phonemeToSound #Cache for speed.
+			for arguments in phonemes:
+				for sound in phoneme_to_sound(*arguments):
+					pass
+		results.append((name, recording.samples, _timeBest(applyRules, options.repetitions)))
+	return results
+	
+def benchmarkScaling(options):
+	"""
+	Measures how the cost of analysing a paragraph, everything but synthesis,
+	grows with its length, as many sentences, as a single run-on sentence, and
+	as a single run-on question; the time per word should stay constant.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	tokens = u' '.join(_getRecordings(options)[0][1].paragraphs).split()
+	run_on_tokens = [token.rstrip(u'.?!') for token in tokens] #Without terminal punctuation, everything is one sentence.
+	synthesis_options = _getSynthesisOptions(options)
+	
+	results = []
+	for word_count in _SCALING_WORD_COUNTS:
+		for (description, source_tokens, terminal) in (('sentences', tokens, u''), ('one sentence', run_on_tokens, u''), ('one question', run_on_tokens, u'?')):
+			paragraph = u' '.join((source_tokens * (word_count // len(source_tokens) + 1))[:word_count]) + terminal
+			synthesizers = []
+			def analyse():
+				synthesizer = _RecordingSynthesizer(options.rate, False)
+				synthesizers.append(synthesizer)
+				for sound in transform.paragraphToSound(paragraph, synthesis_options, synthesizer):
+					pass
+			seconds = _timeBest(analyse, options.repetitions)
+			results.append((
+			 "%i words, %s (%.1fus/word)" % (word_count, description, seconds * 1000000.0 / word_count),
+			 synthesizers[-1].samples, seconds
+			))
+	return results
+	
+def benchmarkSynthesis(options):
+	"""
+	Measures how quickly L{parwave.Synthesizer.synthesize} renders every sound
+	in the corpus, with and without turbo mode, using the selected engine.
+	
+	The cost of synthesis depends only on the sounds rendered, so the
+	synthetic long input is not measured.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	recording = _getRecordings(options)[0][1]
+	synthesis_options = _getSynthesisOptions(options)
+	
+	results = []
+	for turbo in (False, True):
+		def synthesize():
+			synthesizer = transform.createSynthesizer(synthesis_options)
+			for (parameters, f0_multiplier) in recording.sounds:
+				synthesizer.synthesize(parameters, f0_multiplier, turbo)
+		results.append((
+		 "%s%s" % (options.engine, turbo and ', turbo' or ''),
+		 recording.sound_samples, _timeBest(synthesize, options.repetitions)
+		))
+	return results
+	
+def benchmarkContinuity(options):
+	"""
+	Renders every paragraph in the sample data with and without continuous
+	resonator state, reporting how many samples each mode computed only to
+	discard them.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	paragraphs = _getRecordings(options)[0][1].paragraphs
+	
+	results = []
+	for continuous in (False, True):
+		synthesis_options = _getSynthesisOptions(options, continuous=continuous)
+		synthesizers = []
+		def render():
+			synthesizer = transform.createSynthesizer(synthesis_options)
+			synthesizers.append(synthesizer)
+			for paragraph in paragraphs:
+				for sound in transform.paragraphToSound(paragraph, synthesis_options, synthesizer):
+					pass
+		seconds = _timeBest(render, options.repetitions)
+		synthesizer = synthesizers[-1]
+		results.append((
+		 "%s (%i of %i discarded)" % (continuous and 'continuous' or 'reset per sound', synthesizer.samples_discarded, synthesizer.samples_computed),
+		 synthesizer.samples_computed - synthesizer.samples_discarded, seconds
+		))
+	return results
+	
+def benchmarkEncoding(options):
+	"""
+	Compares the per-sample struct packing that L{waveform.WaveForm.addSamples}
+	once performed with each of its current encoding paths, including the
+	quantization of the floating-point samples that synthesizers produce.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (description, sample count, seconds) tuples.
+	"""
+	samples = [int(math.sin(i * 0.05) * 16000) for i in xrange(options.samples)] #A plausible, full-scale waveform.
+	
+	paths = [
+	 ('struct.pack per sample', _packSamples, samples),
+	 ('tuple of ints', _addSamples, tuple(samples)),
+	 ("array.array('h')", _addSamples, array.array('h', samples)),
+	 ("array.array('f'), quantized", _addSamples, array.array('f', samples)),
+	]
+	if numpy is not None:
+		paths.append(('numpy.int16', _addSamples, numpy.array(samples, dtype=numpy.int16)))
+		paths.append(('numpy.float32, quantized', _addSamples, numpy.array(samples, dtype=numpy.float32)))
+		
+	results = []
+	for (description, function, data) in paths:
+		results.append((description, len(data), _timeBest(lambda: _writeWave(function, data), options.repetitions)))
+	return results
+	
+def _addSamples(wave_form, samples):
+	"""
+	Adds samples to a wavefile through its public interface.
+	
+	@type wave_form: L{waveform.WaveForm}
+	@param wave_form: The wavefile to which samples will be added.
+	@type samples: sequence
+	@param samples: The samples to add.
+	"""
+	wave_form.addSamples(samples)
+	
+def _getRecordings(options):
+	"""
+	Provides a L{_Recording} of each input: the paragraphs in data/, and, unless
+	disabled, the whole corpus joined into a single paragraph C{options.long}
+	times over.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	
+	@rtype: list
+	@return: A list of (input name, L{_Recording}) tuples, starting with the
+	    corpus.
+	"""
+	if not _recordings:
+		paragraphs = []
+		for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '*'))):
+			for paragraph in open(filename):
+				paragraph = paragraph.strip()
+				if paragraph.startswith('\xef\xbb\xbf'): #Compensate for Microsoft Notepad.
+					paragraph = paragraph[3:]
+				if paragraph:
+					paragraphs.append(paragraph.decode('utf-8'))
+		synthesis_options = _getSynthesisOptions(options)
+		_recordings['corpus'] = _Recording(paragraphs, synthesis_options)
+		if options.long:
+			_recordings['long'] = _Recording([u' '.join(paragraphs * options.long)], synthesis_options)
+			
+	recordings = [('corpus', _recordings['corpus'])]
+	if 'long' in _recordings:
+		recordings.append(('long (corpus x%i)' % (options.long), _recordings['long']))
+	return recordings
+	
+def _getRevision():
+	"""
+	Identifies the revision being benchmarked.
+	
+	@rtype: str|None
+	@return: The current git commit, or None if it cannot be determined.
+	"""
+	try:
+		process = subprocess.Popen(
+		 ('git', 'rev-parse', 'HEAD'), cwd=os.path.dirname(os.path.abspath(__file__)),
+		 stdout=subprocess.PIPE, stderr=subprocess.PIPE
+		)
+		(output, errors) = process.communicate()
+	except OSError: #git isn't installed.
+		return None
+	if process.returncode:
+		return None
+	return output.strip()
+	
+def _getSynthesisOptions(options, **overrides):
+	"""
+	Builds the options that L{transform} expects, as klatt.py's defaults,
+	using the engine selected for benchmarking.
+	
+	@type options: optparse.Values
+	@param options: The options with which benchmarking should occur.
+	@type overrides: dict
+	@param overrides: Any synthesis options to change from their defaults.
+	
+	@rtype: optparse.Values
+	@return: The options with which synthesis should occur.
+	"""
+	synthesis_options = optparse.Values({
+	 'debug': False,
+	 'verbose': False,
+	 'turbo': False,
+	 'engine': options.engine,
+	 'cache_size': 0,
+	 'word_cache_size': 0, #Every phoneme must pass through transform._phonemeToSound to be recorded.
+	 'seed': 0,
+	 'continuous': False,
+	 'rate': options.rate,
+	 'gain': 0.0,
+	 'profile': False,
+	 'language': None,
+	})
+	for (name, value) in overrides.iteritems():
+		setattr(synthesis_options, name, value)
+	return synthesis_options
+	
+def _packSamples(wave_form, samples):
+	"""
+	Adds samples to a wavefile by packing each one individually, as
+	L{waveform.WaveForm.addSamples} did before it learned to encode in bulk.
+	
+	@type wave_form: L{waveform.WaveForm}
+	@param wave_form: The wavefile to which samples will be added.
+	@type samples: sequence
+	@param samples: The samples to add.
+	"""
+	wave_form._wavefile.writeframes(''.join([struct.pack('h', sample) for sample in samples]))
+	
+def _timeBest(function, repetitions):
+	"""
+	Runs a function several times, keeping the fastest time, which is the
+	least affected by other activity on the system.
+	
+	@type function: callable
+	@param function: The function to be timed.
+	@type repetitions: int
+	@param repetitions: The number of times to run the function.
+	
+	@rtype: float
+	@return: The fastest run, in seconds.
+	"""
+	best = None
+	for i in xrange(repetitions):
+		start = time.time()
+		function()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+	
+def _writeWave(function, samples):
+	"""
+	Writes samples into a temporary wavefile, which is deleted afterwards.
+	
+	@type function: callable
+	@param function: A function that accepts a L{waveform.WaveForm} and a
+	    collection of samples.
+	@type samples: sequence
+	@param samples: The samples to write.
+	"""
+	(handle, filename) = tempfile.mkstemp(suffix='.wav')
+	os.close(handle)
+	try:
+		wave_form = waveform.WaveForm(filename)
+		function(wave_form, samples)
+		wave_form.close()
+	finally:
+		os.remove(filename)
+		
+_SCALING_WORD_COUNTS = (1000, 4000, 16000) #: The paragraph lengths, in words, measured by L{benchmarkScaling}.
+
+_STAGES = (
+ ('tokenization', benchmarkTokenization),
+ ('reduction', benchmarkReduction),
+ ('rules', benchmarkRules),
+ ('scaling', benchmarkScaling),
+ ('synthesis', benchmarkSynthesis),
+ ('continuity', benchmarkContinuity),
+ ('encoding', benchmarkEncoding),
+) #: All benchmarks, in the order in which they run, keyed by name.
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser(usage="%prog [options] [stage...]", version="%s v%s" % ("Klatt CPSC 599", "June 13, 2009"),
+	 description="Measures the speed of synthesis stages: %s." % (', '.join([name for (name, function) in _STAGES])))
+	parser.add_option("-n", "--samples", dest="samples", help="Specify the number of samples to encode (default: 1000000)", type="int", default=1000000)
+	parser.add_option("-r", "--repetitions", dest="repetitions", help="Specify how many times each measurement is repeated (default: 3)", type="int", default=3)
+	parser.add_option("-e", "--engine", dest="engine", help="Specify the synthesis engine to measure (default: sample)", type="choice", choices=sorted(parwave.ENGINES.keys()), default="sample")
+	parser.add_option("-l", "--long", dest="long", help="Also measure text processing over the whole corpus joined into one paragraph N times; 0 disables this (default: 4)", metavar="N", type="int", default=4)
+	parser.add_option("--rate", dest="rate", help="Synthesize HZ samples per second (default: %i)" % (parwave.SAMPLE_RATE), metavar="HZ", type="int", default=parwave.SAMPLE_RATE)
+	parser.add_option("-j", "--json", dest="json", help="Save the results to FILE as JSON, for comparison between revisions", metavar="FILE", type="string", default=None)
+	(options, arguments) = parser.parse_args()
+	
+	stage_names = [name for (name, function) in _STAGES]
+	for name in arguments:
+		if not name in stage_names:
+			parser.error("Unknown stage '%s'." % (name))
+	del parser
+	
+	report = {
+	 'revision': _getRevision(),
+	 'python': sys.version.split()[0],
+	 'numpy': numpy and numpy.__version__,
+	 'engine': options.engine,
+	 'rate': options.rate,
+	 'repetitions': options.repetitions,
+	 'stages': {},
+	}
+	for (name, function) in _STAGES:
+		if arguments and not name in arguments:
+			continue
+		print "%s:" % (name)
+		stage_results = report['stages'][name] = []
+		for (description, samples, seconds) in function(options):
+			seconds = max(seconds, 1e-9)
+			real_time_factor = seconds / (float(samples) / options.rate) #Seconds spent per second of audio.
+			print "\t%-48s %10.3fs %14.0f samples/s  RTF %.3g" % (description, seconds, samples / seconds, real_time_factor)
+			stage_results.append({
+			 'description': description,
+			 'samples': samples,
+			 'seconds': seconds,
+			 'samples_per_second': samples / seconds,
+			 'real_time_factor': real_time_factor,
+			})
+			
+	if options.json:
+		json_file = open(options.json, 'w')
+		try:
+			json.dump(report, json_file, indent=1, sort_keys=True)
+		finally:
+			json_file.close()
@@ -17,14 +17,37 @@ Legal
  
  (C) Neil Tallim, Sydni Bennie, 2009
 """
+import csv
+import glob
+import itertools
+import json
+import multiprocessing
 import optparse
+import os
 import re
 import sys
+import time
 
+import src.instrumentation as instrumentation
+import src.ipa as ipa
+import src.language_rules as language_rules
+import src.languages as languages
 import src.parwave as parwave
+import src.pcm_cache as pcm_cache
+import src.server as server
 import src.transform as transform
+import src.universal_rules as universal_rules
 import src.waveform as waveform
 
+_COPY_BYTES = 1024 * 1024 #: The number of bytes of PCM copied at a time from a cached render.
+_MANIFEST_EXTENSIONS = ('.csv', '.jsonl') #: The extensions that identify a batch source as a manifest.
+_OUTPUT_EXTENSIONS = {
+ 'float32': '.f32',
+ 'raw': '.pcm',
+ 'wav': '.wav',
+} #: The extension given to the file rendered from each batch input, by --format.
+_STDOUT = '-' #: The output that sends headerless speech to standard output.
+
 def main(input_file, options):
 	"""
 	Renders the IPA found in input_file, producing a wavefile containing
@@ -35,54 +58,693 @@ def main(input_file, options):
 	@type options: optparse.Values
 	@param options: The options with which synthesis should occur.
 	"""
-	print "Language: '%s'" % (transform.language_rules.language.NAME)
+	print "Language: '%s'" % (languages.getLanguage(options.language).NAME)
+	
+	if options.dry_run:
+		_planInput(input_file, options)
+		return
+		
+	if options.profile:
+		instrumentation.enable()
+		start = instrumentation.clock()
+	(synthesizer, disk_cache) = _prepareRendering(options)
+	
+	pool = None
+	try:
+		if options.jobs != 1:
+			pool = _createPool(options)
+		_renderFile(input_file, options.output, options, synthesizer, disk_cache, pool, True)
+		if pool is not None:
+			pool.close()
+			
+		_reportStatistics(options, synthesizer, disk_cache)
+		if options.profile:
+			instrumentation.recordStage('total', instrumentation.clock() - start)
+			print instrumentation.getReport().encode('utf-8')
+	except Exception, e:
+		print "An error occurred: %s" % (e)
+		if pool is not None:
+			pool.terminate()
+	if pool is not None:
+		pool.join()
+		
+def batch(source, options):
+	"""
+	Renders every input named by source, one after another, sharing a single
+	synthesizer, worker pool, and set of caches, and carrying on past any
+	input that cannot be rendered.
+	
+	@type source: basestring
+	@param source: A directory, every file in which, other than wavefiles, is
+	    an input; a glob pattern that matches inputs; or a manifest, as
+	    described in L{_readManifest}.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	"""
+	print "Language: '%s'" % (languages.getLanguage(options.language).NAME)
+	
+	try:
+		renders = _getBatchRenders(source, options.output_dir, _OUTPUT_EXTENSIONS[options.format])
+	except (EnvironmentError, ValueError), e:
+		print "Unable to read '%s': %s" % (source, e)
+		sys.exit(1)
+	if not renders:
+		print "Nothing to render in '%s'." % (source)
+		sys.exit(1)
+		
+	if options.dry_run:
+		for (input_file, output) in renders:
+			print "%s:" % (input_file)
+			_planInput(input_file, options)
+		return
+		
+	if options.profile:
+		instrumentation.enable()
+	start = time.time()
+	(synthesizer, disk_cache) = _prepareRendering(options)
+	
+	pool = None
+	failures = 0
+	for (i, (input_file, output)) in enumerate(renders):
+		if pool is None and options.jobs != 1:
+			pool = _createPool(options)
+		render_start = time.time()
+		try:
+			_renderFile(input_file, output, options, synthesizer, disk_cache, pool, options.verbose)
+		except Exception, e:
+			failures += 1
+			print "[%i/%i] %s: failed after %.2fs: %s" % (i + 1, len(renders), input_file, time.time() - render_start, e)
+			if pool is not None: #Its workers may still be rendering the failed input.
+				pool.terminate()
+				pool.join()
+				pool = None
+		else:
+			print "[%i/%i] %s -> %s: %.2fs" % (i + 1, len(renders), input_file, output, time.time() - render_start)
+	if pool is not None:
+		pool.close()
+		pool.join()
+		
+	print "Rendered %i of %i inputs in %.2fs." % (len(renders) - failures, len(renders), time.time() - start)
+	_reportStatistics(options, synthesizer, disk_cache)
+	if options.profile:
+		instrumentation.recordStage('total', time.time() - start)
+		print instrumentation.getReport().encode('utf-8')
+	if failures:
+		sys.exit(1)
+		
+def _renderFile(input_file, output, options, synthesizer, disk_cache, pool, report_progress):
+	"""
+	Renders the IPA found in input_file into a wavefile.
 	
-	synthesizer = parwave.Synthesizer() #The synthesizer that will render speech.
+	If rendering fails, the partially written wavefile is removed.
+	
+	@type input_file: basestring
+	@param input_file: A file containing synthesizable IPA.
+	@type output: basestring
+	@param output: The path of the wavefile to be written, or L{_STDOUT}.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	@type synthesizer: L{parwave.Synthesizer}
+	@param synthesizer: The synthesizer to use when rendering in this process.
+	@type disk_cache: L{pcm_cache.PCMCache}|None
+	@param disk_cache: The cache in which rendered paragraphs and inputs are
+	    stored, if any.
+	@type pool: multiprocessing.Pool|None
+	@param pool: The pool, created by L{_createPool}, in which paragraphs are
+	    rendered, or None to render them in this process.
+	@type report_progress: bool
+	@param report_progress: True to announce each paragraph as it is
+	    rendered.
+	
+	@raise Exception: If the input cannot be read or rendered, or the
+	    wavefile cannot be written.
+	"""
 	wave_form = None
+	if not options.mmap: #A memory-mapped wavefile can't be opened until its length is known.
+		wave_form = _openWaveForm(output, synthesizer.sample_rate, options.format)
+	silent_half_second = synthesizer.generateSilence(500) #Half of a second of silence.
+	
+	writer = None
 	try:
-  		wave_form = waveform.WaveForm(options.output) #The wavefile interface to which data will be dumped.
-  	except IOError:
-  		print "Unable to open '%s' for recording. Please close any applications that might be using it and try again." % (options.output)
-  		sys.exit(1)
-  	chomp_regexp = re.compile("\r?\n$") #A regular expression that cuts newlines off the ends of strings.
-  	silent_half_second = synthesizer.generateSilence(500) #Half of a second of silence.
-  	try:
-  		paragraph_count = 0
-		for paragraph in open(input_file):
-			paragraph = chomp_regexp.sub("", paragraph).strip()
-			if not paragraph: #Skip blank lines.
-				continue
+		paragraphs = _readParagraphs(input_file)
+		paragraph_keys = cached_file = paragraph_offsets = None
+		if disk_cache is not None:
+			paragraphs = list(paragraphs)
+			paragraph_keys = _getParagraphKeys(paragraphs, options)
+			file_key = pcm_cache.getKey(*paragraph_keys)
+			cached_file = disk_cache.open(file_key)
+			if cached_file is None: #Store the whole render, as well as each paragraph.
+				writer = disk_cache.createWriter(file_key)
 				
-			#Compensate for Microsoft Notepad.
-			if paragraph_count == 0 and paragraph.startswith('\xef\xbb\xbf'):
-				paragraph = paragraph[3:]
+		if options.mmap:
+			if cached_file is not None:
+				sample_count = os.fstat(cached_file.fileno()).st_size // 2
+			else:
+				if report_progress:
+					print "Counting samples..."
+				paragraphs = list(paragraphs)
+				paragraph_offsets = _getParagraphOffsets(paragraphs, options, len(silent_half_second))
+				sample_count = paragraph_offsets[-1]
+			wave_form = _openWaveForm(output, synthesizer.sample_rate, options.format, sample_count)
+			
+		add_samples = wave_form.addSamples
+		if writer is not None and not options.mmap: #A memory-mapped render is stored once complete, since workers write it directly.
+			def add_samples(samples):
+				pcm = waveform.encodeSamples(samples)
+				wave_form.addSamples(pcm)
+				writer.write(pcm)
 				
-			paragraph_count += 1
-			print "Processing paragraph #%i..." % (paragraph_count)
-			paragraph = paragraph.decode('utf-8')
-			if options.verbose:
-				print u"'%s'" % (paragraph)
-				
-			for segment in transform.paragraphToSound(paragraph, options, synthesizer): #Convert and add the paragraph.
-				wave_form.addSamples(segment)
-			wave_form.addSamples(silent_half_second) #Add a half-second of silence.
+		if cached_file is not None: #The whole input has been rendered before, so just copy it.
+			if report_progress:
+				print "Reusing cached render..."
+			try:
+				pcm = cached_file.read(_COPY_BYTES)
+				while pcm:
+					wave_form.addSamples(pcm)
+					pcm = cached_file.read(_COPY_BYTES)
+			finally:
+				cached_file.close()
+		elif pool is None:
+			for (i, paragraph) in enumerate(paragraphs):
+				if report_progress:
+					if paragraph_offsets is not None:
+						print "Processing paragraph #%i (%i%%)..." % (i + 1, paragraph_offsets[i] * 100 / max(sample_count, 1))
+					else:
+						print "Processing paragraph #%i..." % (i + 1)
+				if options.verbose:
+					print u"'%s'" % (paragraph)
+					
+				if disk_cache is not None:
+					add_samples(_renderCachedParagraph(i, paragraph, paragraph_keys[i], options, synthesizer, disk_cache))
+				else:
+					if options.seed is not None:
+						synthesizer.seedNoise((options.seed, i))
+					for segment in transform.paragraphToSound(paragraph, options, synthesizer): #Convert and add the paragraph.
+						add_samples(segment)
+				add_samples(silent_half_second) #Add a half-second of silence.
+		else:
+			paragraphs = list(paragraphs) #The pool would lose any error raised while reading.
+			if paragraph_keys is None:
+				paragraph_keys = itertools.repeat(None)
+			paragraph_targets = itertools.repeat(None)
+			if paragraph_offsets is not None: #Workers write straight into the wavefile, leaving the silence between paragraphs untouched.
+				paragraph_targets = [(output, sample_count, offset, paragraph_offsets[i + 1] - len(silent_half_second)) for (i, offset) in enumerate(paragraph_offsets[:-1])]
+			for (i, (samples, measurements)) in enumerate(pool.imap(_renderParagraph, itertools.izip(itertools.count(), paragraphs, paragraph_keys, paragraph_targets))): #Results arrive in input order.
+				if report_progress:
+					print "Processing paragraph #%i..." % (i + 1)
+				if measurements is not None:
+					instrumentation.merge(measurements)
+				if samples is not None:
+					add_samples(samples)
+					add_samples(silent_half_second) #Add a half-second of silence.
+		if writer is not None and options.mmap:
+			writer.write(wave_form.getPCM())
 		wave_form.close()
+		if writer is not None:
+			writer.commit()
+	except:
+		if writer is not None:
+			writer.discard()
+		if wave_form is not None:
+			try:
+				wave_form.close()
+				if output != _STDOUT:
+					os.remove(output)
+			except EnvironmentError: #Only the original failure matters.
+				pass
+		raise
+		
+def _prepareRendering(options):
+	"""
+	Creates the synthesizer and disk cache with which rendering occurs in this
+	process, exiting if either cannot be created.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: tuple(2)
+	@return: The synthesizer, and the L{pcm_cache.PCMCache} requested by
+	    --cache-dir, or None.
+	"""
+	try:
+		synthesizer = transform.createSynthesizer(options) #The synthesizer that will render speech.
+	except ImportError, e:
+		print "Unable to use the '%s' engine: %s" % (options.engine, e)
+		sys.exit(1)
+		
+	disk_cache = None
+	if options.cache_dir:
+		try:
+			disk_cache = pcm_cache.PCMCache(options.cache_dir, int(options.cache_dir_size * 1024 * 1024))
+		except OSError, e:
+			print "Unable to use '%s' as a cache directory: %s" % (options.cache_dir, e)
+			sys.exit(1)
+	return (synthesizer, disk_cache)
+	
+def _reportStatistics(options, synthesizer, disk_cache):
+	"""
+	Outputs the effectiveness of each cache used in this process, if
+	statistical information was requested.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis occurred.
+	@type synthesizer: L{parwave.Synthesizer}
+	@param synthesizer: The synthesizer used in this process.
+	@type disk_cache: L{pcm_cache.PCMCache}|None
+	@param disk_cache: The disk cache used in this process, if any.
+	"""
+	if not options.debug:
+		return
+	if synthesizer.getCache() is not None:
+		cache = synthesizer.getCache()
+		print "Render cache: %i hits, %i misses; %i sounds in %i bytes." % ((cache.hits, cache.misses) + cache.getSize())
+	if options.turbo and options.jobs == 1:
+		print "Turbo wavetables: %i hits, %i misses." % (synthesizer.wavetable_hits, synthesizer.wavetable_misses)
+	if disk_cache is not None and options.jobs == 1:
+		print "Disk cache: %i hits, %i misses." % (disk_cache.hits, disk_cache.misses)
+		
+def _getBatchRenders(source, output_dir, extension):
+	"""
+	Determines every input named by a batch source, and the wavefile into
+	which each one will be rendered.
+	
+	Unless a manifest names it, each input's wavefile has the same name as
+	the input, with the given extension, and is written alongside it, or into
+	output_dir, if given.
+	
+	@type source: basestring
+	@param source: A directory, a glob pattern, or a manifest, as described in
+	    L{batch}.
+	@type output_dir: basestring|None
+	@param output_dir: The directory into which wavefiles not named by a
+	    manifest are written, created if necessary; if None, each is written
+	    alongside its input.
+	@type extension: basestring
+	@param extension: The extension of wavefiles not named by a manifest.
+	
+	@rtype: list
+	@return: An (input, wavefile) tuple for every input, in order.
+	
+	@raise EnvironmentError: If the source or output_dir cannot be read or
+	    created.
+	@raise ValueError: If a manifest is malformed.
+	"""
+	if os.path.isdir(source):
+		inputs = [os.path.join(source, filename) for filename in sorted(os.listdir(source)) if os.path.splitext(filename)[1].lower() not in _OUTPUT_EXTENSIONS.values()]
+		inputs = [path for path in inputs if os.path.isfile(path)]
+		renders = [(path, None) for path in inputs]
+	elif os.path.splitext(source)[1].lower() in _MANIFEST_EXTENSIONS:
+		renders = _readManifest(source)
+	else:
+		renders = [(path, None) for path in sorted(glob.glob(source)) if os.path.isfile(path)]
+		
+	if output_dir and not os.path.isdir(output_dir):
+		os.makedirs(output_dir)
+	resolved_renders = []
+	for (input_file, output) in renders:
+		if output is None:
+			output = os.path.splitext(input_file)[0] + extension
+			if output_dir:
+				output = os.path.join(output_dir, os.path.basename(output))
+		resolved_renders.append((input_file, output))
+	return resolved_renders
+	
+def _getParagraphKeys(paragraphs, options):
+	"""
+	Computes the keys under which each paragraph's render is stored in a
+	L{pcm_cache.PCMCache}.
+	
+	Each key covers the paragraph's text; the source code of every module
+	that shapes the render, including the language ruleset; every option that
+	affects the samples produced; and, if a seed was specified, the seed from
+	which the paragraph's noise is generated.
+	
+	@type paragraphs: sequence
+	@param paragraphs: Every paragraph in the input, in order, as unicode.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: list
+	@return: The key of each paragraph, in order.
+	"""
+	version = pcm_cache.getSourceDigest((
+	 ipa, language_rules, languages.getLanguage(options.language), parwave, transform, universal_rules, waveform
+	))
+	synthesis_options = (options.language, options.engine, options.turbo, options.rate, options.gain, options.continuous, bool(options.cache_size))
+	keys = []
+	for (i, paragraph) in enumerate(paragraphs):
+		seed = None
+		if options.seed is not None:
+			seed = (options.seed, i)
+		keys.append(pcm_cache.getKey(version, synthesis_options, seed, paragraph))
+	return keys
+	
+def _getParagraphOffsets(paragraphs, options, silence_length):
+	"""
+	Works out where each paragraph's render begins in the output, by counting
+	the samples every paragraph will produce, as described in
+	L{transform.countParagraphSamples}.
+	
+	@type paragraphs: sequence
+	@param paragraphs: Every paragraph in the input, in order, as unicode.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	@type silence_length: int
+	@param silence_length: The number of samples of silence that follow each
+	    paragraph.
+	
+	@rtype: list
+	@return: The index of the first sample of each paragraph, in order,
+	    followed by the total number of samples in the output.
+	"""
+	offsets = [0]
+	for paragraph in paragraphs:
+		offsets.append(offsets[-1] + transform.countParagraphSamples(paragraph, options, options.language) + silence_length)
+	return offsets
+	
+def _openWaveForm(filename, sample_rate, output_format, sample_count=None):
+	"""
+	Opens the wavefile to which speech will be written.
+	
+	@type filename: basestring
+	@param filename: The path to the wavefile to be written, or L{_STDOUT}.
+	@type sample_rate: int
+	@param sample_rate: The number of samples per second being synthesized.
+	@type output_format: basestring
+	@param output_format: The --format in which speech is written: 'wav',
+	    'raw', or 'float32'.
+	@type sample_count: int|None
+	@param sample_count: The number of samples the wavefile will hold, if it
+	    is to be memory-mapped, or None to write it sequentially.
+	
+	@rtype: L{waveform.Sink}|L{waveform.MappedWaveForm}
+	@return: The wavefile interface to which data will be dumped.
+	
+	@raise IOError: If the wavefile cannot be opened.
+	"""
+	if filename == _STDOUT:
+		filename = sys.__stdout__.fileno() #sys.stdout carries messages instead.
+	try:
+		if sample_count is not None:
+			return waveform.MappedWaveForm(filename, sample_rate, sample_count)
+		if output_format == 'raw':
+			return waveform.RawSink(filename)
+		if output_format == 'float32':
+			return waveform.Float32Sink(filename)
+		return waveform.WaveForm(filename, sample_rate)
+	except IOError:
+		raise IOError("Unable to open '%s' for recording. Please close any applications that might be using it and try again." % (filename))
+		
+def _planInput(input_file, options):
+	"""
+	Reports how long the speech rendered from input_file will be, and how many
+	frames it will take to synthesize, without synthesizing anything, as
+	described in L{transform.planParagraph}.
+	
+	@type input_file: basestring
+	@param input_file: A file containing synthesizable IPA.
+	@type options: optparse.Values
+	@param options: The options with which synthesis would occur.
+	"""
+	silence_length = parwave.FramePlanner(options.rate).generateSilence(500).sample_count #The half-second that follows each paragraph.
+	try:
+		total_frames = 0
+		total_samples = 0
+		for (i, paragraph) in enumerate(_readParagraphs(input_file)):
+			schedule = transform.planParagraph(paragraph, options, options.language, total_samples)
+			frames = len([parameters for (parameters, f0_multiplier, start, sample_count) in schedule if parameters is not None])
+			samples = sum([sample_count for (parameters, f0_multiplier, start, sample_count) in schedule])
+			print "Paragraph #%i: %i frames, %i samples (%.2fs)" % (i + 1, frames, samples, float(samples) / options.rate)
+			total_frames += frames
+			total_samples += samples + silence_length
 	except Exception, e:
 		print "An error occurred: %s" % (e)
+		return
+	print "Total: %i frames, %i samples (%.2fs) at %iHz" % (total_frames, total_samples, float(total_samples) / options.rate, options.rate)
+	
+def _readManifest(manifest):
+	"""
+	Reads a batch manifest, which lists every input to be rendered and,
+	optionally, the wavefile into which each is rendered; relative paths are
+	interpreted relative to the manifest's directory.
+	
+	A '.csv' manifest has one input per row, optionally followed by its
+	wavefile; a first row of 'input,output' is skipped. A '.jsonl' manifest has
+	one JSON object per line, with an 'input' and, optionally, an 'output'.
+	
+	@type manifest: basestring
+	@param manifest: The path of the manifest.
+	
+	@rtype: list
+	@return: An (input, wavefile) tuple for every input, in order, where the
+	    wavefile is None if it was not named.
+	
+	@raise EnvironmentError: If the manifest cannot be read.
+	@raise ValueError: If the manifest is malformed.
+	"""
+	directory = os.path.dirname(manifest)
+	entries = []
+	manifest_file = open(manifest, 'rb')
+	try:
+		if manifest.lower().endswith('.csv'):
+			for (i, row) in enumerate(csv.reader(manifest_file)):
+				row = [field.strip() for field in row]
+				if not row or not row[0] or (i == 0 and [field.lower() for field in row[:2]] == ['input', 'output']):
+					continue
+				entries.append((i + 1, row[0], len(row) > 1 and row[1] or None))
+		else:
+			for (i, line) in enumerate(manifest_file):
+				if not line.strip():
+					continue
+				try:
+					entry = json.loads(line)
+					entries.append((i + 1, entry['input'], entry.get('output')))
+				except (ValueError, KeyError, TypeError, AttributeError):
+					raise ValueError("line %i is not an object with an 'input'" % (i + 1))
+	except csv.Error, e:
+		raise ValueError(str(e))
+	finally:
+		manifest_file.close()
+		
+	renders = []
+	for (line, input_file, output) in entries:
+		if not isinstance(input_file, basestring) or not (output is None or isinstance(output, basestring)):
+			raise ValueError("line %i does not name files" % (line))
+		input_file = os.path.join(directory, input_file)
+		if output:
+			output = os.path.join(directory, output)
+		renders.append((input_file, output or None))
+	return renders
+	
+def _readParagraphs(input_file):
+	"""
+	Reads every non-blank line from input_file.
+	
+	@type input_file: basestring
+	@param input_file: A file containing synthesizable IPA.
+	
+	@rtype: generator
+	@return: A generator that yields each paragraph, as unicode.
+	"""
+	chomp_regexp = re.compile("\r?\n$") #A regular expression that cuts newlines off the ends of strings.
+	paragraph_count = 0
+	for paragraph in open(input_file):
+		paragraph = chomp_regexp.sub("", paragraph).strip()
+		if not paragraph: #Skip blank lines.
+			continue
+			
+		#Compensate for Microsoft Notepad.
+		if paragraph_count == 0 and paragraph.startswith('\xef\xbb\xbf'):
+			paragraph = paragraph[3:]
+			
+		paragraph_count += 1
+		yield paragraph.decode('utf-8')
 		
+_worker_options = None #: The options with which a worker process renders paragraphs.
+_worker_synthesizer = None #: The synthesizer that renders paragraphs in a worker process.
+_worker_cache = None #: The L{pcm_cache.PCMCache} that stores paragraphs rendered in a worker process, if any.
+
+def _createPool(options):
+	"""
+	Starts the worker processes requested by the --jobs option.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: multiprocessing.Pool
+	@return: A pool whose workers have been prepared by L{_initWorker}.
+	"""
+	return multiprocessing.Pool(options.jobs or None, _initWorker, (options,))
+	
+def _initWorker(options):
+	"""
+	Prepares a worker process, started by the --jobs option, to render
+	paragraphs with its own synthesizer.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	"""
+	global _worker_options
+	global _worker_synthesizer
+	global _worker_cache
+	
+	_worker_options = options
+	_worker_synthesizer = transform.createSynthesizer(options)
+	if options.cache_dir:
+		_worker_cache = pcm_cache.PCMCache(options.cache_dir, int(options.cache_dir_size * 1024 * 1024))
+	if options.profile:
+		instrumentation.reset() #Forked workers inherit everything the parent has measured so far.
+		instrumentation.enable()
+		
+def _renderParagraph((paragraph_index, paragraph, key, target)):
+	"""
+	Renders a paragraph in a worker process.
+	
+	If the parent process memory-mapped the wavefile, the paragraph is written
+	into it directly, rather than being returned.
+	
+	If a seed was specified, noise is reseeded exactly as it is when rendering
+	in a single process, so the output is identical.
+	
+	@type paragraph_index: int
+	@param paragraph_index: The paragraph's position in the input, indexed
+	    from 0.
+	@type paragraph: unicode
+	@param paragraph: The text to be synthesized.
+	@type key: str|None
+	@param key: The key under which the paragraph's render is stored in the
+	    worker's L{pcm_cache.PCMCache}, if there is one.
+	@type target: tuple(4)|None
+	@param target: If the wavefile is being written directly, its path; the
+	    number of samples it holds; and the indexes of the first sample of the
+	    paragraph's render and of the first sample after it.
+	
+	@rtype: tuple(2)
+	@return: The paragraph's synthesized speech, as 16-bit PCM data, or None
+	    if it was written into the wavefile, and, if profiling, the
+	    measurements taken while rendering it, as returned by
+	    L{instrumentation.getSnapshot}, or None otherwise.
+	
+	@raise ValueError: If the paragraph's render is not as long as its place
+	    in the wavefile.
+	"""
+	if _worker_options.verbose:
+		print u"'%s'" % (paragraph)
+	if _worker_cache is not None:
+		samples = _renderCachedParagraph(paragraph_index, paragraph, key, _worker_options, _worker_synthesizer, _worker_cache)
+	else:
+		if _worker_options.seed is not None:
+			_worker_synthesizer.seedNoise((_worker_options.seed, paragraph_index))
+		samples = ''.join([waveform.encodeSamples(segment) for segment in transform.paragraphToSound(paragraph, _worker_options, _worker_synthesizer)])
+	if target is not None:
+		(output, sample_count, start, end) = target
+		if len(samples) // 2 != end - start:
+			raise ValueError("Paragraph #%i produced %i samples, but %i were counted." % (paragraph_index + 1, len(samples) // 2, end - start))
+		wave_form = waveform.MappedWaveForm(output, _worker_synthesizer.sample_rate, sample_count, False)
+		try:
+			wave_form.writeSamples(start, samples)
+		finally:
+			wave_form.close()
+		samples = None
+		
+	if not _worker_options.profile:
+		return (samples, None)
+	measurements = instrumentation.getSnapshot()
+	instrumentation.reset() #Each paragraph's measurements are only reported once.
+	return (samples, measurements)
+	
+def _renderCachedParagraph(paragraph_index, paragraph, key, options, synthesizer, disk_cache):
+	"""
+	Provides a paragraph's synthesized speech from a disk cache, rendering and
+	storing it first if it isn't already there.
+	
+	If a seed was specified, noise is reseeded before rendering, exactly as it
+	is when no cache is used, so the output is identical.
+	
+	@type paragraph_index: int
+	@param paragraph_index: The paragraph's position in the input, indexed
+	    from 0.
+	@type paragraph: unicode
+	@param paragraph: The text to be synthesized.
+	@type key: str
+	@param key: The key under which the paragraph's render is stored, as
+	    returned by L{_getParagraphKeys}.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	@type synthesizer: L{parwave.Synthesizer}
+	@param synthesizer: The synthesizer to use when rendering sounds.
+	@type disk_cache: L{pcm_cache.PCMCache}
+	@param disk_cache: The cache in which rendered paragraphs are stored.
+	
+	@rtype: str
+	@return: The paragraph's synthesized speech, as 16-bit PCM data.
+	
+	@raise IOError: If the render cannot be stored.
+	"""
+	samples = disk_cache.get(key)
+	if samples is None:
+		if options.seed is not None:
+			synthesizer.seedNoise((options.seed, paragraph_index))
+		samples = ''.join([waveform.encodeSamples(segment) for segment in transform.paragraphToSound(paragraph, options, synthesizer)])
+		disk_cache.put(key, samples)
+	return samples
+	
 if __name__ == '__main__':
-	parser = optparse.OptionParser(usage="%prog [options] <IPA script>", version="%s v%s" % ("Klatt CPSC 599", "June 13, 2009"),
+	parser = optparse.OptionParser(usage="%prog [options] <IPA script>\n       %prog [options] --batch <directory|glob|manifest>\n       %prog [options] --serve <address>", version="%s v%s" % ("Klatt CPSC 599", "June 13, 2009"),
 	 description="Renders IPA transcriptions as synthesized speech.")
 	parser.add_option("-d", "--debug", dest="debug", help="Output statistical information", action="store_true", default=False)
 	parser.add_option("-v", "--verbose", dest="verbose", help="Output intermediate state information", action="store_true", default=False)
-	parser.add_option("-o", "--output", dest = "output", help="Specify an alternate output wavefile (default: output.wav)", type="string", default="output.wav")
+	parser.add_option("-o", "--output", dest = "output", help="Specify an alternate output wavefile, or '-' to stream speech to standard output (default: output.wav)", type="string", default="output.wav")
+	parser.add_option("-f", "--format", dest="format", help="Specify the output format: 'wav'; 'raw', headerless 16-bit little-endian PCM; or 'float32', headerless 32-bit little-endian floating-point samples (default: raw with '-o -', otherwise wav)", type="choice", choices=sorted(_OUTPUT_EXTENSIONS.keys()), default=None)
 	parser.add_option("-t", "--turbo", dest="turbo", help="Enable super-fast rendering at the expense of uniform noise", action="store_true", default=False)
+	parser.add_option("-e", "--engine", dest="engine", help="Specify the synthesis engine: 'sample' renders one sample at a time; 'block' renders whole sounds at once, and requires NumPy (default: sample)", type="choice", choices=sorted(parwave.ENGINES.keys()), default="sample")
+	parser.add_option("-c", "--cache-size", dest="cache_size", help="Keep up to MB megabytes of rendered sounds for reuse, at the expense of noise varying between identical sounds (default: 0, disabled)", metavar="MB", type="float", default=0)
+	parser.add_option("-w", "--word-cache", dest="word_cache_size", help="Keep the parameters of up to N recently transformed words for reuse; reused words sound exactly the same (default: 1024; 0 disables)", metavar="N", type="int", default=1024)
+	parser.add_option("--cache-dir", dest="cache_dir", help="Keep rendered paragraphs and inputs in DIR, shared safely by any number of processes, so that repeated renders are copied instead of synthesized (default: disabled)", metavar="DIR", type="string", default=None)
+	parser.add_option("--cache-dir-size", dest="cache_dir_size", help="Discard the least-recently-used renders in --cache-dir beyond MB megabytes (default: 256)", metavar="MB", type="float", default=256)
+	parser.add_option("-n", "--dry-run", dest="dry_run", help="Apply every rule and report the length of the speech that would be rendered, without synthesizing or writing anything", action="store_true", default=False)
+	parser.add_option("--mmap", dest="mmap", help="Count the samples in every paragraph first, then write the wavefile through a memory-mapped, preallocated view, into which --jobs workers write directly", action="store_true", default=False)
+	parser.add_option("-b", "--batch", dest="batch", help="Render every input in a directory, matching a glob, or listed in a .csv or .jsonl manifest of input and output paths, carrying on past any that fail", action="store_true", default=False)
+	parser.add_option("--output-dir", dest="output_dir", help="With --batch, write wavefiles not named by a manifest into DIR (default: alongside each input)", metavar="DIR", type="string", default=None)
+	parser.add_option("--serve", dest="serve", help="Keep running, rendering IPA POSTed over HTTP to ADDRESS, the path of a Unix domain socket or a localhost port, with --jobs warm synthesizers; see src/server.py (default: disabled)", metavar="ADDRESS", type="string", default=None)
+	parser.add_option("--serve-remote", dest="serve_remote", help="Allow --serve to listen on a HOST:PORT address that isn't loopback, exposing it to other machines (default: localhost only)", action="store_true", default=False)
+	parser.add_option("-s", "--seed", dest="seed", help="Generate noise reproducibly from the integer N (default: unpredictable noise)", metavar="N", type="int", default=None)
+	parser.add_option("-j", "--jobs", dest="jobs", help="Render paragraphs in N parallel processes; 0 uses every core (default: 1)", metavar="N", type="int", default=1)
+	parser.add_option("-r", "--rate", dest="rate", help="Synthesize HZ samples per second; lower rates are faster, but lose formants above half of the rate (default: %i)" % (parwave.SAMPLE_RATE), metavar="HZ", type="int", default=parwave.SAMPLE_RATE)
+	parser.add_option("-g", "--gain", dest="gain", help="Scale the output by DB decibels, as part of the scaling every sample undergoes; samples beyond full scale are clipped (default: 0)", metavar="DB", type="float", default=0.0)
+	parser.add_option("-l", "--language", dest="language", help="Specify the language ruleset to apply: %s (default: %s)" % (', '.join(languages.getLanguageNames()), languages.DEFAULT_LANGUAGE), type="choice", choices=languages.getLanguageNames(), default=languages.DEFAULT_LANGUAGE)
+	parser.add_option("-p", "--profile", dest="profile", help="Report the time spent in each stage of synthesis and each language rule, and what every phoneme produced", action="store_true", default=False)
+	parser.add_option("--continuous", dest="continuous", help="Carry resonator state from each sound into the next, rather than rendering and discarding an extra period per sound", action="store_true", default=False)
 	(options, arguments) = parser.parse_args()
 	
-	if not arguments:
+	if not arguments and not options.serve:
 		parser.print_help()
 		sys.exit(1)
+	if options.continuous and options.cache_size:
+		parser.error("--continuous cannot be combined with --cache-size.")
+	if options.word_cache_size < 0:
+		parser.error("--word-cache cannot be negative.")
+	if options.rate < 1000:
+		parser.error("--rate must be at least 1000.")
+	streaming = options.output == _STDOUT and not (options.batch or options.serve)
+	if options.format is None:
+		options.format = streaming and 'raw' or 'wav'
+	if streaming and options.format == 'wav':
+		parser.error("-o - cannot write a wavefile, whose header needs seeking; use --format raw or float32.")
+	if options.mmap and (options.format != 'wav' or streaming):
+		parser.error("--mmap can only write wavefiles.")
 	del parser
 	
-	main(arguments[0], options)
+	if options.serve:
+		try:
+			server.serve(options.serve, options, options.serve_remote)
+		except (ValueError, EnvironmentError), e:
+			print "Unable to serve on '%s': %s" % (options.serve, e)
+			sys.exit(1)
+	elif options.batch:
+		batch(arguments[0], options)
+	else:
+		if streaming: #Keep messages out of the speech.
+			sys.stdout = sys.stderr
+		main(arguments[0], options)
 	
\ No newline at end of file
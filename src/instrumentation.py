@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: src.instrumentation
+
+Purpose
+=======
+ Records how much time each stage of synthesis takes, how often each stage
+ and each language rule runs, and how many frames and samples every phoneme
+ produces, so that slow renders can be explained.
+ 
+ Instrumented code checks L{enabled} before measuring anything, so while
+ instrumentation is disabled, which it is by default, each measurement point
+ costs a single attribute lookup.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import time
+
+enabled = False #: True while measurements are being recorded.
+clock = time.time #: The function that instrumented code uses to read the time, in seconds.
+
+_counters = {} #: Running totals of arbitrary events, keyed by name.
+_phonemes = {} #: [occurrences, frames, samples] for every phoneme synthesized, keyed by IPA character.
+_stages = {} #: [calls, seconds] for every timed stage, keyed by name.
+
+def enable():
+	"""
+	Starts recording measurements, adding to any already recorded.
+	"""
+	global enabled
+	enabled = True
+	
+def disable():
+	"""
+	Stops recording measurements, keeping those already recorded.
+	"""
+	global enabled
+	enabled = False
+	
+def reset():
+	"""
+	Discards every measurement recorded so far.
+	"""
+	_counters.clear()
+	_phonemes.clear()
+	_stages.clear()
+	
+def count(name, amount=1):
+	"""
+	Adds to a running total.
+	
+	@type name: basestring
+	@param name: The name of the event being counted.
+	@type amount: int
+	@param amount: The number of events to add.
+	"""
+	_counters[name] = _counters.get(name, 0) + amount
+	
+def recordPhoneme(ipa_character, frames, samples):
+	"""
+	Records the output of one phoneme.
+	
+	@type ipa_character: unicode
+	@param ipa_character: The phoneme that was synthesized.
+	@type frames: int
+	@param frames: The number of parameter-sets the phoneme became.
+	@type samples: int
+	@param samples: The number of samples synthesized from those
+	    parameter-sets.
+	"""
+	totals = _phonemes.get(ipa_character)
+	if totals is None:
+		totals = _phonemes[ipa_character] = [0, 0, 0]
+	totals[0] += 1
+	totals[1] += frames
+	totals[2] += samples
+	
+def recordStage(name, seconds, calls=1):
+	"""
+	Records time spent in a stage of synthesis.
+	
+	@type name: basestring
+	@param name: The name of the stage.
+	@type seconds: float
+	@param seconds: The time spent, in seconds.
+	@type calls: int
+	@param calls: The number of times the stage ran in that time.
+	"""
+	totals = _stages.get(name)
+	if totals is None:
+		totals = _stages[name] = [0, 0.0]
+	totals[0] += calls
+	totals[1] += seconds
+	
+def getSnapshot():
+	"""
+	Provides a copy of every measurement recorded so far, suitable for
+	pickling, so that measurements made in worker processes can be combined
+	with L{merge}.
+	
+	@rtype: dict
+	@return: A dictionary with 'counters', 'phonemes', and 'stages' keys, each
+	    mapping names to the totals described in this module's attributes.
+	"""
+	return {
+	 'counters': dict(_counters),
+	 'phonemes': dict([(ipa_character, list(totals)) for (ipa_character, totals) in _phonemes.iteritems()]),
+	 'stages': dict([(name, list(totals)) for (name, totals) in _stages.iteritems()]),
+	}
+	
+def merge(snapshot):
+	"""
+	Adds measurements taken elsewhere to those recorded here.
+	
+	@type snapshot: dict
+	@param snapshot: Measurements, as returned by L{getSnapshot}.
+	"""
+	for (name, amount) in snapshot['counters'].iteritems():
+		count(name, amount)
+	for (ipa_character, (occurrences, frames, samples)) in snapshot['phonemes'].iteritems():
+		totals = _phonemes.get(ipa_character)
+		if totals is None:
+			totals = _phonemes[ipa_character] = [0, 0, 0]
+		totals[0] += occurrences
+		totals[1] += frames
+		totals[2] += samples
+	for (name, (calls, seconds)) in snapshot['stages'].iteritems():
+		recordStage(name, seconds, calls)
+		
+def getReport():
+	"""
+	Summarizes every measurement recorded so far as human-readable text.
+	
+	@rtype: unicode
+	@return: Tables of stages, by time spent; of counters, by name; and of
+	    phonemes, by samples produced.
+	"""
+	lines = [u"%-40s %10s %12s %14s" % (u"Stage", u"Calls", u"Seconds", u"Per call (ms)")]
+	for (name, (calls, seconds)) in sorted(_stages.iteritems(), key=lambda (name, totals): -totals[1]):
+		lines.append(u"%-40s %10i %12.4f %14.4f" % (name, calls, seconds, seconds * 1000.0 / max(calls, 1)))
+		
+	if _counters:
+		lines.append(u"")
+		lines.append(u"%-40s %10s" % (u"Counter", u"Total"))
+		for (name, amount) in sorted(_counters.iteritems()):
+			lines.append(u"%-40s %10i" % (name, amount))
+			
+	if _phonemes:
+		lines.append(u"")
+		lines.append(u"%-10s %12s %10s %12s %16s" % (u"Phoneme", u"Occurrences", u"Frames", u"Samples", u"Samples/phoneme"))
+		for (ipa_character, (occurrences, frames, samples)) in sorted(_phonemes.iteritems(), key=lambda (ipa_character, totals): -totals[2]):
+			lines.append(u"%-10s %12i %10i %12i %16.1f" % (ipa_character, occurrences, frames, samples, float(samples) / occurrences))
+	return u'\n'.join(lines)
+	
+def timed(name, function):
+	"""
+	Wraps a function so that every call to it is recorded as a stage.
+	
+	The wrapper always records, so it should only be substituted for the
+	original while instrumentation is enabled.
+	
+	@type name: basestring
+	@param name: The name of the stage.
+	@type function: callable
+	@param function: The function to be timed.
+	
+	@rtype: callable
+	@return: A function that accepts the same arguments as the original and
+	    returns the same result.
+	"""
+	def timedFunction(*arguments):
+		start = clock()
+		try:
+			return function(*arguments)
+		finally:
+			recordStage(name, clock() - start)
+	return timedFunction
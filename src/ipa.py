@@ -1178,11 +1178,11 @@ _IPA_MAPPING = {
 } #: A neatly organized dictionary to make it easier for linguists to alter parameters.
 
 #Reduce IPA data to efficient structures.
-LIQUIDS = tuple([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['liquid']]) #: A list of all liquid phonemes.
-NASALS = tuple([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['nasal']]) #: A list of all nasal phonemes.
-STOPS = tuple([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['stop']]) #: A list of all stop phonemes.
-VOICED = tuple([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['voice']]) #: A list of all voiced phonemes.
-VOWELS = tuple([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['vowel']]) #: A list of all vowel phonemes.
+LIQUIDS = frozenset([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['liquid']]) #: A set of all liquid phonemes.
+NASALS = frozenset([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['nasal']]) #: A set of all nasal phonemes.
+STOPS = frozenset([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['stop']]) #: A set of all stop phonemes.
+VOICED = frozenset([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['voice']]) #: A set of all voiced phonemes.
+VOWELS = frozenset([ipa_character for (ipa_character, details) in _IPA_MAPPING.iteritems() if details['vowel']]) #: A set of all vowel phonemes.
 IPA_PARAMETERS = {} #: A collection of synthesizing parameter tuples, keyed by corresponding IPA character.
 IPA_REGIONS = {} #: A collection of phoneme regions, keyed by corresponding IPA character.
 IPA_DATA = {} #: A collection of both parameters and regions, in a tuple, keyed by corresponding IPA character.
@@ -6,6 +6,36 @@ Purpose
 =======
  Applies language-specific transformation rules to phonemes.
  
+ Rulesets are provided by L{languages.getLanguage}; unless another is
+ requested, L{languages.DEFAULT_LANGUAGE} is used.
+ 
+ Rulesets that set CONTEXT_RULES to True provide rules that accept a
+ L{PhonemeContext} and the parameter-set being manipulated, built once per
+ phoneme and shared by every rule. Rules in any other ruleset accept the
+ original nineteen positional arguments, and are adapted to the same calling
+ convention when their ruleset is first used.
+ 
+ Rulesets may also provide RULE_TRIGGERS, a dictionary that maps rules to
+ the names of L{PhonemeContext} attributes that must all be true for the rule
+ to have any effect. Rules are only called for phonemes that satisfy their
+ triggers; the rules that apply to each combination of trigger values are
+ worked out once, then reused for every phoneme with the same combination.
+ Rules without triggers are always called.
+ 
+ Rulesets may provide WORD_PITCH_FUNCTIONS, a tuple of functions that accept
+ a L{PhonemeContext}, read only the attributes it shares with every other
+ phoneme in its word, and return an f0 multiplier that applies to the whole
+ word, after the multipliers returned by its rules.
+ 
+ Finally, rulesets may provide RULE_FEATURES, a dictionary that maps every
+ rule to a function that summarises, as a hashable value, everything the
+ rule reads from the context, including its triggers, beyond the word's own
+ phonemes and markup, or to None if it reads nothing else. Words with the
+ same phonemes, markup, and features are transformed identically, so callers
+ may reuse a word's parameter-sets wherever L{getWordFeatures} gives the same
+ summary. Words are never reused under rulesets that don't describe every
+ rule this way.
+ 
 Legal
 =====
  All code, unless otherwise indicated, is original, and subject to the
@@ -13,10 +43,178 @@ Legal
  
  (C) Neil Tallim, 2009
 """
-#Change the following line to use other language rulesets.
-import languages.english_canadian as language
+import instrumentation
+import ipa
+import languages
+
+language = languages.getLanguage() #: The default ruleset.
 
-def applyRules(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, parameters_list):
+_RULE_SETS = {} #: L{_RuleSet}s, keyed by the ruleset they were prepared from and whether they are timed.
+
+class PhonemeContext(object):
+	"""
+	Everything language rules know about the phoneme being processed.
+	
+	A context is built once per phoneme and shared by every rule applied to
+	it. Values derived from the phoneme's word are computed the first time a
+	rule asks for them, then reused by every other rule.
+	
+	The parameter-set attributes are updated by L{applyRules} before each
+	rule is called, so rules should read them from the context rather than
+	keep references to them.
+	"""
+	__slots__ = (
+	 'ipa_character', 'preceding_phonemes', 'following_phonemes',
+	 'word_position', 'remaining_words', 'previous_words', 'following_words',
+	 'sentence_position', 'remaining_sentences',
+	 'is_quoted', 'is_emphasized', 'is_content', 'is_question', 'is_exclamation',
+	 'follows_question_word',
+	 'previous_phoneme_parameters', 'remaining_phoneme_parameter_count',
+	 'previous_sound_parameters', 'following_sound_parameters',
+	 '_is_last_word', '_is_liquid', '_is_vowel', '_vowel_index', '_following_vowel_count', '_word',
+	)
+	
+	def __init__(self, ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word):
+		"""
+		Describes a phoneme in its word, sentence, and paragraph.
+		
+		@type ipa_character: unicode
+		@param ipa_character: The character, representative of a phoneme, being
+		    processed.
+		@type preceding_phonemes: sequence
+		@param preceding_phonemes: A collection of all phonemes, in order, that
+		    precede the current IPA character in the current word.
+		@type following_phonemes: sequence
+		@param following_phonemes: A collection of all phonemes, in order, that
+		    follow the current IPA character in the current word.
+		@type word_position: int
+		@param word_position: The current word's position in its sentence,
+		    indexed from 1.
+		@type remaining_words: int
+		@param remaining_words: The number of words remaining before the end of
+		    the sentence is reached, not including the current word.
+		@type previous_words: sequence
+		@param previous_words: A collection of all words that have been
+		    previously synthesized.
+		@type following_words: sequence
+		@param following_words: A collection of all words that have yet to be
+		    synthesized.
+		@type sentence_position: int
+		@param sentence_position: The current sentence's position in its
+		    paragraph, indexed from 1.
+		@type remaining_sentences: int
+		@param remaining_sentences: The number of sentences remaining before the
+		    end of the paragraph is reached, not including the current sentence.
+		@type is_quoted: bool
+		@param is_quoted: True if the current word is part of a quoted body.
+		@type is_emphasized: bool
+		@param is_emphasized: True if the current word is part of an emphasized
+		    body.
+		@type is_content: bool
+		@param is_content: True if the current word was marked as a content
+		    word.
+		@type is_question: bool
+		@param is_question: True if the current sentence ends with a question
+		    mark.
+		@type is_exclamation: bool
+		@param is_exclamation: True if the current sentence ends with an
+		    exclamation mark.
+		@type follows_question_word: bool
+		@param follows_question_word: True if any of C{previous_words} is one of
+		    the language's question-words, as listed by its C{QUESTION_WORDS}.
+		"""
+		self.ipa_character = ipa_character
+		self.preceding_phonemes = preceding_phonemes
+		self.following_phonemes = following_phonemes
+		self.word_position = word_position
+		self.remaining_words = remaining_words
+		self.previous_words = previous_words
+		self.following_words = following_words
+		self.sentence_position = sentence_position
+		self.remaining_sentences = remaining_sentences
+		self.is_quoted = is_quoted
+		self.is_emphasized = is_emphasized
+		self.is_content = is_content
+		self.is_question = is_question
+		self.is_exclamation = is_exclamation
+		self.follows_question_word = follows_question_word
+		
+		self.previous_phoneme_parameters = None #: A collection of all parameters that appear as part of this phoneme, prior to the parameter-set currently being manipulated.
+		self.remaining_phoneme_parameter_count = None #: The number of parameter-sets yet to be processed as part of this phoneme.
+		self.previous_sound_parameters = None #: A list of all parameter-sets introduced prior to the current parameter-set by language rules.
+		self.following_sound_parameters = None #: A list of all parameter-sets introduced after the current parameter-set by language rules.
+		
+		self._is_last_word = None
+		self._is_liquid = None
+		self._is_vowel = None
+		self._vowel_index = None
+		self._following_vowel_count = None
+		self._word = None
+		
+	@property
+	def is_last_word(self):
+		"""
+		True if the current word is the last in its sentence.
+		"""
+		if self._is_last_word is None:
+			self._is_last_word = self.remaining_words == 0
+		return self._is_last_word
+		
+	@property
+	def is_liquid(self):
+		"""
+		True if the current phoneme is a liquid.
+		"""
+		if self._is_liquid is None:
+			self._is_liquid = self.ipa_character in ipa.LIQUIDS
+		return self._is_liquid
+		
+	@property
+	def is_vowel(self):
+		"""
+		True if the current phoneme is a vowel.
+		"""
+		if self._is_vowel is None:
+			self._is_vowel = self.ipa_character in ipa.VOWELS
+		return self._is_vowel
+		
+	@property
+	def vowel_index(self):
+		"""
+		The number of vowels that precede the current phoneme in its word.
+		"""
+		if self._vowel_index is None:
+			vowels = ipa.VOWELS #Cache for speed.
+			self._vowel_index = len([p for p in self.preceding_phonemes if p in vowels])
+		return self._vowel_index
+		
+	@property
+	def following_vowel_count(self):
+		"""
+		The number of vowels that follow the current phoneme in its word.
+		"""
+		if self._following_vowel_count is None:
+			vowels = ipa.VOWELS #Cache for speed.
+			self._following_vowel_count = len([p for p in self.following_phonemes if p in vowels])
+		return self._following_vowel_count
+		
+	@property
+	def is_last_syllable(self):
+		"""
+		True if the current phoneme is the last vowel in its word.
+		"""
+		return self.is_vowel and not self.following_vowel_count
+		
+	@property
+	def word(self):
+		"""
+		The current word, as a string of IPA characters.
+		"""
+		if self._word is None:
+			self._word = u''.join(self.preceding_phonemes + [self.ipa_character] + self.following_phonemes)
+		return self._word
+		
+def applyRules(context, parameters_list, language=None):
 	"""
 	Iterates through all parameters that make up the current phoneme, applying
 	all applicable language-specific rules, in a specific order, to each
@@ -24,66 +222,45 @@ def applyRules(ipa_character, preceding_phonemes, following_phonemes, word_posit
 	
 	The input list of parameters is not altered by this function.
 	
-	@type ipa_character: unicode
-	@param ipa_character: The character, representative of a phoneme, being
-	    processed.
-	@type preceding_phonemes: sequence
-	@param preceding_phonemes: A collection of all phonemes, in order, that
-	    precede the current IPA character in the current word.
-	@type following_phonemes: sequence
-	@param following_phonemes: A collection of all phonemes, in order, that
-	    follow the current IPA character in the current word.
-	@type word_position: int
-	@param word_position: The current word's position in its sentence, indexed
-	    from 1.
-	@type remaining_words: int
-	@param remaining_words: The number of words remaining before the end of the
-	    sentence is reached, not including the current word.
-	@type previous_words: sequence
-	@param previous_words: A collection of all words that have been previously
-	    synthesized.
-	@type following_words: sequence
-	@param following_words: A collection of all words that have yet to be
-	    synthesized.
-	@type sentence_position: int
-	@param sentence_position: The current sentence's position in its paragraph,
-	    indexed from 1.
-	@type remaining_sentences: int
-	@param remaining_sentences: The number of sentences remaining before the end
-	    of the paragraph is reached, not including the current sentence.
-	@type is_quoted: bool
-	@param is_quoted: True if the current word is part of a quoted body.
-	@type is_emphasized: bool
-	@param is_emphasized: True if the current word is part of an emphasized body.
-	@type is_content: bool
-	@param is_content: True if the current word was marked as a content word.
-	@type is_question: bool
-	@param is_question: True if the current sentence ends with a question mark.
-	@type is_exclamation: bool
-	@param is_exclamation: True if the current sentence ends with an exclamation
-	    mark.
+	@type context: L{PhonemeContext}
+	@param context: The phoneme being processed, in its word, sentence, and
+	    paragraph.
 	@type parameters_list: list
 	@param parameters_list: A collection of all sounds currently associated with
 	    the phoneme being processed.
+	@type language: module|basestring|None
+	@param language: The ruleset to apply, as returned by
+	    L{languages.getLanguage}, or its name; if None, the default ruleset.
 	
 	@rtype: tuple(2)
 	@return: An updated list of parameters, consisting of transformations of
 	    the base sounds, plus anything added to the stream, and an equal-length
 	    collection of f0 multiplier values, with higher numbers meaning
 	    lower-pitched sounds.
-	"""
-	rule_functions = language.RULE_FUNCTIONS
 	
+	@raise ValueError: If the named ruleset does not exist.
+	"""
+	rule_set = _getRuleSet(language, instrumentation.enabled)
+	rule_functions = rule_set.getRuleFunctions(context)
+	if instrumentation.enabled:
+		parameter_set_count = len(parameters_list)
+		instrumentation.count('rule calls', len(rule_functions) * parameter_set_count)
+		instrumentation.count('rule calls avoided', (rule_set.rule_count - len(rule_functions)) * parameter_set_count)
+		
 	f0_multipliers = []
 	transformed_parameters = []
 	initial_parameter_count_zero = len(parameters_list) - 1
+	context.previous_phoneme_parameters = transformed_parameters
 	for (i, parameters) in enumerate(parameters_list): #Transforms each parameter-set in the input-list, in order.
 		parameters = parameters[:] #Make a local copy.
 		f0_multiplier = 1.0
 		preceding_parameters = []
 		following_parameters = []
+		context.remaining_phoneme_parameter_count = initial_parameter_count_zero - i
 		for function in rule_functions: #Applies each language rule, in order. New parameters lists appear on either side of the central parameter set.
-			(preceding_params, following_params, multiplier) = function(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, transformed_parameters, initial_parameter_count_zero - i, preceding_parameters, following_parameters, parameters)
+			context.previous_sound_parameters = preceding_parameters
+			context.following_sound_parameters = following_parameters
+			(preceding_params, following_params, multiplier) = function(context, parameters)
 			f0_multiplier *= multiplier
 			preceding_parameters = preceding_parameters + preceding_params
 			following_parameters = following_params + following_parameters
@@ -92,4 +269,177 @@ def applyRules(ipa_character, preceding_phonemes, following_phonemes, word_posit
 		transformed_parameters += preceding_parameters + [parameters] + following_parameters
 		f0_multipliers += [f0_multiplier] * (len(preceding_parameters) + 1 + len(following_parameters))
 	return (transformed_parameters, f0_multipliers)
-	
\ No newline at end of file
+	
+def getWordFeatures(context, language=None):
+	"""
+	Summarises everything a ruleset's rules read about a word, beyond its
+	phonemes and markup, as described by the ruleset's RULE_FEATURES.
+	
+	@type context: L{PhonemeContext}
+	@param context: A context that describes the word; its phoneme-specific
+	    attributes are not read.
+	@type language: module|basestring|None
+	@param language: The ruleset to consult, as returned by
+	    L{languages.getLanguage}, or its name; if None, the default ruleset.
+	
+	@rtype: tuple|None
+	@return: A hashable summary of the word's context, or None if the
+	    ruleset's rules don't describe what they read.
+	
+	@raise ValueError: If the named ruleset does not exist.
+	"""
+	return _getRuleSet(language, False).getWordFeatures(context)
+	
+def getWordMultiplier(context, language=None):
+	"""
+	Computes the f0 multiplier that a ruleset's WORD_PITCH_FUNCTIONS apply to
+	every parameter-set of a word.
+	
+	@type context: L{PhonemeContext}
+	@param context: A context that describes the word; its phoneme-specific
+	    attributes are not read.
+	@type language: module|basestring|None
+	@param language: The ruleset to consult, as returned by
+	    L{languages.getLanguage}, or its name; if None, the default ruleset.
+	
+	@rtype: float
+	@return: The product of every word-pitch function's multiplier, in order.
+	
+	@raise ValueError: If the named ruleset does not exist.
+	"""
+	f0_multiplier = 1.0
+	for function in _getRuleSet(language, instrumentation.enabled).word_pitch_functions:
+		f0_multiplier *= function(context)
+	return f0_multiplier
+	
+def _adaptLegacyRule(function):
+	"""
+	Wraps a rule that accepts the original nineteen positional arguments so
+	that it can be called with a L{PhonemeContext} and a parameter-set.
+	
+	@type function: callable
+	@param function: The rule to be adapted.
+	
+	@rtype: callable
+	@return: A function that accepts a L{PhonemeContext} and a parameter-set,
+	    and returns whatever the original rule returns.
+	"""
+	def adaptedRule(context, parameters):
+		return function(context.ipa_character, context.preceding_phonemes, context.following_phonemes, context.word_position, context.remaining_words, context.previous_words, context.following_words, context.sentence_position, context.remaining_sentences, context.is_quoted, context.is_emphasized, context.is_content, context.is_question, context.is_exclamation, context.previous_phoneme_parameters, context.remaining_phoneme_parameter_count, context.previous_sound_parameters, context.following_sound_parameters, parameters)
+	adaptedRule.__name__ = function.__name__
+	return adaptedRule
+	
+def _getRuleSet(language, timed):
+	"""
+	Provides a language's rules, ready to accept a L{PhonemeContext} and a
+	parameter-set.
+	
+	@type language: module|basestring|None
+	@param language: The ruleset whose rules are needed, as returned by
+	    L{languages.getLanguage}, or its name; if None, the default ruleset.
+	@type timed: bool
+	@param timed: True if each rule should record the time spent in it, as a
+	    stage named after the rule.
+	
+	@rtype: L{_RuleSet}
+	@return: The language's rules, with their triggers and features.
+	
+	@raise ValueError: If the named ruleset does not exist.
+	"""
+	if language is None:
+		language = languages.getLanguage()
+	elif isinstance(language, basestring):
+		language = languages.getLanguage(language)
+	key = (language, timed)
+	rule_set = _RULE_SETS.get(key)
+	if rule_set is None:
+		rule_functions = language.RULE_FUNCTIONS
+		rule_triggers = getattr(language, 'RULE_TRIGGERS', {})
+		triggers = [rule_triggers.get(function, ()) for function in rule_functions]
+		
+		feature_functions = None
+		rule_features = getattr(language, 'RULE_FEATURES', {})
+		if not [function for function in rule_functions if not function in rule_features]:
+			feature_functions = tuple([rule_features[function] for function in rule_functions if rule_features[function] is not None])
+			
+		word_pitch_functions = getattr(language, 'WORD_PITCH_FUNCTIONS', ())
+		if not getattr(language, 'CONTEXT_RULES', False):
+			rule_functions = [_adaptLegacyRule(function) for function in rule_functions]
+		if timed:
+			rule_functions = [instrumentation.timed('rule %s' % (function.__name__), function) for function in rule_functions]
+			word_pitch_functions = [instrumentation.timed('rule %s' % (function.__name__), function) for function in word_pitch_functions]
+		rule_set = _RULE_SETS[key] = _RuleSet(zip(rule_functions, triggers), feature_functions, word_pitch_functions)
+	return rule_set
+	
+class _RuleSet(object):
+	"""
+	A language's rules, in order, along with the conditions under which each
+	one applies.
+	"""
+	rule_count = None #: The number of rules in the set.
+	word_pitch_functions = None #: The functions that compute each word's f0 multiplier, in order.
+	_feature_functions = None #: The functions that summarise what the rules read about each word, or None if the rules don't describe that.
+	_trigger_names = None #: The name of every L{PhonemeContext} attribute used as a trigger, in a fixed order.
+	_rules = None #: (function, trigger indexes) for every rule, in order, with the indexes referring to L{_trigger_names}.
+	_dispatch_lists = None #: The rule functions that apply to phonemes with each combination of trigger values, keyed by those values.
+	
+	def __init__(self, rules, feature_functions, word_pitch_functions):
+		"""
+		Prepares a collection of rules for dispatch.
+		
+		@type rules: sequence
+		@param rules: (function, triggers) for every rule, in order, where each
+		    function accepts a L{PhonemeContext} and a parameter-set, and
+		    triggers is a collection of names of L{PhonemeContext} attributes
+		    that must all be true for the function to be called.
+		@type feature_functions: sequence|None
+		@param feature_functions: The functions that summarise what the rules
+		    read about each word, or None if the rules don't describe that.
+		@type word_pitch_functions: sequence
+		@param word_pitch_functions: The functions that compute each word's f0
+		    multiplier, in order.
+		"""
+		trigger_names = sorted(set([name for (function, triggers) in rules for name in triggers]))
+		self.rule_count = len(rules)
+		self._trigger_names = tuple(trigger_names)
+		self._rules = tuple([(function, tuple([trigger_names.index(name) for name in triggers])) for (function, triggers) in rules])
+		self._dispatch_lists = {}
+		self._feature_functions = feature_functions
+		self.word_pitch_functions = tuple(word_pitch_functions)
+		
+	def getRuleFunctions(self, context):
+		"""
+		Provides the rule functions that apply to a phoneme.
+		
+		@type context: L{PhonemeContext}
+		@param context: The phoneme being processed.
+		
+		@rtype: tuple
+		@return: The functions whose triggers are all true for the phoneme, in
+		    the order in which they must be called.
+		"""
+		values = tuple([bool(getattr(context, name)) for name in self._trigger_names])
+		rule_functions = self._dispatch_lists.get(values)
+		if rule_functions is None:
+			rule_functions = self._dispatch_lists[values] = tuple([
+			 function for (function, trigger_indexes) in self._rules if all([values[i] for i in trigger_indexes])
+			])
+		return rule_functions
+		
+	def getWordFeatures(self, context):
+		"""
+		Summarises everything the rules read about a word, beyond its phonemes
+		and markup.
+		
+		@type context: L{PhonemeContext}
+		@param context: A context that describes the word.
+		
+		@rtype: tuple|None
+		@return: The value of every rule's feature function, in order, or None
+		    if the rules don't describe what they read.
+		"""
+		if self._feature_functions is None:
+			return None
+		return tuple([function(context) for function in self._feature_functions])
+		
+		
\ No newline at end of file
@@ -4,4 +4,52 @@ CPSC 599 package: src.languages
 Purpose
 =======
  Provides a centralised location for language rulesets.
+ 
+ Every module in this package that does not begin with an underscore is a
+ ruleset, providing a NAME and a RULE_FUNCTIONS tuple, and optionally
+ CONTEXT_RULES, as described in L{src.language_rules}. Rulesets are found by
+ name, and only imported the first time they are requested, after which the
+ loaded module is reused, so a single process can render any number of
+ languages without reloading anything.
 """
+import os
+import pkgutil
+
+DEFAULT_LANGUAGE = 'english_canadian' #: The name of the ruleset used when no other is requested.
+
+_languages = {} #: Every ruleset loaded so far, keyed by module name.
+
+def getLanguage(name=None):
+	"""
+	Provides a language ruleset, loading it if this is the first request.
+	
+	@type name: basestring|None
+	@param name: The name of the ruleset's module, like 'english_canadian'; if
+	    None, L{DEFAULT_LANGUAGE} is used.
+	
+	@rtype: module
+	@return: The ruleset's module, providing NAME and RULE_FUNCTIONS.
+	
+	@raise ValueError: If no ruleset exists with the given name.
+	"""
+	if name is None:
+		name = DEFAULT_LANGUAGE
+	language = _languages.get(name)
+	if language is None:
+		if not name in getLanguageNames():
+			raise ValueError("Unknown language '%s'; available languages: %s." % (name, ', '.join(getLanguageNames())))
+		language = _languages[name] = __import__('%s.%s' % (__name__, name), fromlist=[name])
+	return language
+	
+def getLanguageNames():
+	"""
+	Lists the rulesets available in this package, without loading any of them.
+	
+	@rtype: list
+	@return: The names of every ruleset's module, sorted.
+	"""
+	return sorted([
+	 name for (loader, name, is_package) in pkgutil.iter_modules([os.path.dirname(__file__)])
+	 if not is_package and not name.startswith('_')
+	])
+	
\ No newline at end of file
@@ -14,44 +14,9 @@ Usage
 =====
  All functions declared in this module for external iteration must have the
  following input signature:
-  - B{C{ipa_character}} (unicode) - The character, representative of a phoneme,
-    being processed.
-  - B{C{preceding_phonemes}} (sequence) - A collection of all phonemes, in order,
-    that precede the current IPA character in the current word.
-  - B{C{following_phonemes}} (sequence) - A collection of all phonemes, in order,
-    that follow the current IPA character in the current word.
-  - B{C{word_position}} (int) - The current word's position in its sentence,
-    indexed from 1.
-  - B{C{remaining_words}} (int) - The number of words remaining before the end of
-    the sentence is reached, not including the current word.
-  - B{C{previous_words}} (sequence) - A collection of all words that have been
-    previously synthesized.
-  - B{C{following_words}} (sequence) - A collection of all words that have yet to
-    be synthesized.
-  - B{C{sentence_position}} (int) - The current sentence's position in its
-    paragraph, indexed from 1.
-  - B{C{remaining_sentences}} (int) - The number of sentences remaining before
-    the end of the paragraph is reached, not including the current sentence.
-  - B{C{is_quoted}} (bool) - True if the current word is part of a quoted body.
-  - B{C{is_emphasized}} (bool) - True if the current word is part of an
-    emphasized body.
-  - B{C{is_content}} (bool) - True if the current word was marked as a content
-    word.
-  - B{C{is_question}} (bool) - True if the current sentence ends with a question
-    mark.
-  - B{C{is_exclamation}} (bool) - True if the current sentence ends with an
-    exclamation mark.
-  - B{C{previous_phoneme_parameters}} (list) - A collection of all parameters that
-    appear as part of this phoneme, prior to the parameter-set currently being
-    manipulated.
-  - B{C{remaining_phoneme_parameter_count}} (int) - The number of parameter-sets
-    yet to be processed as part of this phoneme.
-  - B{C{previous_sound_parameters}} (list) - A list of all preceding
-    parameter-sets introduced prior to the current paramter-set by language
-    rules.
-  - B{C{following_sound_parameters}} (list) - A list of all preceding
-    parameter-sets introduced after to the current paramter-set by language
-    rules.
+  - B{C{context}} (L{src.language_rules.PhonemeContext}) - The phoneme being
+    processed, in its word, sentence, and paragraph, along with the
+    parameter-sets that surround the current one.
   - B{C{parameters}} (list(33)) - A collection of parameters associated with the
     sound currently being procesed.
  
@@ -64,6 +29,15 @@ Usage
  To enable use of a function you have defined, you must add a reference to the
  RULE_FUNCTIONS tuple, found at the end of this file. 
  
+ If a function can only have an effect when certain attributes of its context
+ are true, list them in RULE_TRIGGERS, also found at the end of this file, so
+ that it isn't called for phonemes it would leave untouched.
+ 
+ Functions that only change the pitch of whole words belong in
+ WORD_PITCH_FUNCTIONS instead; they accept only a context and return an f0
+ multiplier. Every other function must be described in RULE_FEATURES, so that
+ words can be reused wherever everything the functions read is the same.
+ 
 Legal
 =====
  All code, unless otherwise indicated, is original, and subject to the
@@ -71,50 +45,54 @@ Legal
  
  (C) Neil Tallim, Sydni Bennie, 2009
 """
+import operator
+
 import src.ipa as ipa
 
 NAME = "Canadian English"
+CONTEXT_RULES = True #: Rules accept a L{src.language_rules.PhonemeContext} and a parameter-set.
 
-_QUESTION_WORDS = (u'hæw', u'hu', u'hum', u'\u028d\u025b\u0279', u'\u028d\u0259t', u'\u028d\u025bn' u'\u028d\u028cj') #: A collection of known question-words. (Unicode-values: where, what, when, why)
+QUESTION_WORDS = frozenset((u'hæw', u'hu', u'hum', u'\u028d\u025b\u0279', u'\u028d\u0259t', u'\u028d\u025bn' u'\u028d\u028cj')) #: A collection of known question-words, noted by transformation as each sentence is read. (Unicode-values: where, what, when, why)
 
-def _amplifyContent(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _amplifyContent(context, parameters):
 	"""
 	Increases the emphasis placed on a word identified as content-bearing in a
 	sentence.
 	
 	@author: Sydni Bennie
 	"""
-	if is_content and not ipa_character == u'\u0259':
+	if context.is_content and not context.ipa_character == u'\u0259':
 		parameters[5] *= 1.25 #Boost f1.
-		if ipa_character in ipa.VOWELS:
+		if context.is_vowel:
 			parameters[32] *= 1.1 #Increase duration, just a little.
 			return ([], [], 0.95) #Increase pitch, just a little.
 	return ([], [], 1.0)
 	
-def _degradePitch(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _degradePitch(context):
 	"""
 	Lowers the pitch exponentially over the course of a spoken sentence.
 	
 	@author: Sydni Bennie
 	"""
-	if not is_question:
-		decay_ratio = 1.0 - (0.05 / (word_position + remaining_words))
-		return ([], [], 1.0 / (decay_ratio ** word_position))
-	return ([], [], 1.0)
+	if not context.is_question:
+		word_position = context.word_position
+		decay_ratio = 1.0 - (0.05 / (word_position + context.remaining_words))
+		return 1.0 / (decay_ratio ** word_position)
+	return 1.0
 	
-def _emphasizeSpeech(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _emphasizeSpeech(context, parameters):
 	"""
 	Raises the pitch and volume of bolded speech while lengthening its duration.
 	
 	@author: Sydni Bennie
 	"""
-	if is_emphasized and ipa_character not in ipa.STOPS:
+	if context.is_emphasized and context.ipa_character not in ipa.STOPS:
 		parameters[27] += 5 #Boost bypass gain.
 		parameters[32] *= 1.1 #Increase duration.
 		return ([], [], 0.95) #Increase pitch, sligthly.
 	return ([], [], 1.0)
 	
-def _exclaim(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _exclaim(context, parameters):
 	"""
 	Slightly decreases the duration of phonemes and increases amplitude.
 	
@@ -122,7 +100,7 @@ def _exclaim(ipa_character, preceding_phonemes, following_phonemes, word_positio
 	
 	@author: Sydni Bennie
 	"""
-	if is_exclamation:
+	if context.is_exclamation:
 		#Increase bandwidths 1-3.
 		parameters[16] *= 1.1
 		parameters[17] *= 1.1
@@ -134,82 +112,98 @@ def _exclaim(ipa_character, preceding_phonemes, following_phonemes, word_positio
 		
 		parameters[32] *= 0.95 #Decrease duration.
 		
-		if is_question:
+		if context.is_question:
 			return ([], [], 0.95) #Increase pitch.
-		elif ipa_character in ipa.VOWELS and not [c for c in following_phonemes if c in ipa.VOWELS]: #Last syllable.
+		elif context.is_last_syllable:
 			parameters[32] *= 1.35 #Increase duration
 			return ([], [], 0.95) #Increase pitch.
 			
 	return ([], [], 0.975) #Increase pitch, sligthly.
 	
-def _inflectQuestionPitch(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _inflectQuestionPitch(context, parameters):
 	"""
 	Changes the pitch at the end of a question-sentence, rising in most cases,
 	and falling in the case of a 'wh' question.
 	
 	@author: Sydni Bennie
 	"""
-	if is_question and not ipa_character == u'\u0259' and ipa_character in ipa.VOWELS: #No schwas allowed.
+	if context.is_question and not context.ipa_character == u'\u0259' and context.is_vowel: #No schwas allowed.
+		remaining_words = context.remaining_words
 		if remaining_words <= 2: #Ignore questions and early positions in sentences.
-			if previous_words and [p_w for p_w in previous_words if p_w in _QUESTION_WORDS]:
-				if remaining_words == 2 and following_words[0] == u'\u028c': #Also a wedge. Time backwards-goes.
+			if context.follows_question_word:
+				if remaining_words == 2 and context.following_words[0] == u'\u028c': #Also a wedge. Time backwards-goes.
 					return ([], [], 0.7)  #Raise pitch on the second-last word.
-				elif remaining_words == 1 and not following_phonemes and not preceding_phonemes and not ipa_character == u'\u028c': #Wedge.
+				elif remaining_words == 1 and not context.following_phonemes and not context.preceding_phonemes and not context.ipa_character == u'\u028c': #Wedge.
 					return ([], [], 0.8) #Raise pitch on the second-last word.
 				return ([], [], 0.9) #Raise pitch very slightly on the last word.
 				
 		if remaining_words == 0:
-			position = len([p for p in preceding_phonemes if p in ipa.VOWELS])
-			rise_ratio = 1.0 - (0.11 / (position + len([p for p in following_phonemes if p in ipa.VOWELS]) + 1))
+			position = context.vowel_index
+			rise_ratio = 1.0 - (0.11 / (position + context.following_vowel_count + 1))
 			return ([], [], (-0.05 + rise_ratio ** position))
 			
-		word = u''.join(preceding_phonemes + [ipa_character] + following_phonemes)
-		if word in _QUESTION_WORDS and not [p_w for p_w in previous_words if p_w in _QUESTION_WORDS]:
+		if not context.follows_question_word and context.word in QUESTION_WORDS:
 			return ([], [], 0.9) #Increase pitch.
 	return ([], [], 1.0)
 	
-def _lengthenTerminal(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _inflectQuestionPitchFeatures(context):
+	"""
+	Summarises everything L{_inflectQuestionPitch} reads about a word, beyond
+	its phonemes: only the last few words of a question matter.
+	"""
+	if not context.is_question:
+		return None
+	remaining_words = context.remaining_words
+	return (
+	 min(remaining_words, 3),
+	 context.follows_question_word,
+	 remaining_words == 2 and context.following_words[0] == u'\u028c',
+	)
+	
+def _lengthenTerminal(context, parameters):
 	"""
 	Lengthens the duration of each vowel in the final word of a sentence.
 	
 	@author: Sydni Bennie
 	"""
-	if remaining_words == 0 and not ipa_character == u'\u0259' and ipa_character in ipa.VOWELS:
+	if context.is_last_word and not context.ipa_character == u'\u0259' and context.is_vowel:
 		parameters[32] *= 1.5 #Increase duration.
 	return ([], [], 1.0)
 	
-def _liquidateVowels(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _liquidateVowels(context, parameters):
 	"""
 	Extends the sound of a liquid when it is immediately followed by a vowel.
 	
 	@author: Sydni Bennie
 	"""
-	if remaining_phoneme_parameter_count == 0 and following_phonemes and ipa_character in ipa.LIQUIDS and following_phonemes[0] in ipa.VOWELS:
+	following_phonemes = context.following_phonemes
+	if context.remaining_phoneme_parameter_count == 0 and following_phonemes and context.ipa_character in ipa.LIQUIDS and following_phonemes[0] in ipa.VOWELS:
 		vowel_values = ipa.IPA_PARAMETERS[following_phonemes[0]]
 		values = zip(parameters[:32], vowel_values[:32])
 		return ([], [[(l + v * 2) / 3 for (l, v) in values] + [int(vowel_values[32] * 0.25)]], 1.0) #Compensate for universal blending; add 50% of both sounds for 25% of the vowel's length.
 	return ([], [], 1.0)
 	
-def _quoteSpeech(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _quoteSpeech(context, parameters):
 	"""
 	Raises the pitch and volume of quoted speech while shortening its duration.
 	
 	@author: Sydni Bennie
 	"""
-	if is_quoted:
+	if context.is_quoted:
 		parameters[27] += 5 #Boost bypass gain.
 		parameters[32] *= 0.925 #Reduce duration.
 		return ([], [], 0.975) #Increase pitch.
 	return ([], [], 1.0)
 	
-def _shortenDipthong(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, previous_phoneme_parameters, remaining_phoneme_parameter_count, previous_sound_parameters, following_sound_parameters, parameters):
+def _shortenDipthong(context, parameters):
 	"""
 	Reduces the length of a vowel that immediately follows another vowel in a
 	word.
 	
 	@author: Sydni Bennie
 	"""
-	if preceding_phonemes and ipa_character in ipa.VOWELS and preceding_phonemes[-1] in ipa.VOWELS:
+	preceding_phonemes = context.preceding_phonemes
+	if preceding_phonemes and context.is_vowel and preceding_phonemes[-1] in ipa.VOWELS:
 		parameters[32] *= 0.5 #Reduce duration.
 	return ([], [], 1.0)
 	
@@ -220,8 +214,32 @@ RULE_FUNCTIONS = (
  _amplifyContent,
  _emphasizeSpeech,
  _quoteSpeech,
- _degradePitch,
  _lengthenTerminal,
  _shortenDipthong,
  _exclaim,
-) #: A collection of all functions to call, in order, to apply this language's rules. 
+) #: A collection of all functions to call, in order, to apply this language's rules.
+
+RULE_TRIGGERS = {
+ _amplifyContent: ('is_content',),
+ _emphasizeSpeech: ('is_emphasized',),
+ _inflectQuestionPitch: ('is_question', 'is_vowel'),
+ _lengthenTerminal: ('is_vowel',),
+ _liquidateVowels: ('is_liquid',),
+ _quoteSpeech: ('is_quoted',),
+ _shortenDipthong: ('is_vowel',),
+} #: The context attributes that must all be true for each function to have any effect; functions not listed are always called.
+
+RULE_FEATURES = {
+ _amplifyContent: None,
+ _emphasizeSpeech: None,
+ _exclaim: operator.attrgetter('is_exclamation', 'is_question'),
+ _inflectQuestionPitch: _inflectQuestionPitchFeatures,
+ _lengthenTerminal: operator.attrgetter('is_last_word'),
+ _liquidateVowels: None,
+ _quoteSpeech: None,
+ _shortenDipthong: None,
+} #: Functions that summarise what each function reads about its word, beyond the word's phonemes and markup; None if it reads nothing more.
+
+WORD_PITCH_FUNCTIONS = (
+ _degradePitch,
+) #: A collection of all functions to call, in order, to compute the f0 multiplier of each word. 
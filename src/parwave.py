@@ -17,11 +17,21 @@ Legal
  
  (C) Neil Tallim, Sydni Bennie, 2009
 """
+import array
+import collections
 import math
 import random
+import zlib
 
-FREQUENCY = 10 #: A number that indicates the frequency of synthesized speech, as a multiple of 1000Hz.
-_F0_HZ = 80 #: The core rate at which sounds will repeat, controlling pitch.
+try:
+	import numpy
+except ImportError: #NumPy is only needed for block rendering.
+	numpy = None
+
+FREQUENCY = 10 #: A number that indicates the default frequency of synthesized speech, as a multiple of 1000Hz.
+SAMPLE_RATE = FREQUENCY * 1000 #: The default number of samples synthesized per second.
+_F0_HZ = 80 #: The core rate at which sounds will repeat, controlling pitch, in samples at L{SAMPLE_RATE}.
+_WAVETABLE_COUNT = 4096 #: The number of single-period wavetables each synthesizer keeps for turbo mode.
 
 class Synthesizer(object):
 	"""
@@ -34,13 +44,77 @@ class Synthesizer(object):
 	_glottal_sine_resonator = None #: A resonator for glottal sine frequencies.
 	_nasal_antiresonator = None #: An anti-resonator for nasal frequencies.
 	_nasal_pole_resonator = None #: A resonator for nasal pole frequencies.
+	_cache = None #: The L{RenderCache} that stores sounds this synthesizer has rendered, if any.
+	_continuous = False #: True if resonator state carries over from one sound to the next.
+	_last_result = 0.0 #: The last value computed before differencing, carried over in continuous mode.
 	_noise = 0.0 #: The last-generated random noise value, needed for echoing.
+	_noise_seed = None #: The seed with which this synthesizer was created, from which the noise in cached sounds is derived.
+	_noise_source = None #: The L{NoiseSource} that supplies random values for noise.
 	_parallel_resonators = None #: A collection of resonators to handle formants 2-6 in parallel.
+	_period_index = None #: The number of samples since the last f0 pulse, carried over in continuous mode; None if a pulse is due.
+	_f0_samples = float(_F0_HZ) #: The core f0 period, in samples at this synthesizer's rate.
+	_noise_scale = 1.0 #: The factor applied to noise, so its random walk covers the same range per second at any rate.
+	_output_scale = 32767.0 #: The factor that converts differenced results to the scale of 16-bit samples, allowing for the sampling period and gain.
+	_pulse_amplitude = 1.0 #: The height of each f0 pulse, so its area per second is the same at any rate.
+	_samples_per_ms = float(FREQUENCY) #: The number of samples synthesized per millisecond.
+	sample_rate = SAMPLE_RATE #: The number of samples this synthesizer produces per second.
+	samples_computed = 0 #: The number of samples this synthesizer has computed, including discarded ones.
+	samples_discarded = 0 #: The number of computed samples thrown away to avoid popping.
+	wavetable_hits = 0 #: The number of turbo-mode sounds tiled from a wavetable that had already been rendered.
+	wavetable_misses = 0 #: The number of turbo-mode sounds whose wavetable had to be rendered.
+	_wavetables = None #: Single periods of rendered sound, keyed by their parameters and f0 period, in order of use, for turbo mode.
 	
-	def __init__(self):
+	def __init__(self, cache=None, seed=None, continuous=False, sample_rate=SAMPLE_RATE, gain=1.0):
 		"""
 		Prepares all resonator objects needed by this synthesizer.
+		
+		@type cache: L{RenderCache}|None
+		@param cache: A cache in which rendered sounds will be kept, so that
+		    identical parameter-sets need only be rendered once. Since a cached
+		    sound must not depend on what was rendered before it, each one's noise
+		    is generated from a seed derived from its cache key, rather than
+		    echoing the noise of the preceding sound.
+		@type seed: hashable|None
+		@param seed: The seed from which noise is generated; if None, noise will
+		    differ each time this synthesizer is created.
+		@type continuous: bool
+		@param continuous: If set, resonators, the f0 pulse and noise carry their
+		    state from each sound into the next, only changing co-efficients, so
+		    there are no initial clicks and no need to render and discard an extra
+		    period at the start of every sound.
+		@type sample_rate: int
+		@param sample_rate: The number of samples to synthesize per second.
+		    Resonator co-efficients and the f0 period are scaled to match, so
+		    pitch and formants are unaffected; formants at or above the Nyquist
+		    frequency, half of the rate, are left out.
+		@type gain: float
+		@param gain: The factor by which every sample is multiplied. It costs
+		    nothing, since it is folded into the scaling every sample undergoes;
+		    samples pushed beyond the 16-bit range are clipped only when they are
+		    quantized, by L{waveform.encodeSamples}.
+		
+		@raise ValueError: If both a cache and continuous mode are requested,
+		    since continuous sounds depend on everything rendered before them, or
+		    if the sample rate is not positive.
 		"""
+		if cache is not None and continuous:
+			raise ValueError("A render cache cannot be used with continuous resonator state.")
+		if sample_rate <= 0:
+			raise ValueError("The sample rate must be positive, not %r." % (sample_rate))
+		self._cache = cache
+		self._continuous = continuous
+		self.sample_rate = sample_rate
+		self._samples_per_ms = sample_rate / 1000.0
+		self._f0_samples = _F0_HZ * sample_rate / float(SAMPLE_RATE)
+		
+		#Keep the output level close to that at the default rate.
+		rate_ratio = sample_rate / float(SAMPLE_RATE)
+		self._pulse_amplitude = rate_ratio
+		self._noise_scale = rate_ratio ** 0.5
+		self._output_scale = 32767.0 * rate_ratio * gain
+		self._noise_seed = seed
+		self._noise_source = NoiseSource(seed)
+		self._wavetables = collections.OrderedDict()
 		self._cascade_resonators = (
 		 _Resonator(),
 		 _Resonator(),
@@ -62,6 +136,15 @@ class Synthesizer(object):
 		self._nasal_antiresonator = _AntiResonator()
 		self._nasal_pole_resonator = _Resonator()
 		
+	def getCache(self):
+		"""
+		Provides access to this synthesizer's render cache.
+		
+		@rtype: L{RenderCache}|None
+		@return: The cache in which rendered sounds are kept, if any.
+		"""
+		return self._cache
+		
 	def generateSilence(self, milliseconds):
 		"""
 		Generates a period of silence and resets the noise value.
@@ -70,11 +153,43 @@ class Synthesizer(object):
 		@param milliseconds: The number of milliseconds of silence to be
 		    generated.
 		
-		@rtype: tuple
-		@return: A collection of 0s, equal in length to milliseconds * 10.
+		@rtype: array.array
+		@return: A collection of 0.0s, one for every sample in the given number of
+		    milliseconds at this synthesizer's rate.
+		"""
+		self._noise = 0.0
+		self.resetState() #Anything still echoing would have died out.
+		return array.array('f', (0.0,)) * int(milliseconds * self._samples_per_ms)
+		
+	def resetState(self):
+		"""
+		Discards the resonator, f0 pulse, and differencing state carried from
+		each sound into the next in continuous mode, so that the next sound
+		starts as cleanly as the first; otherwise, there is nothing to discard.
+		"""
+		if self._continuous:
+			for resonator in self._cascade_resonators + self._parallel_resonators + (
+			 self._glottal_antiresonator, self._glottal_pole_resonator, self._glottal_sine_resonator,
+			 self._nasal_antiresonator, self._nasal_pole_resonator
+			):
+				resonator.clear()
+			self._period_index = None
+			self._last_result = 0.0
+			
+		
+	def seedNoise(self, seed):
+		"""
+		Restarts noise generation from the given seed, and resets the noise
+		value, so that everything rendered afterwards is reproducible regardless
+		of what was rendered before.
+		
+		Sounds kept in the render cache are unaffected.
+		
+		@type seed: hashable|None
+		@param seed: The seed from which noise will be generated.
 		"""
+		self._noise_source = NoiseSource(seed)
 		self._noise = 0.0
-		return (0,) * int(milliseconds * FREQUENCY)
 		
 	def synthesize(self, parameters, f0_multiplier, turbo):
 		"""
@@ -83,6 +198,9 @@ class Synthesizer(object):
 		amplitude being a function of bandwidth, base amplitude values, white
 		noise, and resonance.
 		
+		If this synthesizer has a cache, sounds that have already been rendered
+		are returned from it, and so must not be modified.
+		
 		@type parameters: sequence(33)
 		@param parameters: A collection of synthesis parameters, as described in
 		    L{ipa.IPA_PARAMETERS} and L{ipa.IPA_DATA}.
@@ -90,15 +208,129 @@ class Synthesizer(object):
 		@param f0_multiplier: A modifier to apply to the f0 period. Larger vowels
 		    mean slower pitch.
 		@type turbo: bool
-		@param turbo: If set, repeats a single period's synthesized values for the
-		    entire duration of the sound, sacrificing subtle quality for speed.
+		@param turbo: If set, a single period is rendered for each distinct
+		    parameter-set and pitch, then repeated for the entire duration of the
+		    sound, sacrificing subtle quality, most noticeably in noise, for
+		    speed.
+		
+		@rtype: array.array
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
+		"""
+		samples_target = int(parameters[-1] * self._samples_per_ms)
+		if turbo:
+			return self._tileWavetable(self._getWavetable(parameters, f0_multiplier), samples_target)
+			
+		cache = self._cache
+		if cache is None:
+			return self._render(parameters, f0_multiplier, samples_target)
+			
+		key = (tuple([float(p) for p in parameters]), float(f0_multiplier), self._noise_seed)
+		sounds = cache.get(key)
+		if sounds is None:
+			sounds = self._renderIndependently(parameters, f0_multiplier, samples_target, key)
+			cache.put(key, sounds)
+		return sounds
 		
-		@rtype: tuple
-		@return: A collection of integers between -32768 and 32767 that represent
-		    synthetic speech.
+	def _getWavetable(self, parameters, f0_multiplier):
+		"""
+		Provides a single period of the sound described by the given parameters,
+		rendering it only if it isn't among those most recently used.
+		
+		Wavetables are rendered from a reset state, with noise derived from
+		their parameters, so each one is the same no matter what was rendered
+		before it, even in continuous mode.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters; the duration is
+		    ignored.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		
+		@rtype: array.array
+		@return: One f0 period of synthetic speech, which must not be modified.
+		"""
+		f0_hz = int(self._f0_samples * f0_multiplier)
+		key = (tuple([float(p) for p in parameters[:-1]]), f0_hz, self._noise_seed)
+		wavetables = self._wavetables #Cache for speed.
+		wavetable = wavetables.pop(key, None)
+		if wavetable is None:
+			self.wavetable_misses += 1
+			continuous = self._continuous
+			self._continuous = False #Discard a period, so the wavetable begins and ends mid-sound.
+			try:
+				wavetable = self._renderIndependently(parameters, f0_multiplier, f0_hz + 1, key) #Pulses recur every f0_hz + 1 samples.
+			finally:
+				self._continuous = continuous
+			if len(wavetables) >= _WAVETABLE_COUNT:
+				wavetables.popitem(False)
+		else:
+			self.wavetable_hits += 1
+		wavetables[key] = wavetable
+		return wavetable
+		
+	def _renderIndependently(self, parameters, f0_multiplier, samples_target, key):
+		"""
+		Renders the given parameters, as described in L{_render}, with noise that
+		depends only on the given key, rather than on what was rendered before.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type samples_target: int
+		@param samples_target: The number of samples to render.
+		@type key: hashable
+		@param key: The seed from which noise is generated.
+		
+		@rtype: array.array
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
+		"""
+		(noise_source, noise) = (self._noise_source, self._noise)
+		self._noise_source = NoiseSource(key)
+		self._noise = 0.0
+		try:
+			return self._render(parameters, f0_multiplier, samples_target)
+		finally:
+			(self._noise_source, self._noise) = (noise_source, noise)
+			
+	def _tileWavetable(self, wavetable, samples_target):
+		"""
+		Repeats a wavetable for the entire duration of a sound.
+		
+		@type wavetable: array.array
+		@param wavetable: One f0 period of synthetic speech.
+		@type samples_target: int
+		@param samples_target: The number of samples in the finished sound.
+		
+		@rtype: array.array
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
+		"""
+		sounds = wavetable * (samples_target // len(wavetable) + 1)
+		del sounds[samples_target:]
+		return sounds
+		
+	def _render(self, parameters, f0_multiplier, samples_target):
+		"""
+		Renders the given parameters, as described in L{synthesize}, one sample
+		at a time.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type samples_target: int
+		@param samples_target: The number of samples to render, ordinarily
+		    determined by the sound's duration.
+		
+		@rtype: array.array
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
 		"""
 		#Initialize parameters required for synthesis.
-		f0_hz = int(_F0_HZ * f0_multiplier)
+		f0_hz = int(self._f0_samples * f0_multiplier)
 		(fgp, fgz, fgs, fnp, fnz,
 		 f1, f2, f3, f4, f5, f6,
 		 bgp, bgz, bgs, bnp, bnz,
@@ -110,7 +342,8 @@ class Synthesizer(object):
 		#Prepare all resonators.
 		self._initResonators(
 		 (fgp, fgz, fgs, fnp, fnz, f1, f2, f3, f4, f5, f6),
-		 (bgp, bgz, bgs, bnp, bnz, bw1, bw2, bw3, bw4, bw5, bw6)
+		 (bgp, bgz, bgs, bnp, bnz, bw1, bw2, bw3, bw4, bw5, bw6),
+		 not self._continuous
 		)
 		
 		#Multiplex resonator collections.
@@ -119,16 +352,22 @@ class Synthesizer(object):
 		
 		#Set loop variables.
 		sounds = []
-		last_result = 0
-		period_index = f0_hz
-		samples_target = int(milliseconds * FREQUENCY)
-		for t in xrange(samples_target + f0_hz): #Run for the specified number of milliseconds, plus one full period to discard initial clicks.
-			noise = self._getNoise()
+		pulse_amplitude = self._pulse_amplitude
+		output_scale = self._output_scale
+		(samples_discarded, samples_rendered, period_index, last_result) = self._beginSound(f0_hz, samples_target)
+		
+		#Generate noise for every sample that will be rendered.
+		noise_values = self._getNoise(samples_rendered)
+		if numpy is not None: #Python floats are much faster than NumPy scalars in this loop.
+			noise_values = noise_values.tolist()
+			
+		for t in xrange(samples_rendered): #Run for the specified number of milliseconds, plus, unless continuous, one full period to discard initial clicks.
+			noise = noise_values[t]
 			
 			#Apply linear f0 approximation.
 			pulse = 0.0
-			if period_index == f0_hz:
-				pulse = 1.0
+			if period_index >= f0_hz:
+				pulse = pulse_amplitude
 				period_index = 0
 			else:
 				period_index += 1
@@ -150,24 +389,40 @@ class Synthesizer(object):
 			
 			output = result - last_result #Subtract last result from new result to introduce a micro-period into the waveform so it's audible to humans.
 			last_result = result
-			if t >= f0_hz: #Skip the first period to avoid popping.
-				output = int(output * 32767.0) #Convert the result to an integer on an appropriate scale.
-				#Constrain the output range, by clipping if necessary.
-				if output > 32767:
-					output = 32767
-				elif output < -32768:
-					output = -32768
-				sounds.append(output)
+			if t >= samples_discarded: #Skip the first period to avoid popping.
+				sounds.append(output * output_scale) #Quantized and clipped only once the sound is written.
 				
-				#Apply turbo mode processing.
-				if turbo and t == f0_hz * 2 - 1:
-					while len(sounds) * 2 < samples_target:
-						sounds *= 2
-					sounds += sounds[:samples_target - len(sounds)]
-					break
-		return tuple(sounds)
+		(self._period_index, self._last_result) = (period_index, last_result)
+		return array.array('f', sounds)
+		
+	def _beginSound(self, f0_hz, samples_target):
+		"""
+		Determines how many samples must be computed to render a sound, keeping
+		count of them, and retrieves the f0 pulse and differencing state with
+		which rendering starts.
+		
+		@type f0_hz: int
+		@param f0_hz: The f0 period, in samples.
+		@type samples_target: int
+		@param samples_target: The number of samples in the finished sound.
+		
+		@rtype: tuple(4)
+		@return: The number of initial samples to discard, the total number of
+		    samples to compute, the number of samples since the last f0 pulse, and
+		    the last value computed before differencing.
+		"""
+		samples_discarded = f0_hz
+		if self._continuous:
+			samples_discarded = 0
+		samples_rendered = samples_discarded + samples_target
+		self.samples_computed += samples_rendered
+		self.samples_discarded += samples_discarded
+		
+		if self._continuous and self._period_index is not None:
+			return (samples_discarded, samples_rendered, self._period_index, self._last_result)
+		return (samples_discarded, samples_rendered, f0_hz, 0.0)
 		
-	def _initResonators(self, frequencies, bandwidths):
+	def _initResonators(self, frequencies, bandwidths, reset):
 		"""
 		Initializes all resonators needed for rendering sound from parameter
 		values.
@@ -178,35 +433,407 @@ class Synthesizer(object):
 		@type bandwidths: sequence(11)
 		@param bandwidths: (bgp, bgz, bgs, bnp, bnz, bw1, bw2, bw3, bw4, bw5, bw6)
 		    from the input parameters.
+		@type reset: bool
+		@param reset: If set, every resonator's echo queue is emptied.
 		"""
-		#I don't know the significance of this math, unfortunately.
-		pi_neg_div = math.pi * -0.0001
-		pi_2_div = 2.0 * math.pi * 0.0001
+		#Each co-efficient is a function of the sampling period, in seconds.
+		sample_period = 1.0 / self.sample_rate
+		pi_neg_div = math.pi * -sample_period
+		pi_2_div = 2.0 * math.pi * sample_period
 		pi_neg_2_div = -pi_2_div
 		
 		b = (bgp, bgz, bgs, bnp, bnz, b1, b2, b3, b4, b5, b6) = [n * m for (n, m) in zip([math.cos(pi_2_div * f) for f in frequencies], [2 * math.e ** (pi_neg_div * bw) for bw in bandwidths])]
 		c = (cgp, cgz, cgs, cnp, cnz, c1, c2, c3, c4, c5, c6) = [-math.e ** (pi_neg_2_div * bw) for bw in bandwidths]
 		a = (agp, agz, ags, anp, anz, a1, a2, a3, a4, a5, a6) = [1 - b_v - c_v for (b_v, c_v) in zip(b, c)]
 		
-		self._cascade_resonators[0].init(a1, b1, c1)
-		for (a_n, b_n, c_n, c_r, p_r) in zip(a[6:], b[6:], c[6:], self._cascade_resonators[1:], self._parallel_resonators):
-			p_r.init(a_n, b_n, c_n)
-			c_r.init(a_n, b_n, c_n)
-		self._glottal_pole_resonator.init(agp, bgp, cgp)
-		self._glottal_sine_resonator.init(ags, bgs, cgs)
-		self._nasal_pole_resonator.init(anp, bnp, cnp)
-		self._glottal_antiresonator.init(agz, bgz, cgz)
-		self._nasal_antiresonator.init(anz, bnz, cnz)
+		#Formants that can't be represented at this rate would alias, so they pass through the cascade unchanged and are muted in parallel.
+		nyquist = self.sample_rate / 2.0
+		audible = [f < nyquist for f in frequencies]
+		
+		if audible[5]:
+			self._cascade_resonators[0].init(a1, b1, c1, reset)
+		else:
+			self._cascade_resonators[0].init(1.0, 0.0, 0.0, reset)
+		for (a_n, b_n, c_n, c_r, p_r, is_audible) in zip(a[6:], b[6:], c[6:], self._cascade_resonators[1:], self._parallel_resonators, audible[6:]):
+			if is_audible:
+				p_r.init(a_n, b_n, c_n, reset)
+				c_r.init(a_n, b_n, c_n, reset)
+			else:
+				p_r.init(0.0, 0.0, 0.0, reset)
+				c_r.init(1.0, 0.0, 0.0, reset)
+		self._glottal_pole_resonator.init(agp, bgp, cgp, reset)
+		self._glottal_sine_resonator.init(ags, bgs, cgs, reset)
+		self._nasal_pole_resonator.init(anp, bnp, cnp, reset)
+		self._glottal_antiresonator.init(agz, bgz, cgz, reset)
+		self._nasal_antiresonator.init(anz, bnz, cnz, reset)
 		
-	def _getNoise(self):
+	def _getNoise(self, count):
 		"""
-		Generates a random number and adds it to the last-generated random value.
+		Generates a series of random numbers, each of which is added to the
+		last-generated random value.
 		
-		@rtype: float
-		@return: A random value, half of which is echoed.
+		@type count: int
+		@param count: The number of noise values to generate.
+		
+		@rtype: numpy.ndarray|list
+		@return: A collection of random values, each of which is echoed into its
+		    successor, scaled for this synthesizer's rate; a NumPy array, if NumPy
+		    is available.
+		"""
+		noise = self._noise_source.getNoise(count, self._noise)
+		if count:
+			self._noise = float(noise[-1])
+		if self._noise_scale != 1.0:
+			if numpy is None:
+				noise_scale = self._noise_scale #Cache for speed.
+				noise = [n * noise_scale for n in noise]
+			else:
+				noise = noise * self._noise_scale
+		return noise
+		
+		
+class BlockSynthesizer(Synthesizer):
+	"""
+	A variant on the synthesizer that renders each parameter-set as a single
+	block of array operations, using NumPy, rather than one sample at a time.
+	
+	Given the same noise seed, its output matches that of L{Synthesizer} to
+	within 1 unit of each quantized 16-bit sample; the only differences come from the
+	order in which floating-point values are accumulated by FFT convolution.
+	"""
+	def __init__(self, cache=None, seed=None, continuous=False, sample_rate=SAMPLE_RATE, gain=1.0):
+		"""
+		Prepares all resonator objects needed by this synthesizer.
+		
+		@type cache: L{RenderCache}|None
+		@param cache: A cache in which rendered sounds will be kept, as described
+		    in L{Synthesizer.__init__}.
+		@type seed: hashable|None
+		@param seed: The seed from which noise is generated.
+		@type continuous: bool
+		@param continuous: If set, state carries over between sounds, as
+		    described in L{Synthesizer.__init__}.
+		@type sample_rate: int
+		@param sample_rate: The number of samples to synthesize per second.
+		@type gain: float
+		@param gain: The factor by which every sample is multiplied.
+		
+		@raise ImportError: If NumPy is not available.
+		@raise ValueError: If both a cache and continuous mode are requested, or
+		    if the sample rate is not positive.
+		"""
+		if numpy is None:
+			raise ImportError("NumPy is required for block rendering.")
+		Synthesizer.__init__(self, cache, seed, continuous, sample_rate, gain)
+		
+	def _tileWavetable(self, wavetable, samples_target):
+		"""
+		Repeats a wavetable for the entire duration of a sound, as described in
+		L{Synthesizer._tileWavetable}.
+		
+		@type wavetable: numpy.ndarray
+		@param wavetable: One f0 period of synthetic speech.
+		@type samples_target: int
+		@param samples_target: The number of samples in the finished sound.
+		
+		@rtype: numpy.ndarray
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
+		"""
+		return numpy.resize(wavetable, samples_target)
+		
+	def _render(self, parameters, f0_multiplier, samples_target):
+		"""
+		Renders the given parameters, as described in L{synthesize}, as a single
+		block of array operations.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type samples_target: int
+		@param samples_target: The number of samples to render, ordinarily
+		    determined by the sound's duration.
+		
+		@rtype: numpy.ndarray
+		@return: A collection of 32-bit floats, on the scale of 16-bit samples,
+		    that represent synthetic speech.
+		"""
+		#Initialize parameters required for synthesis.
+		f0_hz = int(self._f0_samples * f0_multiplier)
+		(fgp, fgz, fgs, fnp, fnz,
+		 f1, f2, f3, f4, f5, f6,
+		 bgp, bgz, bgs, bnp, bnz,
+		 bw1, bw2, bw3, bw4, bw5, bw6,
+		 a2, a3, a4, a5, a6,
+		 ab, ah, af, av, avs,
+		 milliseconds) = parameters
+		
+		#Prepare all resonators.
+		self._initResonators(
+		 (fgp, fgz, fgs, fnp, fnz, f1, f2, f3, f4, f5, f6),
+		 (bgp, bgz, bgs, bnp, bnz, bw1, bw2, bw3, bw4, bw5, bw6),
+		 not self._continuous
+		)
+		
+		#Multiplex resonator collections.
+		resonator_collection = tuple([(c_r, p_r, a) for (c_r, p_r, a) in reversed(zip(self._cascade_resonators[1:], self._parallel_resonators, (a2, a3, a4, a5, a6)))])
+		cascade_resonator_1 = self._cascade_resonators[0]
+		
+		(samples_discarded, samples_rendered, period_index, last_result) = self._beginSound(f0_hz, samples_target)
+		
+		noise = self._getNoise(samples_rendered)
+		
+		#Apply linear f0 approximation, placing the first pulse where the previous period ends.
+		pulse = numpy.zeros(samples_rendered)
+		first_pulse = max(0, f0_hz - period_index)
+		pulse[first_pulse::f0_hz + 1] = self._pulse_amplitude
+		if first_pulse < samples_rendered:
+			period_index = (samples_rendered - 1 - first_pulse) % (f0_hz + 1)
+		else:
+			period_index += samples_rendered
+		
+		#Compute cascade value.
+		source = self._glottal_pole_resonator.resonateBlock(pulse)
+		source = (self._glottal_antiresonator.resonateBlock(source) * av) + (self._glottal_sine_resonator.resonateBlock(source) * avs)
+		source += noise * ah
+		source = self._nasal_pole_resonator.resonateBlock(source)
+		source = self._nasal_antiresonator.resonateBlock(source)
+		
+		frication = noise * af
+		
+		result = frication * ab #Seed parallel value.
+		for (cascade_resonator, parallel_resonator, amplitude) in resonator_collection:
+			source = cascade_resonator.resonateBlock(source) #Update cascade value.
+			result += parallel_resonator.resonateBlock(frication * amplitude) #Update parallel value.
+		result += cascade_resonator_1.resonateBlock(source) #: Add final cascade value to final parallel value.
+		
+		#Subtract each result from its successor to introduce a micro-period into the waveform so it's audible to humans.
+		output = (result - numpy.concatenate(((last_result,), result[:-1])))[samples_discarded:]
+		if samples_rendered:
+			last_result = float(result[-1])
+		(self._period_index, self._last_result) = (period_index, last_result)
+		
+		#Scale the result, leaving quantization and clipping until the sound is written.
+		return (output * self._output_scale).astype(numpy.float32)
+		
+class NoiseSource(object):
+	"""
+	A seedable generator of the random values from which a synthesizer's noise
+	is built, producing them in bulk.
+	
+	NumPy's RandomState is used if it is available, since its sequences are
+	fixed for any given seed across NumPy releases; otherwise, a private
+	random.Random instance is used. The same seed therefore always yields the
+	same noise, as long as NumPy's availability doesn't change.
+	"""
+	_generator = None #: The random number generator.
+	
+	def __init__(self, seed=None):
+		"""
+		Prepares a generator.
+		
+		@type seed: hashable|None
+		@param seed: Any value whose repr() is stable, like an integer or a tuple
+		    of integers; if None, the generator is seeded unpredictably.
+		"""
+		if seed is not None:
+			seed = zlib.crc32(repr(seed)) & 0xffffffff
+		if numpy is None:
+			self._generator = random.Random(seed)
+		else:
+			self._generator = numpy.random.RandomState(seed)
+			
+	def getNoise(self, count, initial):
+		"""
+		Generates a series of random values between -0.00001 and 0.00001, each
+		of which is added to the sum of all values before it.
+		
+		@type count: int
+		@param count: The number of values to generate.
+		@type initial: float
+		@param initial: The value onto which the first random value is added.
+		
+		@rtype: numpy.ndarray|list
+		@return: The generated values; a NumPy array, if NumPy is available.
+		"""
+		if numpy is None:
+			uniform = self._generator.uniform #Cache for speed.
+			noise = []
+			for i in xrange(count):
+				initial = uniform(-0.00001, 0.00001) + initial
+				noise.append(initial)
+			return noise
+			
+		noise = self._generator.uniform(-0.00001, 0.00001, count)
+		if count:
+			noise[0] += initial
+			noise = numpy.cumsum(noise)
+		return noise
+		
+		
+class RenderCache(object):
+	"""
+	A bounded collection of rendered sounds, keyed by everything that
+	determines their content, that discards the least-recently-used sounds
+	when its memory budget is exceeded.
+	"""
+	hits = 0 #: The number of times a requested sound was found in the cache.
+	misses = 0 #: The number of times a requested sound had to be rendered.
+	_max_bytes = None #: The number of bytes of samples the cache may hold.
+	_bytes = 0 #: The number of bytes of samples the cache currently holds.
+	_sounds = None #: The cached sounds, ordered from least- to most-recently-used.
+	
+	def __init__(self, max_bytes):
+		"""
+		Prepares an empty cache.
+		
+		@type max_bytes: int
+		@param max_bytes: The number of bytes of samples the cache may hold.
+		"""
+		self._max_bytes = max_bytes
+		self._sounds = collections.OrderedDict()
+		
+	def get(self, key):
+		"""
+		Retrieves a sound from the cache, marking it as recently used.
+		
+		@type key: hashable
+		@param key: The key under which the sound was stored.
+		
+		@rtype: sequence|None
+		@return: The cached sound, or None if it is not present.
+		"""
+		sounds = self._sounds.pop(key, None)
+		if sounds is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self._sounds[key] = sounds
+		return sounds
+		
+	def put(self, key, sounds):
+		"""
+		Adds a sound to the cache, discarding the least-recently-used sounds
+		until the cache fits within its memory budget again.
+		
+		Sounds larger than the entire budget are not stored.
+		
+		@type key: hashable
+		@param key: The key under which the sound will be stored.
+		@type sounds: array.array|numpy.ndarray
+		@param sounds: The sound to store.
+		"""
+		size = len(sounds) * sounds.itemsize
+		if size > self._max_bytes:
+			return
+			
+		previous = self._sounds.pop(key, None)
+		if previous is not None:
+			self._bytes -= len(previous) * previous.itemsize
+		self._sounds[key] = sounds
+		self._bytes += size
+		while self._bytes > self._max_bytes:
+			(discarded_key, discarded) = self._sounds.popitem(False)
+			self._bytes -= len(discarded) * discarded.itemsize
+			
+	def getSize(self):
+		"""
+		Reports how much of the cache's memory budget is in use.
+		
+		@rtype: tuple(2)
+		@return: The number of sounds cached and the number of bytes they occupy.
+		"""
+		return (len(self._sounds), self._bytes)
+		
+		
+class FramePlanner(object):
+	"""
+	Stands in for a L{Synthesizer}, producing, in place of each sound, a
+	L{PlannedSound} that records what would have been synthesized and how
+	many samples it would have produced, so that a render can be planned from
+	its parameter-sets without synthesizing anything.
+	"""
+	sample_rate = SAMPLE_RATE #: The number of samples per second being planned.
+	_samples_per_ms = float(FREQUENCY) #: The number of samples per millisecond.
+	
+	def __init__(self, sample_rate=SAMPLE_RATE):
+		"""
+		Prepares to plan sounds at the given rate.
+		
+		@type sample_rate: int
+		@param sample_rate: The number of samples per second that the
+		    synthesizer being stood in for renders.
+		"""
+		self.sample_rate = sample_rate
+		self._samples_per_ms = sample_rate / 1000.0
+		
+	def generateSilence(self, milliseconds):
+		"""
+		Plans a period of silence.
+		
+		@type milliseconds: int
+		@param milliseconds: The number of milliseconds of silence.
+		
+		@rtype: L{PlannedSound}
+		@return: A sound as long as the silence L{Synthesizer.generateSilence}
+		    would produce, with neither parameters nor an f0 multiplier.
+		"""
+		return PlannedSound(None, None, int(milliseconds * self._samples_per_ms))
+		
+	def resetState(self):
+		"""
+		Does nothing, since no state is carried between planned sounds.
+		"""
+		pass
+		
+	def synthesize(self, parameters, f0_multiplier, turbo):
+		"""
+		Plans a sound.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters, the last of
+		    which is the sound's duration, in milliseconds.
+		@type f0_multiplier: number
+		@param f0_multiplier: The modifier that would be applied to the f0
+		    period.
+		@type turbo: bool
+		@param turbo: Ignored; turbo mode does not affect length.
+		
+		@rtype: L{PlannedSound}
+		@return: A sound as long as the one L{Synthesizer.synthesize} would
+		    produce.
+		"""
+		return PlannedSound(parameters, f0_multiplier, int(parameters[-1] * self._samples_per_ms))
+		
+		
+class PlannedSound(object):
+	"""
+	A sound that has been planned by a L{FramePlanner}, but not synthesized.
+	
+	Its length is the number of samples it would contain.
+	"""
+	__slots__ = ('parameters', 'f0_multiplier', 'sample_count')
+	
+	def __init__(self, parameters, f0_multiplier, sample_count):
+		"""
+		Records a planned sound.
+		
+		@type parameters: sequence(33)|None
+		@param parameters: The parameters with which the sound would be
+		    synthesized, or None if it is silence.
+		@type f0_multiplier: float|None
+		@param f0_multiplier: The modifier that would be applied to the f0
+		    period, or None if the sound is silence.
+		@type sample_count: int
+		@param sample_count: The number of samples the sound would contain.
 		"""
-		self._noise = random.uniform(-0.00001, 0.00001) + self._noise
-		return self._noise
+		self.parameters = parameters
+		self.f0_multiplier = f0_multiplier
+		self.sample_count = sample_count
+		
+	def __len__(self):
+		return self.sample_count
 		
 		
 class _Resonator(object):
@@ -219,9 +846,10 @@ class _Resonator(object):
 	_delay_1 = None #: The last-stored value for use in successive resonance.
 	_delay_2 = None #: The second-last-stored value for use in successive resonance.
 	
-	def init(self, a, b, c):
+	def init(self, a, b, c, reset=True):
 		"""
-		Sets the resonance paramters and resets the echo queue.
+		Sets the resonance paramters and, unless told otherwise, resets the echo
+		queue.
 		
 		@type a: number
 		@param a: The value to be multiplied by the input.
@@ -229,10 +857,20 @@ class _Resonator(object):
 		@param b: The value to be multiplied by the last-generated output.
 		@type c: number
 		@param c: The value to be multiplied by the second-last-generated output.
+		@type reset: bool
+		@param reset: If not set, values already stored continue to echo, so that
+		    resonance carries smoothly into the new parameters.
 		"""
 		self._a = a
 		self._b = b
 		self._c = c
+		if reset or self._delay_1 is None:
+			self.clear()
+			
+	def clear(self):
+		"""
+		Empties the echo queue.
+		"""
 		self._delay_1 = self._delay_2 = 0.0
 		
 	def resonate(self, input):
@@ -266,13 +904,50 @@ class _Resonator(object):
 		self._delay_2 = self._delay_1
 		return output
 		
+	def resonateBlock(self, samples):
+		"""
+		Resonates a block of input values, producing the same output as would
+		calling L{resonate} on each value in turn.
+		
+		The recursion is expanded into a convolution with the resonator's impulse
+		response, plus the decaying echo of whatever was stored before the block
+		began. The last two output values are stored for use in successive
+		resonance.
+		
+		@type samples: numpy.ndarray
+		@param samples: The values to be resonated.
+		
+		@rtype: numpy.ndarray
+		@return: The result of resonance.
+		"""
+		response = _getImpulseResponse(self._b, self._c, len(samples) + 1)
+		output = _convolve(samples, response[:-1] * self._a)
+		output += response[1:] * self._delay_1 + response[:-1] * (self._c * self._delay_2)
+		self._storeBlock(output)
+		return output
+		
+	def _storeBlock(self, values):
+		"""
+		Stores the last two values of a block for use in successive resonance.
+		
+		@type values: numpy.ndarray
+		@param values: The values to be stored.
+		"""
+		if len(values) > 1:
+			self._delay_2 = float(values[-2])
+			self._delay_1 = float(values[-1])
+		elif len(values) == 1:
+			self._delay_2 = self._delay_1
+			self._delay_1 = float(values[0])
+			
 class _AntiResonator(_Resonator):
 	"""
 	A variant on the resonator that generates inverse harmonics.
 	"""
-	def init(self, a, b, c):
+	def init(self, a, b, c, reset=True):
 		"""
-		Sets the resonance paramters and resets the echo queue.
+		Sets the resonance paramters and, unless told otherwise, resets the echo
+		queue.
 		
 		@type a: number
 		@param a: The reciprocal of the value to be multiplied by the input.
@@ -281,9 +956,11 @@ class _AntiResonator(_Resonator):
 		@type c: number
 		@param c: The value to be multiplied by -1.0/a and the second-last-stored
 		    input.
+		@type reset: bool
+		@param reset: If not set, stored input values continue to echo.
 		"""
 		a = 1.0 / a
-		_Resonator.init(self, a, -b * a, -c * a)
+		_Resonator.init(self, a, -b * a, -c * a, reset)
 		
 	def resonate(self, input):
 		"""
@@ -300,4 +977,78 @@ class _AntiResonator(_Resonator):
 		output = self._resonate(input)
 		self._delay_1 = input
 		return output
-		
\ No newline at end of file
+		
+	def resonateBlock(self, samples):
+		"""
+		Resonates a block of input values, producing the same output as would
+		calling L{resonate} on each value in turn.
+		
+		The last two input values are stored for use in successive resonance.
+		
+		@type samples: numpy.ndarray
+		@param samples: The values to be resonated.
+		
+		@rtype: numpy.ndarray
+		@return: The result of resonance.
+		"""
+		delayed = numpy.concatenate(((self._delay_2, self._delay_1), samples))
+		output = self._a * samples + self._b * delayed[1:-1] + self._c * delayed[:-2]
+		self._storeBlock(samples)
+		return output
+		
+		
+def _convolve(samples, impulse_response):
+	"""
+	Convolves a block of values with an impulse response of the same length,
+	using the FFT, and discards everything after the length of the block.
+	
+	@type samples: numpy.ndarray
+	@param samples: The values to be convolved.
+	@type impulse_response: numpy.ndarray
+	@param impulse_response: The impulse response with which to convolve them.
+	
+	@rtype: numpy.ndarray
+	@return: The first len(samples) values of the convolution.
+	"""
+	count = len(samples)
+	size = 1
+	while size < count * 2: #Leave enough room to prevent circular wrap-around.
+		size *= 2
+	rfft = numpy.fft.rfft #Cache for speed.
+	return numpy.fft.irfft(rfft(samples, size) * rfft(impulse_response, size), size)[:count]
+	
+def _getImpulseResponse(b, c, count):
+	"""
+	Computes the first count values of a resonator's response to a unit
+	impulse, before scaling by the input co-efficient, by repeated doubling.
+	
+	Writing the response as u, the resonator's state-transition matrix,
+	[[b, c], [1, 0]], raised to the nth power, is [[u[n], c * u[n - 1]],
+	[u[n - 1], c * u[n - 2]]], so products of powers reduce to
+	u[m + n] = u[m] * u[n] + c * u[m - 1] * u[n - 1], which nearly doubles the
+	number of known values on each pass.
+	
+	@type b: number
+	@param b: The co-efficient for the value stored in the last cycle.
+	@type c: number
+	@param c: The co-efficient for the value stored in the second-last cycle.
+	@type count: int
+	@param count: The number of values to compute.
+	
+	@rtype: numpy.ndarray
+	@return: The impulse response, starting at time 0.
+	"""
+	response = numpy.empty(max(count, 2) + 1)
+	response[:3] = (0.0, 1.0, b) #u[-1] is stored in front, to make u[n - 1] addressable.
+	filled = 2
+	while filled < count:
+		step = min(filled - 1, count - filled)
+		response[filled + 1:filled + step + 1] = response[2:step + 2] * response[filled] + response[1:step + 1] * (c * response[filled - 1])
+		filled += step
+	return response[1:count + 1]
+	
+	
+ENGINES = {
+ 'block': BlockSynthesizer,
+ 'sample': Synthesizer,
+} #: All available synthesis engines, keyed by the names used to select them.
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: src.pcm_cache
+
+Purpose
+=======
+ Keeps rendered speech on disk, as 16-bit little-endian PCM, so that scripts
+ which are rendered repeatedly only need to be synthesized once.
+ 
+ Each render is stored in its own file, named after a hash of everything that
+ determines its content, so entries never need to be invalidated: a change to
+ the text, the options, or the code that renders it simply produces a
+ different name. Files are written under temporary names and renamed into
+ place once complete, so any number of processes may share a cache directory
+ without ever reading a partial render.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+_SUFFIX = '.pcm' #: The extension given to every cached render.
+_TEMPORARY_SUFFIX = '.tmp' #: The extension given to renders that are still being written.
+_STALE_TEMPORARY_SECONDS = 3600 #: The age at which a temporary file is assumed to have been abandoned by a process that died.
+
+class PCMCache(object):
+	"""
+	A directory of rendered speech, keyed by the hashes produced by L{getKey},
+	that discards the least-recently-used renders when its size budget is
+	exceeded.
+	"""
+	hits = 0 #: The number of times a requested render was found in the cache.
+	misses = 0 #: The number of times a requested render was not found.
+	_directory = None #: The directory in which renders are stored.
+	_max_bytes = None #: The number of bytes of PCM the directory may hold.
+	_total_bytes = None #: The number of bytes of PCM believed to be in the directory, or None until it has been scanned.
+	
+	def __init__(self, directory, max_bytes):
+		"""
+		Opens a cache directory, creating it if necessary.
+		
+		@type directory: basestring
+		@param directory: The directory in which renders are stored.
+		@type max_bytes: int
+		@param max_bytes: The number of bytes of PCM the directory may hold.
+		
+		@raise OSError: If the directory does not exist and cannot be created.
+		"""
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				if not os.path.isdir(directory): #Another process may have created it first.
+					raise
+		self._directory = directory
+		self._max_bytes = max_bytes
+		
+	def get(self, key):
+		"""
+		Retrieves a render from the cache, marking it as recently used.
+		
+		@type key: str
+		@param key: The key under which the render was stored.
+		
+		@rtype: str|None
+		@return: The render's PCM data, or None if it is not present.
+		"""
+		cached_file = self.open(key)
+		if cached_file is None:
+			return None
+		try:
+			return cached_file.read()
+		finally:
+			cached_file.close()
+			
+	def open(self, key):
+		"""
+		Opens a render in the cache for reading, marking it as recently used,
+		so that large renders can be copied without being held in memory.
+		
+		@type key: str
+		@param key: The key under which the render was stored.
+		
+		@rtype: file|None
+		@return: The render's PCM data, as a file opened for binary reading,
+		    which the caller must close, or None if it is not present.
+		"""
+		path = self._getPath(key)
+		try:
+			cached_file = open(path, 'rb')
+		except IOError: #Missing, or evicted by another process.
+			self.misses += 1
+			return None
+		self.hits += 1
+		try:
+			os.utime(path, None)
+		except OSError: #Evicted since being opened; the open file is still complete.
+			pass
+		return cached_file
+		
+	def put(self, key, pcm):
+		"""
+		Adds a render to the cache, then discards the least-recently-used
+		renders if the cache no longer fits within its size budget.
+		
+		@type key: str
+		@param key: The key under which the render will be stored.
+		@type pcm: str
+		@param pcm: The render's PCM data.
+		
+		@raise IOError: If the render cannot be written.
+		"""
+		writer = self.createWriter(key)
+		try:
+			writer.write(pcm)
+		except:
+			writer.discard()
+			raise
+		writer.commit()
+		
+	def createWriter(self, key):
+		"""
+		Begins adding a render to the cache, so that it can be written as it is
+		produced.
+		
+		@type key: str
+		@param key: The key under which the render will be stored.
+		
+		@rtype: L{PCMWriter}
+		@return: A writer to which the render's PCM data should be passed;
+		    nothing is stored until it is committed.
+		
+		@raise IOError: If a temporary file cannot be created.
+		"""
+		try:
+			(descriptor, temporary_path) = tempfile.mkstemp(_TEMPORARY_SUFFIX, '', self._directory)
+		except OSError, e:
+			raise IOError(str(e))
+		return PCMWriter(self, os.fdopen(descriptor, 'wb'), temporary_path, self._getPath(key), self._max_bytes)
+		
+	def evict(self):
+		"""
+		Discards the least-recently-used renders until the cache fits within its
+		size budget, along with any temporary files abandoned by processes that
+		died while writing them.
+		"""
+		now = time.time()
+		renders = []
+		total_bytes = 0
+		for filename in os.listdir(self._directory):
+			path = os.path.join(self._directory, filename)
+			try:
+				status = os.stat(path)
+				if filename.endswith(_TEMPORARY_SUFFIX):
+					if now - status.st_mtime > _STALE_TEMPORARY_SECONDS:
+						os.remove(path)
+					continue
+			except OSError: #Removed by another process.
+				continue
+			if filename.endswith(_SUFFIX):
+				renders.append((status.st_mtime, status.st_size, path))
+				total_bytes += status.st_size
+				
+		renders.sort()
+		for (mtime, size, path) in renders:
+			if total_bytes <= self._max_bytes:
+				break
+			try:
+				os.remove(path)
+			except OSError: #Removed by another process.
+				pass
+			total_bytes -= size
+		self._total_bytes = total_bytes
+		
+	def noteStored(self, size):
+		"""
+		Accounts for a render that has just been added to the directory,
+		discarding renders as described in L{evict} only if the cache is now
+		over its size budget.
+		
+		The directory is scanned the first time a render is added, and again
+		whenever the running total exceeds the budget, so renders added by other
+		processes are accounted for before anything is discarded.
+		
+		@type size: int
+		@param size: The size of the render, in bytes.
+		"""
+		if self._total_bytes is None:
+			self.evict()
+		else:
+			self._total_bytes += size
+			if self._total_bytes > self._max_bytes:
+				self.evict()
+				
+	def _getPath(self, key):
+		"""
+		Provides the path at which a render is stored.
+		
+		@type key: str
+		@param key: The key under which the render is stored.
+		
+		@rtype: str
+		@return: The path of the render's file.
+		"""
+		return os.path.join(self._directory, key + _SUFFIX)
+		
+		
+class PCMWriter(object):
+	"""
+	Receives a render as it is produced, and adds it to a L{PCMCache} only
+	once it is complete.
+	"""
+	_bytes = 0 #: The number of bytes of PCM written so far.
+	_cache = None #: The L{PCMCache} to which the render will be added.
+	_file = None #: The temporary file into which PCM data is written.
+	_max_bytes = None #: The size beyond which the render will not be stored.
+	_path = None #: The path at which the render will be stored.
+	_temporary_path = None #: The path of the temporary file.
+	
+	def __init__(self, cache, temporary_file, temporary_path, path, max_bytes):
+		"""
+		Prepares to receive a render.
+		
+		@type cache: L{PCMCache}
+		@param cache: The cache to which the render will be added.
+		@type temporary_file: file
+		@param temporary_file: The temporary file into which PCM data is written.
+		@type temporary_path: basestring
+		@param temporary_path: The path of the temporary file.
+		@type path: basestring
+		@param path: The path at which the render will be stored.
+		@type max_bytes: int
+		@param max_bytes: The size beyond which the render will not be stored,
+		    since it would only displace everything else in the cache.
+		"""
+		self._cache = cache
+		self._file = temporary_file
+		self._temporary_path = temporary_path
+		self._path = path
+		self._max_bytes = max_bytes
+		
+	def write(self, pcm):
+		"""
+		Appends PCM data to the render.
+		
+		@type pcm: str|buffer
+		@param pcm: 16-bit little-endian PCM data, as returned by
+		    L{waveform.encodeSamples}.
+		
+		@raise IOError: If the data cannot be written.
+		"""
+		self._file.write(pcm)
+		self._bytes += len(pcm)
+		
+	def commit(self):
+		"""
+		Adds the completed render to the cache, then discards renders as
+		described in L{PCMCache.noteStored}.
+		
+		If another process added the same render first, only one copy is kept;
+		the two are identical. Renders larger than the cache's entire size
+		budget are not stored.
+		
+		@raise IOError: If the render cannot be written.
+		"""
+		if self._bytes > self._max_bytes:
+			self.discard()
+			return
+			
+		self._file.close()
+		try:
+			os.rename(self._temporary_path, self._path) #Atomic on POSIX systems, replacing any existing copy.
+		except OSError, e:
+			self.discard()
+			if not os.path.exists(self._path): #Elsewhere, renaming fails if another process got there first.
+				raise IOError(str(e))
+		self._cache.noteStored(self._bytes)
+		
+	def discard(self):
+		"""
+		Abandons the render, leaving the cache unchanged.
+		"""
+		self._file.close()
+		try:
+			os.remove(self._temporary_path)
+		except OSError: #Already renamed or removed.
+			pass
+			
+			
+def getKey(*parts):
+	"""
+	Computes the key under which a render is stored, from everything that
+	determines its content.
+	
+	@type parts: tuple
+	@param parts: Any number of values whose C{repr} is stable between
+	    processes, like strings, numbers, booleans, None, and tuples of them.
+	
+	@rtype: str
+	@return: A hexadecimal SHA-1 digest of the parts.
+	"""
+	return hashlib.sha1(repr(parts)).hexdigest()
+	
+def getSourceDigest(modules):
+	"""
+	Computes a digest of the source code of a collection of modules, so that
+	renders made by one version of the code are never mistaken for renders
+	made by another.
+	
+	@type modules: sequence
+	@param modules: The modules whose code determines a render's content.
+	
+	@rtype: str
+	@return: A hexadecimal SHA-1 digest of every module's source, in order.
+	"""
+	digest = hashlib.sha1()
+	for module in modules:
+		path = module.__file__
+		if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+			path = path[:-1]
+		source_file = open(path, 'rb')
+		try:
+			digest.update(source_file.read())
+		finally:
+			source_file.close()
+	return digest.hexdigest()
+	
\ No newline at end of file
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: src.server
+ 
+Purpose
+=======
+ Serves synthesized speech over HTTP, on a localhost port or a Unix domain
+ socket, so that many short renders share one set of loaded tables, language
+ rulesets, and warm synthesizers, rather than each paying for a new process.
+ 
+ IPA is POSTed, encoded as UTF-8, as the body of a request to any path, with
+ paragraphs separated by linebreaks, exactly as in an input file. The body's
+ Content-Length must be given, and may not exceed L{MAX_REQUEST_BYTES}; larger
+ requests are refused with a 413 response. The query string may specify:
+  - format: 'wav', the default, or 'pcm', for raw 16-bit little-endian samples
+  - language: the name of the ruleset to apply
+  - seed: an integer from which noise is generated reproducibly
+  - turbo: '1' to enable turbo mode
+ 
+ The length of every paragraph is worked out before anything is synthesized,
+ so each response declares its length up front, and is then streamed a
+ paragraph at a time, as soon as each one has been rendered. Requests are
+ handled concurrently, sharing a pool of worker processes.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import BaseHTTPServer
+import collections
+import copy
+import multiprocessing
+import os
+import re
+import socket
+import SocketServer
+import sys
+import urlparse
+
+import languages
+import parwave
+import transform
+import waveform
+
+MAX_REQUEST_BYTES = 1024 * 1024 #: The largest body a request may have, in bytes.
+
+_HOST = '127.0.0.1' #: The interface on which TCP connections are accepted, unless another is given.
+_SYNTHESIZER_COUNT = 8 #: The number of synthesizers, each created with a different seed, kept warm by each worker process.
+
+def serve(address, options, allow_remote=False):
+	"""
+	Serves synthesized speech until interrupted.
+	
+	@type address: basestring
+	@param address: The path of a Unix domain socket, if it contains a '/';
+	    otherwise, a TCP port, optionally preceded by a host and a colon.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur; the
+	    language, seed, and turbo mode may be overridden by each request.
+	@type allow_remote: bool
+	@param allow_remote: True to permit a TCP host other than a loopback
+	    address, exposing the server to other machines.
+	
+	@raise ValueError: If the address is not valid, or is not a loopback
+	    address and remote access was not allowed.
+	@raise socket.error: If the address cannot be bound.
+	"""
+	worker_options = copy.copy(options)
+	worker_options.debug = worker_options.verbose = False #Workers would interleave their output.
+	
+	pool = multiprocessing.Pool(options.jobs or None, _initWorker, (worker_options,)) #Created first, so workers don't inherit the listening socket.
+	try:
+		if '/' in address:
+			server = _UnixServer(address, pool, options)
+		else:
+			server = _TCPServer(_parseAddress(address, allow_remote), pool, options)
+	except:
+		pool.terminate()
+		raise
+		
+	print "Serving on %s..." % (address)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+	pool.terminate()
+	pool.join()
+	
+def _parseAddress(address, allow_remote=False):
+	"""
+	Interprets a TCP address.
+	
+	@type address: basestring
+	@param address: A port, optionally preceded by a host and a colon; the
+	    host defaults to L{_HOST}.
+	@type allow_remote: bool
+	@param allow_remote: True to permit a host that is not a loopback
+	    address.
+	
+	@rtype: tuple(2)
+	@return: The host and port.
+	
+	@raise ValueError: If the port is not a valid number, or the host is not
+	    a loopback address and remote access was not allowed.
+	@raise socket.error: If the host cannot be resolved.
+	"""
+	(host, separator, port) = address.rpartition(':')
+	if not port.isdigit() or not 0 < int(port) < 65536:
+		raise ValueError("'%s' is not a valid port." % (port))
+	host = host or _HOST
+	if not allow_remote and not _isLoopback(host):
+		raise ValueError("'%s' is reachable from other machines; use --serve-remote to allow this." % (host))
+	return (host, int(port))
+	
+def _isLoopback(host):
+	"""
+	Indicates whether every address to which a host resolves is a loopback
+	address, reachable only from this machine.
+	
+	@type host: basestring
+	@param host: A hostname or IP address.
+	
+	@rtype: bool
+	@return: True if the host is only reachable locally.
+	
+	@raise socket.error: If the host cannot be resolved.
+	"""
+	addresses = [sockaddr[0] for (family, socktype, proto, canonname, sockaddr) in socket.getaddrinfo(host, None)]
+	return bool(addresses) and all([address.startswith('127.') or address == '::1' for address in addresses])
+	
+	
+class _TCPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""
+	An HTTP server that handles each request in its own thread, rendering
+	speech with a shared pool of worker processes.
+	"""
+	daemon_threads = True #: Requests still being streamed don't prevent shutdown.
+	options = None #: The options with which synthesis occurs.
+	pool = None #: The multiprocessing.Pool in which speech is rendered.
+	silence_length = None #: The number of samples of silence that follow each paragraph.
+	
+	def __init__(self, address, pool, options):
+		"""
+		Binds the server to its address.
+		
+		@type address: tuple(2)|basestring
+		@param address: The address on which to listen.
+		@type pool: multiprocessing.Pool
+		@param pool: The pool in which speech is rendered, whose workers have
+		    been initialized by L{_initWorker}.
+		@type options: optparse.Values
+		@param options: The options with which synthesis occurs.
+		
+		@raise socket.error: If the address cannot be bound.
+		"""
+		self.pool = pool
+		self.options = options
+		self.silence_length = parwave.FramePlanner(options.rate).generateSilence(500).sample_count
+		BaseHTTPServer.HTTPServer.__init__(self, address, _RequestHandler)
+		
+		
+class _UnixServer(_TCPServer):
+	"""
+	A variant on the server that listens on a Unix domain socket.
+	"""
+	address_family = socket.AF_UNIX
+	
+	def server_bind(self):
+		"""
+		Binds the server to its socket, replacing any left behind by a server
+		that is no longer running.
+		
+		@raise socket.error: If the socket cannot be bound, or another server
+		    is listening on it.
+		"""
+		if os.path.exists(self.server_address):
+			probe = socket.socket(socket.AF_UNIX)
+			try:
+				probe.connect(self.server_address)
+			except socket.error: #Nothing is listening.
+				os.remove(self.server_address)
+			else:
+				raise socket.error("'%s' is already being served." % (self.server_address))
+			finally:
+				probe.close()
+		SocketServer.TCPServer.server_bind(self)
+		self.server_name = 'localhost'
+		self.server_port = 0
+		
+	def server_close(self):
+		"""
+		Stops listening and removes the socket.
+		"""
+		SocketServer.TCPServer.server_close(self)
+		try:
+			os.remove(self.server_address)
+		except OSError: #Already removed.
+			pass
+			
+			
+class _RequestTooLarge(ValueError):
+	"""
+	Indicates that a request's body is larger than L{MAX_REQUEST_BYTES}.
+	"""
+	
+	
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Renders the IPA in each POSTed request, as described in this module's
+	documentation.
+	"""
+	def do_POST(self):
+		"""
+		Renders a request and streams the result back to the client.
+		"""
+		try:
+			(paragraphs, language, seed, turbo, pcm_only) = self._readRequest()
+		except _RequestTooLarge, e:
+			self.send_error(413, str(e))
+			return
+		except ValueError, e:
+			self.send_error(400, str(e))
+			return
+			
+		pool = self.server.pool
+		silence_length = self.server.silence_length
+		try:
+			sample_counts = pool.map(_countParagraph, [(paragraph, language) for paragraph in paragraphs])
+		except Exception, e: #Anything the rules can't handle.
+			self.send_error(400, "Unable to render the request: %s" % (e))
+			return
+		sample_count = sum(sample_counts) + silence_length * len(paragraphs)
+		header = ''
+		if not pcm_only:
+			header = waveform.getHeader(self.server.options.rate, sample_count)
+			
+		self.send_response(200)
+		self.send_header('Content-Type', pcm_only and 'application/octet-stream' or 'audio/wav')
+		self.send_header('Content-Length', str(len(header) + sample_count * 2))
+		self.end_headers()
+		
+		self.wfile.write(header)
+		silence = '\0' * (silence_length * 2)
+		try:
+			for (i, pcm) in enumerate(pool.imap(_renderParagraph, [(i, paragraph, language, seed, turbo) for (i, paragraph) in enumerate(paragraphs)])): #Results arrive in input order.
+				if len(pcm) != sample_counts[i] * 2:
+					raise ValueError("Paragraph #%i produced %i samples, but %i were counted." % (i + 1, len(pcm) // 2, sample_counts[i]))
+				self.wfile.write(pcm)
+				self.wfile.write(silence)
+		except socket.error: #The client went away; its remaining paragraphs are discarded.
+			self.close_connection = 1
+		except Exception, e: #The response can only be cut short.
+			self.log_error("Unable to finish rendering: %s", e)
+			self.close_connection = 1
+			
+	def _readRequest(self):
+		"""
+		Reads the IPA and settings of a request.
+		
+		@rtype: tuple(5)
+		@return: Every paragraph to be rendered, as unicode; the name of the
+		    language ruleset to apply; the seed from which noise is generated, or
+		    None; whether turbo mode is enabled; and whether raw PCM, rather than
+		    a wavefile, was requested.
+		
+		@raise _RequestTooLarge: If the body exceeds L{MAX_REQUEST_BYTES}.
+		@raise ValueError: If the request is malformed.
+		"""
+		query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+		options = self.server.options
+		
+		data_format = query.get('format', ['wav'])[-1]
+		if data_format not in ('wav', 'pcm'):
+			raise ValueError("Unsupported format: '%s'" % (data_format))
+			
+		language = query.get('language', [options.language])[-1]
+		if language not in languages.getLanguageNames():
+			raise ValueError("Unknown language: '%s'" % (language))
+			
+		seed = options.seed
+		if 'seed' in query:
+			try:
+				seed = int(query['seed'][-1])
+			except ValueError:
+				raise ValueError("The seed must be an integer.")
+				
+		turbo = options.turbo
+		if 'turbo' in query:
+			turbo = query['turbo'][-1] not in ('', '0')
+			
+		try:
+			length = int(self.headers.get('Content-Length', ''))
+		except ValueError:
+			raise ValueError("A Content-Length is required.")
+		if length < 0:
+			raise ValueError("The Content-Length cannot be negative.")
+		if length > MAX_REQUEST_BYTES:
+			raise _RequestTooLarge("The body may not exceed %i bytes." % (MAX_REQUEST_BYTES))
+		try:
+			text = self.rfile.read(length).decode('utf-8')
+		except UnicodeDecodeError:
+			raise ValueError("The IPA must be encoded as UTF-8.")
+		if text.startswith(u'\ufeff'): #Compensate for Microsoft Notepad.
+			text = text[1:]
+		paragraphs = [paragraph.strip() for paragraph in re.split(u'\r?\n', text) if paragraph.strip()]
+		
+		return (paragraphs, language, seed, turbo, data_format == 'pcm')
+		
+	def address_string(self):
+		"""
+		Describes the client, whose address is empty on a Unix domain socket.
+		
+		@rtype: str
+		@return: The client's IP address, or 'local'.
+		"""
+		if self.client_address:
+			return self.client_address[0]
+		return 'local'
+		
+	def log_message(self, format, *args):
+		"""
+		Logs each request, but only if verbose output was requested.
+		"""
+		if self.server.options.verbose:
+			self._log(format % args)
+			
+	def log_error(self, format, *args):
+		"""
+		Logs every error.
+		"""
+		self._log(format % args)
+		
+	def _log(self, message):
+		"""
+		Writes a line to standard error, in the format used by
+		BaseHTTPServer.BaseHTTPRequestHandler, whose own implementation indexes
+		the client's address, and so fails on a Unix domain socket.
+		
+		@type message: basestring
+		@param message: The message to be logged.
+		"""
+		sys.stderr.write("%s - - [%s] %s\n" % (self.address_string(), self.log_date_time_string(), message))
+		
+		
+_worker_options = None #: The options with which a worker process renders paragraphs.
+_worker_synthesizers = None #: The synthesizers that render paragraphs in a worker process, kept warm between requests, keyed by seed, in order of use.
+
+def _initWorker(options):
+	"""
+	Prepares a worker process to render paragraphs with its own synthesizer.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	"""
+	global _worker_options
+	global _worker_synthesizers
+	
+	_worker_options = options
+	_worker_synthesizers = collections.OrderedDict()
+	_getSynthesizer(options.seed)
+	
+def _getSynthesizer(seed):
+	"""
+	Provides a worker process's synthesizer for the given seed, creating it
+	if it isn't among those most recently used.
+	
+	Since sounds kept in a synthesizer's render cache and turbo-mode
+	wavetables have noise derived from the seed with which it was created,
+	a request with its own seed needs a synthesizer of its own to sound
+	exactly like a render from the command line.
+	
+	@type seed: int|None
+	@param seed: The seed with which the synthesizer is created.
+	
+	@rtype: L{parwave.Synthesizer}
+	@return: The synthesizer.
+	"""
+	synthesizer = _worker_synthesizers.pop(seed, None)
+	if synthesizer is None:
+		options = copy.copy(_worker_options)
+		options.seed = seed
+		synthesizer = transform.createSynthesizer(options)
+		if len(_worker_synthesizers) >= _SYNTHESIZER_COUNT:
+			_worker_synthesizers.popitem(False)
+	_worker_synthesizers[seed] = synthesizer
+	return synthesizer
+	
+def _countParagraph((paragraph, language)):
+	"""
+	Works out how many samples a paragraph will produce in a worker process,
+	as described in L{transform.countParagraphSamples}.
+	
+	@type paragraph: unicode
+	@param paragraph: The text to be measured.
+	@type language: basestring
+	@param language: The name of the language ruleset to apply.
+	
+	@rtype: int
+	@return: The number of samples the paragraph will produce.
+	"""
+	return transform.countParagraphSamples(paragraph, _worker_options, language)
+	
+def _renderParagraph((paragraph_index, paragraph, language, seed, turbo)):
+	"""
+	Renders a paragraph in a worker process.
+	
+	If a seed was specified, noise is reseeded exactly as it is by klatt.py,
+	so the output is identical to that of a render from the command line.
+	
+	@type paragraph_index: int
+	@param paragraph_index: The paragraph's position in the request, indexed
+	    from 0.
+	@type paragraph: unicode
+	@param paragraph: The text to be synthesized.
+	@type language: basestring
+	@param language: The name of the language ruleset to apply.
+	@type seed: int|None
+	@param seed: The seed from which noise is generated, if any.
+	@type turbo: bool
+	@param turbo: True if turbo mode is enabled.
+	
+	@rtype: str
+	@return: The paragraph's synthesized speech, as 16-bit PCM data.
+	"""
+	options = _worker_options
+	if turbo != options.turbo:
+		options = copy.copy(options)
+		options.turbo = turbo
+	synthesizer = _getSynthesizer(seed)
+	if seed is not None:
+		synthesizer.seedNoise((seed, paragraph_index))
+	return ''.join([waveform.encodeSamples(segment) for segment in transform.paragraphToSound(paragraph, options, synthesizer, language)])
+	
+	
\ No newline at end of file
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: src.stream
+ 
+Purpose
+=======
+ Delivers synthesized speech incrementally, as fixed-size blocks of PCM data,
+ so that playback can begin long before a paragraph has been fully rendered.
+ 
+ Rendering happens in a background thread, which runs ahead of the consumer
+ by no more than a fixed number of blocks, so a slow consumer can never cause
+ unbounded amounts of audio to pile up in memory. Closing a stream stops
+ rendering as soon as the sound being synthesized is complete.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import Queue
+import sys
+import threading
+
+import transform
+import waveform
+
+_POLL_SECONDS = 0.1 #: How often a blocked thread checks whether it should give up waiting.
+
+class PCMStream(object):
+	"""
+	An iterator over the speech synthesized from a paragraph, as described in
+	this module's documentation.
+	
+	Each block is a C{str} of 16-bit little-endian PCM data, and every block
+	but the last is exactly the requested size.
+	"""
+	_blocks = None #: The Queue.Queue through which blocks pass from the rendering thread.
+	_block_bytes = None #: The number of bytes in every full block.
+	_cancelled = None #: A threading.Event that is set once the stream is closed.
+	_finished = False #: True once every block has been consumed, or the stream is closed.
+	_thread = None #: The thread in which speech is rendered.
+	
+	def __init__(self, paragraph, options, synthesizer=None, language=None, block_samples=4096, max_blocks=16):
+		"""
+		Starts rendering a paragraph in the background.
+		
+		@type paragraph: unicode
+		@param paragraph: The text to be synthesized.
+		@type options: optparse.Values
+		@param options: The options with which synthesis should occur.
+		@type synthesizer: L{parwave.Synthesizer}|None
+		@param synthesizer: The synthesizer to use when rendering sounds; if
+		    omitted, one is created by L{transform.createSynthesizer}. It must
+		    not be used elsewhere until this stream has finished or been closed.
+		@type language: basestring|None
+		@param language: The name of the language ruleset to apply, as described
+		    in L{transform.paragraphToSound}.
+		@type block_samples: int
+		@param block_samples: The number of samples in every full block.
+		@type max_blocks: int
+		@param max_blocks: The number of blocks that may be rendered before they
+		    are consumed.
+		
+		@raise ValueError: If the block size or the number of blocks is not
+		    positive.
+		"""
+		if block_samples <= 0 or max_blocks <= 0:
+			raise ValueError("Blocks must contain samples, and at least one must be buffered.")
+		if synthesizer is None:
+			synthesizer = transform.createSynthesizer(options)
+			
+		self._blocks = Queue.Queue(max_blocks)
+		self._block_bytes = block_samples * 2
+		self._cancelled = threading.Event()
+		self._thread = threading.Thread(target=self._render, args=(transform.paragraphToSound(paragraph, options, synthesizer, language),))
+		self._thread.setDaemon(True) #An abandoned stream mustn't keep the process alive.
+		self._thread.start()
+		
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exception_type, exception, traceback):
+		self.close()
+		
+	def __iter__(self):
+		return self
+		
+	def next(self):
+		"""
+		Provides the next block of speech, waiting for it to be rendered if
+		necessary.
+		
+		@rtype: str
+		@return: The next block of speech, as 16-bit PCM data.
+		
+		@raise StopIteration: If every block has been consumed, or the stream
+		    has been closed.
+		@raise Exception: Any exception raised while rendering, once every block
+		    rendered before it has been consumed.
+		"""
+		if self._finished:
+			raise StopIteration
+		while True:
+			try:
+				block = self._blocks.get(True, _POLL_SECONDS) #A timeout keeps the wait interruptible.
+				break
+			except Queue.Empty:
+				if self._cancelled.isSet(): #Closed elsewhere, so nothing more will arrive.
+					self._finished = True
+					raise StopIteration
+		if isinstance(block, str):
+			return block
+			
+		self._finished = True
+		if block is not None: #The rendering thread failed.
+			(exception_type, exception, traceback) = block
+			raise exception_type, exception, traceback
+		raise StopIteration
+		
+	def close(self):
+		"""
+		Stops rendering as soon as the sound being synthesized is complete, and
+		discards any blocks that have not been consumed.
+		
+		It is safe to call this function multiple times.
+		"""
+		self._cancelled.set()
+		self._finished = True
+		while self._thread.isAlive():
+			try: #Make room, in case the rendering thread is waiting for it.
+				while True:
+					self._blocks.get_nowait()
+			except Queue.Empty:
+				pass
+			self._thread.join(_POLL_SECONDS)
+			
+	def _render(self, sounds):
+		"""
+		Renders speech, dividing it into blocks, until it is complete or the
+		stream is closed; runs in its own thread.
+		
+		The final item queued is None if rendering was complete, or the
+		C{sys.exc_info()} of the exception that stopped it.
+		
+		@type sounds: generator
+		@param sounds: The generator returned by L{transform.paragraphToSound}.
+		"""
+		block_bytes = self._block_bytes #Cache for speed.
+		result = None
+		try:
+			pending = ''
+			for sound in sounds:
+				if self._cancelled.isSet():
+					return
+				pcm = waveform.encodeSamples(sound)
+				if isinstance(pcm, memoryview):
+					pcm = pcm.tobytes()
+				pending += str(pcm)
+				offset = 0
+				while len(pending) - offset >= block_bytes:
+					if not self._put(pending[offset:offset + block_bytes]):
+						return
+					offset += block_bytes
+				pending = pending[offset:]
+			if pending and not self._put(pending):
+				return
+		except Exception:
+			result = sys.exc_info()
+		self._put(result)
+		
+	def _put(self, item):
+		"""
+		Queues an item for the consumer, waiting for room if necessary.
+		
+		@type item: str|tuple|None
+		@param item: A block of speech, or one of the final items described in
+		    L{_render}.
+		
+		@rtype: bool
+		@return: True if the item was queued; False if the stream was closed
+		    first.
+		"""
+		while not self._cancelled.isSet():
+			try:
+				self._blocks.put(item, True, _POLL_SECONDS)
+				return True
+			except Queue.Full:
+				continue
+		return False
+		
\ No newline at end of file
@@ -13,10 +13,16 @@ Legal
  
  (C) Neil Tallim, Sydni Bennie, 2009
 """
+import collections
+import copy
+import itertools
 import re
+import threading
 
+import instrumentation
 import ipa
 import language_rules
+import languages
 import parwave
 import universal_rules
 
@@ -34,44 +40,163 @@ _WORD_QUOTED = 1 #: Identifies a word as being quoted.
 _WORD_EMPHASIZED = 2 #: Identifies a word as being emphasized.
 _WORD_CONTENT = 3 #: Identifies a word as a key content item in a phrase.
 
-def paragraphToSound(paragraph, options, synthesizer):
+_word_cache = collections.OrderedDict() #: The phonemes and parameter-sets of recently transformed words, keyed by everything that determines them, ordered from least- to most-recently-used.
+_word_cache_lock = threading.Lock() #: Held while L{_word_cache} is read or changed, since streams transform paragraphs in several threads at once.
+
+def createSynthesizer(options):
+	"""
+	Creates a synthesizer that uses the engine named by C{options.engine}, with
+	a L{parwave.RenderCache} of C{options.cache_size} megabytes, if non-zero,
+	noise seeded by C{options.seed}, resonator state carried between sounds if
+	C{options.continuous} is set, C{options.rate} samples per second, and its
+	output scaled by C{options.gain} decibels.
+	
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: L{parwave.Synthesizer}
+	@return: A new synthesizer.
+	
+	@raise ImportError: If the engine's dependencies are not available.
+	"""
+	cache = None
+	if options.cache_size:
+		cache = parwave.RenderCache(int(options.cache_size * 1024 * 1024))
+	return parwave.ENGINES[options.engine](cache, options.seed, options.continuous, options.rate, 10 ** (options.gain / 20.0))
+	
+def countParagraphSamples(paragraph, options, language=None):
+	"""
+	Works out how many samples L{paragraphToSound} will produce from a
+	paragraph, as described in L{planParagraph}.
+	
+	@type paragraph: unicode
+	@param paragraph: The text to be measured.
+	@type options: optparse.Values
+	@param options: The options with which synthesis will occur.
+	@type language: basestring|None
+	@param language: The name of the language ruleset to apply, as described
+	    in L{paragraphToSound}.
+	
+	@rtype: int
+	@return: The number of samples the paragraph will produce.
+	
+	@raise ValueError: If the named ruleset does not exist.
+	"""
+	schedule = planParagraph(paragraph, options, language)
+	if not schedule:
+		return 0
+	(parameters, f0_multiplier, start, sample_count) = schedule[-1]
+	return start + sample_count
+	
+def planParagraph(paragraph, options, language=None, start=0):
+	"""
+	Works out everything L{paragraphToSound} will synthesize from a paragraph,
+	and where each sound will fall in its output, by applying every rule but
+	synthesizing nothing.
+	
+	@type paragraph: unicode
+	@param paragraph: The text to be planned.
+	@type options: optparse.Values
+	@param options: The options with which synthesis will occur.
+	@type language: basestring|None
+	@param language: The name of the language ruleset to apply, as described
+	    in L{paragraphToSound}.
+	@type start: int
+	@param start: The index of the sample at which the paragraph begins.
+	
+	@rtype: list
+	@return: A (parameters, f0 multiplier, start, sample count) tuple for every
+	    sound, in order, where parameters and the f0 multiplier are exactly
+	    what L{parwave.Synthesizer.synthesize} will receive, or None for
+	    silence, and start is the index of the sound's first sample. The
+	    parameter-sets may be shared with the word cache, so they must not be
+	    modified.
+	
+	@raise ValueError: If the named ruleset does not exist.
 	"""
-	Transforms a paragraph into a collection of collections of integers,
+	planning_options = copy.copy(options)
+	planning_options.debug = planning_options.verbose = False
+	
+	profiling = instrumentation.enabled
+	if profiling: #Everything done while planning would otherwise be reported twice.
+		clock_start = instrumentation.clock()
+		instrumentation.disable()
+	try:
+		schedule = []
+		for sound in paragraphToSound(paragraph, planning_options, parwave.FramePlanner(options.rate), language):
+			schedule.append((sound.parameters, sound.f0_multiplier, start, sound.sample_count))
+			start += sound.sample_count
+		return schedule
+	finally:
+		if profiling:
+			instrumentation.enable()
+			instrumentation.recordStage('planning', instrumentation.clock() - clock_start)
+			
+def paragraphToSound(paragraph, options, synthesizer=None, language=None):
+	"""
+	Transforms a paragraph into a stream of collections of samples,
 	representing synthesized speech.
 	
+	Each sound is yielded as soon as it has been rendered, so callers can pass
+	it on to a L{waveform.WaveForm} without ever holding the whole paragraph in
+	memory.
+	
 	@type paragraph: unicode
 	@param paragraph: The text to be synthesized.
 	@type options: optparse.Values
 	@param options: The options with which synthesis should occur.
-	@type synthesizer: L{parwave.Synthesizer}
-	@param synthesizer: The synthesizer to use when rendering sounds.
+	@type synthesizer: L{parwave.Synthesizer}|None
+	@param synthesizer: The synthesizer to use when rendering sounds; if
+	    omitted, one is created by L{createSynthesizer}.
+	@type language: basestring|None
+	@param language: The name of the language ruleset to apply, as listed by
+	    L{languages.getLanguageNames}; if omitted, C{options.language} is used,
+	    and if that is None, the default ruleset.
 	
-	@rtype: list
-	@return: A list of tuples containing integers that represent synthesized
-	    speech.
+	@rtype: generator
+	@return: A generator that yields collections of samples that represent
+	    synthesized speech, as returned by L{parwave.Synthesizer.synthesize}.
+	
+	@raise ValueError: If the named ruleset does not exist.
 	"""
+	if language is None:
+		language = options.language
+	language = languages.getLanguage(language)
+	
+	profiling = instrumentation.enabled
+	if profiling:
+		start = instrumentation.clock()
+		
 	tokens = paragraph.split()
 	
 	sentences = []
-	while tokens:
-		(sentence, tokens) = _extractSentence(tokens, len(sentences) + 1)
+	token_index = 0
+	while token_index < len(tokens):
+		(sentence, token_index) = _extractSentence(tokens, token_index, len(sentences) + 1)
 		sentences.append(sentence)
+	if profiling:
+		instrumentation.recordStage('parsing', instrumentation.clock() - start)
+		instrumentation.count('paragraphs')
+		instrumentation.count('sentences', len(sentences))
 	if options.verbose:
 		print "\tParagraph analyzed."
 	if options.debug:
 		print sentences
 		
+	if synthesizer is None:
+		synthesizer = createSynthesizer(options)
+		
 	silent_half_second = synthesizer.generateSilence(500) #Half of a second of silence.
-	sounds = []
 	for (i, sentence) in enumerate(sentences): #Add the sentence, plus a half-second of silence.
-		sounds.append(_sentenceToSound(sentence, i + 1, len(sentences) - i - 1, options, synthesizer))
-		sounds.append(silent_half_second)
-	return sounds
+		synthesizer.resetState() #The silence before it has been reused, rather than regenerated.
+		for sound in _sentenceToSound(sentence, i + 1, len(sentences) - i - 1, options, language, synthesizer):
+			yield sound
+		yield silent_half_second
 	
-def _sentenceToSound(sentence, position, remaining_sentences, options, synthesizer):
+def _sentenceToSound(sentence, position, remaining_sentences, options, language, synthesizer):
 	"""
-	Transforms a sentence into a collections of integers, representing
-	synthesized speech.
+	Transforms a sentence into a stream of collections of samples,
+	representing synthesized speech.
 	
 	@type sentence: tuple(2)
 	@param sentence: A collection of tokens comprising the words in the sentence,
@@ -84,11 +209,14 @@ def _sentenceToSound(sentence, position, remaining_sentences, options, synthesiz
 	    of the paragraph is reached, not including the current sentence.
 	@type options: optparse.Values
 	@param options: The options with which synthesis should occur.
+	@type language: module
+	@param language: The language ruleset to apply.
 	@type synthesizer: L{parwave.Synthesizer}
 	@param synthesizer: The synthesizer to use when rendering sounds.
 	
-	@rtype: tuple
-	@return: A collection of integers that represent synthesized speech.
+	@rtype: generator
+	@return: A generator that yields collections of samples that represent
+	    synthesized speech, as returned by L{parwave.Synthesizer.synthesize}.
 	"""
 	filter_regexp = _FILTER_REGEXP #Cache for efficiency.
 	
@@ -99,14 +227,17 @@ def _sentenceToSound(sentence, position, remaining_sentences, options, synthesiz
 	is_exclamation = _SENTENCE_EXCLAMATION in markup
 	
 	filtered_words = [filter_regexp.sub("", w) for (w, m) in words]
-	sounds = ()
+	word_count = len(words)
+	question_words = getattr(language, 'QUESTION_WORDS', ())
+	follows_question_word = False
 	for (i, word) in enumerate(words):
-		sounds += _wordToSound(word, i + 1, len(words) - i - 1, filtered_words[:i], filtered_words[i + 1:], position, remaining_sentences, is_question, is_exclamation, options, synthesizer)
-	return sounds
+		for sound in _wordToSound(word, i + 1, word_count - i - 1, _SequenceView(filtered_words, 0, i), _SequenceView(filtered_words, i + 1, word_count), position, remaining_sentences, is_question, is_exclamation, follows_question_word, options, language, synthesizer):
+			yield sound
+		follows_question_word = follows_question_word or filtered_words[i] in question_words
 	
-def _wordToSound(word, position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_question, is_exclamation, options, synthesizer):
+def _wordToSound(word, position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_question, is_exclamation, follows_question_word, options, language, synthesizer):
 	"""
-	Transforms a word into a collections of integers, representing
+	Transforms a word into a stream of collections of samples, representing
 	synthesized speech.
 	
 	@type word: tuple(2)
@@ -134,13 +265,19 @@ def _wordToSound(word, position, remaining_words, previous_words, following_word
 	@type is_exclamation: bool
 	@param is_exclamation: True if the current sentence ends with an exclamation
 	    mark.
+	@type follows_question_word: bool
+	@param follows_question_word: True if any of C{previous_words} is one of the
+	    language's question-words.
 	@type options: optparse.Values
 	@param options: The options with which synthesis should occur.
+	@type language: module
+	@param language: The language ruleset to apply.
 	@type synthesizer: L{parwave.Synthesizer}
 	@param synthesizer: The synthesizer to use when rendering sounds.
 	
-	@rtype: tuple
-	@return: A collection of integers that represent synthesized speech.
+	@rtype: generator
+	@return: A generator that yields collections of samples that represent
+	    synthesized speech, as returned by L{parwave.Synthesizer.synthesize}.
 	"""
 	(token, markup) = word
 	
@@ -154,40 +291,76 @@ def _wordToSound(word, position, remaining_words, previous_words, following_word
 	is_emphasized = _WORD_EMPHASIZED in markup
 	is_content = _WORD_CONTENT in markup
 	
-	ipa_tokens = ipa.reduceIPAClusters(token)
-	phonemes = []
-	subject = ipa_tokens[0]
-	duration_multiplier = pitch_multiplier = 1.0
-	#For each character in the token, post-IPA-reduction, collapse extension syntax into the multiplier associated with the last-seen character.
-	for i in ipa_tokens[1:]:
-		if i == u'>':
-			duration_multiplier *= 1.5
-		elif i == u'<':
-			duration_multiplier *= 0.5
-		elif i == u'+':
-			pitch_multiplier *= 0.95
-		elif i == u'-':
-			pitch_multiplier *= 1.05
-		else:
-			phonemes.append((subject, duration_multiplier, pitch_multiplier))
-			subject = i
-			duration_multiplier = pitch_multiplier = 1.0
-	phonemes.append((subject, duration_multiplier, pitch_multiplier))
-	
+	profiling = instrumentation.enabled
+	if profiling:
+		instrumentation.count('words')
+		
+	#Words whose rules read the same things are transformed identically, so their parameter-sets can be reused.
+	key = entry = None
+	if options.word_cache_size:
+		word_context = language_rules.PhonemeContext(None, (), (), position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word)
+		features = language_rules.getWordFeatures(word_context, language)
+		if features is not None:
+			last_character = None
+			if previous_words: #Read by universal_rules.bridgeWords.
+				last_character = previous_words[-1][-1]
+			key = (language, token, is_quoted, is_emphasized, is_content, last_character, features)
+			_word_cache_lock.acquire()
+			try:
+				entry = _word_cache.pop(key, None)
+				if entry is not None:
+					_word_cache[key] = entry #Mark it as recently used.
+			finally:
+				_word_cache_lock.release()
+			if profiling:
+				instrumentation.count(entry is None and 'word cache misses' or 'word cache hits')
+				
+	if entry is None:
+		if profiling:
+			start = instrumentation.clock()
+		phonemes = _reduceWord(token)
+		if profiling:
+			instrumentation.recordStage('ipa reduction', instrumentation.clock() - start)
+	else:
+		(phonemes, phoneme_parameters) = entry
+		
 	if options.verbose:
 		print u"\tSynthesizing '%s'..." % (u''.join([phoneme for (phoneme, duration_multiplier, pitch_multiplier) in phonemes]))
 		
-	sounds = ()
-	for (i, phoneme) in enumerate(phonemes):
-		sounds += _phonemeToSound(phoneme, [p for (p, d, t) in phonemes[:i]], [p for (p, d, t) in phonemes[i + 1:]], position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, options, synthesizer)
+	if key is None:
+		ipa_characters = [p for (p, d, t) in phonemes]
+		phoneme_count = len(phonemes)
+		for (i, phoneme) in enumerate(phonemes):
+			for sound in _phonemeToSound(phoneme, _SequenceView(ipa_characters, 0, i), _SequenceView(ipa_characters, i + 1, phoneme_count), position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word, options, language, synthesizer):
+				yield sound
+	else:
+		if entry is None:
+			ipa_characters = [p for (p, d, t) in phonemes]
+			phoneme_count = len(phonemes)
+			phoneme_parameters = []
+			for (i, phoneme) in enumerate(phonemes):
+				(context, parameters_list, f0_multipliers) = _phonemeToParameters(phoneme, _SequenceView(ipa_characters, 0, i), _SequenceView(ipa_characters, i + 1, phoneme_count), position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word, language)
+				phoneme_parameters.append((parameters_list, f0_multipliers))
+			_word_cache_lock.acquire()
+			try:
+				_word_cache[key] = (phonemes, phoneme_parameters)
+				while len(_word_cache) > options.word_cache_size:
+					_word_cache.popitem(False)
+			finally:
+				_word_cache_lock.release()
+				
+		word_multiplier = language_rules.getWordMultiplier(word_context, language)
+		for (phoneme, (parameters_list, f0_multipliers)) in zip(phonemes, phoneme_parameters):
+			for sound in _parametersToSound(phoneme, parameters_list, f0_multipliers, word_multiplier, options, synthesizer):
+				yield sound
+				
 	if terminal_pause: #Add a quarter of a second of silence.
-		sounds += synthesizer.generateSilence(250)
-	return sounds
+		yield synthesizer.generateSilence(250)
 	
-def _phonemeToSound(phoneme, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, options, synthesizer):
+def _phonemeToSound(phoneme, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word, options, language, synthesizer):
 	"""
-	Transforms a phoneme into a collections of integers, representing
-	synthesized speech.
+	Transforms a phoneme into a stream of collections of samples,
+	representing synthesized speech.
 	
 	@type phoneme: tuple(3)
 	@param phoneme: The IPA character being processed, plus the phoneme's
@@ -227,16 +400,42 @@ def _phonemeToSound(phoneme, preceding_phonemes, following_phonemes, word_positi
 	@type is_exclamation: bool
 	@param is_exclamation: True if the current sentence ends with an exclamation
 	    mark.
+	@type follows_question_word: bool
+	@param follows_question_word: True if any of C{previous_words} is one of the
+	    language's question-words.
 	@type options: optparse.Values
 	@param options: The options with which synthesis should occur.
+	@type language: module
+	@param language: The language ruleset to apply.
 	@type synthesizer: L{parwave.Synthesizer}
 	@param synthesizer: The synthesizer to use when rendering sounds.
 	
-	@rtype: tuple
-	@return: A collection of integers that represent synthesized speech.
+	@rtype: generator
+	@return: A generator that yields collections of samples that represent
+	    synthesized speech, as returned by L{parwave.Synthesizer.synthesize}.
+	"""
+	(context, parameters_list, f0_multipliers) = _phonemeToParameters(phoneme, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word, language)
+	word_multiplier = language_rules.getWordMultiplier(context, language)
+	return _parametersToSound(phoneme, parameters_list, f0_multipliers, word_multiplier, options, synthesizer)
+	
+def _phonemeToParameters(phoneme, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word, language):
+	"""
+	Applies every universal and language-specific rule to a phoneme, producing
+	the parameter-sets from which it will be synthesized.
+	
+	All arguments are as described for L{_phonemeToSound}.
+	
+	@rtype: tuple(3)
+	@return: The L{language_rules.PhonemeContext} the rules were given, a
+	    list of parameter-sets, and an equal-length list of the f0 multipliers
+	    the rules assigned to them.
 	"""
 	(ipa_character, duration_multiplier, pitch_multiplier) = phoneme
 	
+	profiling = instrumentation.enabled
+	if profiling:
+		start = instrumentation.clock()
+		
 	#Retrieve synthesis parameters.
 	(parameters, regions) = ipa.IPA_DATA[ipa_character]
 	
@@ -255,32 +454,119 @@ def _phonemeToSound(phoneme, preceding_phonemes, following_phonemes, word_positi
 	#Apply contour-shaping.
 	parameters_list = universal_rules.shapeContours(ipa_character, preceding_phonemes, following_phonemes, parameters_list)
 	
+	if profiling:
+		now = instrumentation.clock()
+		instrumentation.recordStage('universal rules', now - start)
+		start = now
+		
 	#Apply language-specific rules to the parameters.
-	(parameters_list, f0_multipliers) = language_rules.applyRules(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, parameters_list)
+	context = language_rules.PhonemeContext(ipa_character, preceding_phonemes, following_phonemes, word_position, remaining_words, previous_words, following_words, sentence_position, remaining_sentences, is_quoted, is_emphasized, is_content, is_question, is_exclamation, follows_question_word)
+	(parameters_list, f0_multipliers) = language_rules.applyRules(context, parameters_list, language)
+	
+	if profiling:
+		instrumentation.recordStage('language rules', instrumentation.clock() - start)
+	return (context, parameters_list, f0_multipliers)
+	
+def _parametersToSound(phoneme, parameters_list, f0_multipliers, word_multiplier, options, synthesizer):
+	"""
+	Synthesizes the parameter-sets produced from a phoneme.
+	
+	@type phoneme: tuple(3)
+	@param phoneme: The IPA character being processed, plus the phoneme's
+	    duration multiplier and pitch multiplier.
+	@type parameters_list: sequence
+	@param parameters_list: The parameter-sets to synthesize, which are not
+	    altered.
+	@type f0_multipliers: sequence
+	@param f0_multipliers: The f0 multiplier the rules assigned to each
+	    parameter-set.
+	@type word_multiplier: float
+	@param word_multiplier: The f0 multiplier the rules assigned to the whole
+	    word, as returned by L{language_rules.getWordMultiplier}.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	@type synthesizer: L{parwave.Synthesizer}
+	@param synthesizer: The synthesizer to use when rendering sounds.
+	
+	@rtype: generator
+	@return: A generator that yields collections of samples that represent
+	    synthesized speech, as returned by L{parwave.Synthesizer.synthesize}.
+	"""
+	(ipa_character, duration_multiplier, pitch_multiplier) = phoneme
 	
+	profiling = instrumentation.enabled
+	if profiling:
+		samples = 0
+		
 	#Synthesize sound.
-	sounds = ()
 	for (parameters, f0_multiplier) in zip(parameters_list, f0_multipliers):
 		if options.debug:
 			print parameters
-		sounds += synthesizer.synthesize(parameters, f0_multiplier * pitch_multiplier, options.turbo)
-	return sounds
+		if profiling:
+			start = instrumentation.clock()
+		sound = synthesizer.synthesize(parameters, f0_multiplier * word_multiplier * pitch_multiplier, options.turbo)
+		if profiling:
+			instrumentation.recordStage('synthesis', instrumentation.clock() - start)
+			samples += len(sound)
+		yield sound
+		
+	if profiling:
+		instrumentation.recordPhoneme(ipa_character, len(parameters_list), samples)
+		
+def _reduceWord(token):
+	"""
+	Breaks a word into phonemes, collapsing extension syntax into the duration
+	and pitch multipliers of the phoneme it follows.
 	
-def _extractSentence(tokens, sentence_number):
+	@type token: unicode
+	@param token: The word, without markup or punctuation.
+	
+	@rtype: list
+	@return: A list of (IPA character, duration multiplier, pitch multiplier)
+	    tuples, in order.
+	"""
+	ipa_tokens = ipa.reduceIPAClusters(token)
+	phonemes = []
+	subject = ipa_tokens[0]
+	duration_multiplier = pitch_multiplier = 1.0
+	#For each character in the token, post-IPA-reduction, collapse extension syntax into the multiplier associated with the last-seen character.
+	for i in ipa_tokens[1:]:
+		if i == u'>':
+			duration_multiplier *= 1.5
+		elif i == u'<':
+			duration_multiplier *= 0.5
+		elif i == u'+':
+			pitch_multiplier *= 0.95
+		elif i == u'-':
+			pitch_multiplier *= 1.05
+		else:
+			phonemes.append((subject, duration_multiplier, pitch_multiplier))
+			subject = i
+			duration_multiplier = pitch_multiplier = 1.0
+	phonemes.append((subject, duration_multiplier, pitch_multiplier))
+	return phonemes
+	
+def _extractSentence(tokens, token_index, sentence_number):
 	"""
 	Reads through the token stream to assemble the next sentence, applying
 	context evaluation to its elements along the way.
 	
-	@type tokens: list
-	@param tokens: A list of all tokens remaining in the input data.
+	The token stream is never modified; a paragraph is consumed by passing the
+	returned index back in until every token has been read, so parsing takes
+	time proportional to the number of tokens.
+	
+	@type tokens: sequence
+	@param tokens: A list of all tokens in the input data.
+	@type token_index: int
+	@param token_index: The index of the first token in the sentence.
 	@type sentence_number: int
 	@param sentence_number: The position of this sentence within its containing
 	    paragraph.
 	
 	@rtype: tuple(2)
 	@return: A tuple containing every token that forms a word in the extracted
-	    sentence, plus flags that describe the sentence's nature, and a list of
-	    all remaining tokens that form successive sentences.
+	    sentence, plus flags that describe the sentence's nature, and the index
+	    of the first token of the next sentence.
 	"""
 	#Cache commonly-referenced variables in the local scope for efficiency.
 	word_regexp = _WORD_REGEXP
@@ -293,8 +579,10 @@ def _extractSentence(tokens, sentence_number):
 	
 	quotation = False
 	emphasis = False
-	while tokens:
-		token = tokens.pop(0) #Get the first token remaining in the queue.
+	token_count = len(tokens)
+	while token_index < token_count:
+		token = tokens[token_index] #Get the first token remaining in the stream.
+		token_index += 1
 		match = word_regexp.match(token) #Break the token into its component elements.
 		if not match:
 			raise ValueError(u"Invalid character in word %i, sentence %i." % (len(words) + 1, sentence_number))
@@ -334,5 +622,80 @@ def _extractSentence(tokens, sentence_number):
 				markup.append(_SENTENCE_QUESTION)
 			markup.append(_SENTENCE_EXCLAMATION)
 			break
-	return ((tuple(words), tuple(markup)), tokens)
-	
\ No newline at end of file
+	return ((tuple(words), tuple(markup)), token_index)
+	
+class _SequenceView(object):
+	"""
+	A read-only window onto a contiguous part of a list, which behaves like the
+	equivalent slice, but is created in constant time, without copying.
+	
+	Rules receive these as their collections of preceding and following
+	phonemes and words, so building each phoneme's context doesn't grow with
+	the length of its word or sentence. The underlying list must not be
+	modified while views of it are in use.
+	"""
+	__slots__ = ('_items', '_start', '_stop')
+	__hash__ = None #: Like lists, views are mutable in principle, so they aren't hashable.
+	
+	def __init__(self, items, start, stop):
+		"""
+		Creates a view of items[start:stop].
+		
+		@type items: list
+		@param items: The list being viewed.
+		@type start: int
+		@param start: The index of the first item in the view.
+		@type stop: int
+		@param stop: The index after the last item in the view.
+		"""
+		self._items = items
+		self._start = start
+		self._stop = stop
+		
+	def __add__(self, other):
+		return list(self) + list(other)
+		
+	def __contains__(self, item):
+		for i in self:
+			if i == item:
+				return True
+		return False
+		
+	def __eq__(self, other):
+		try:
+			return list(self) == list(other)
+		except TypeError:
+			return False
+			
+	def __getitem__(self, index):
+		length = self._stop - self._start
+		if isinstance(index, slice):
+			(start, stop, step) = index.indices(length)
+			if step == 1:
+				return _SequenceView(self._items, self._start + start, self._start + max(start, stop))
+			return self._items[self._start:self._stop][index]
+			
+		if index < 0:
+			index += length
+		if not 0 <= index < length:
+			raise IndexError("Index out of range.")
+		return self._items[self._start + index]
+		
+	def __iter__(self):
+		return itertools.islice(self._items, self._start, self._stop)
+		
+	def __len__(self):
+		return self._stop - self._start
+		
+	def __ne__(self, other):
+		return not self == other
+		
+	def __nonzero__(self):
+		return self._stop > self._start
+		
+	def __radd__(self, other):
+		return list(other) + list(self)
+		
+	def __repr__(self):
+		return repr(list(self))
+		
\ No newline at end of file
@@ -5,7 +5,15 @@ CPSC 599 module: klatt
 Purpose
 =======
  Provides a convenient wrapper for writing waveform data.
+
+ Speech may be written sequentially to a wavefile, to headerless 16-bit or
+ 32-bit floating-point data in a file or pipe, or to memory, through the
+ subclasses of L{Sink}; or written in any order to a memory-mapped wavefile.
  
+ Synthesizers produce floating-point samples on the scale of 16-bit integers;
+ they are quantized, and clipped to the 16-bit range, only as they are
+ written, in a single vectorized pass, which may also apply L{Dither}.
+
 Legal
 =====
  All code, unless otherwise indicated, is original, and subject to the
@@ -13,54 +21,609 @@ Legal
  
  (C) Neil Tallim, 2009
 """
+import array
+import math
+import mmap
+import os
+import random
 import struct
+import sys
 import wave
+import zlib
+
+import instrumentation
+
+try:
+	import numpy
+except ImportError: #NumPy arrays are simply never encountered without it.
+	numpy = None
+	
+_BIG_ENDIAN = sys.byteorder == 'big' #: True if native samples must be byte-swapped, since wavefiles are little-endian.
+_BLOCK_BYTES = 65536 #: The amount of encoded data a L{Sink} accumulates before writing it.
+_FLOAT_TYPECODES = ('f', 'd') #: The typecodes of array.array instances that hold floating-point samples.
+_HEADER_BYTES = 44 #: The size of the header that precedes the samples in a 16-bit mono PCM wavefile.
 
-class WaveForm(object):
+class Sink(object):
+	"""
+	The base of every destination to which synthesized speech may be written
+	sequentially; on its own, it writes 16-bit little-endian PCM data to any
+	object with a C{write} method.
+	
+	Samples are encoded as they are added, but held in memory until at least
+	L{_BLOCK_BYTES} have accumulated, so that the destination sees a small
+	number of large writes, however finely speech is divided as it is
+	synthesized.
+	"""
+	_dither = None #: The L{Dither} applied as floating-point samples are quantized, if any.
+	_finalized = False #: True when this sink has been closed.
+	_pending = None #: A bytearray of encoded data not yet written.
+	_stream = None #: The object to which encoded data is written, unless L{_write} is overridden.
+	
+	def __init__(self, stream=None, dither=None):
+		"""
+		Prepares the sink to accumulate data.
+		
+		@type stream: file|None
+		@param stream: The object to which encoded data is written, through its
+		    C{write} method; it is left open when the sink is closed. Subclasses
+		    that override L{_write} pass None.
+		@type dither: L{Dither}|None
+		@param dither: The dither applied as floating-point samples are
+		    quantized; if None, they are truncated.
+		"""
+		self._stream = stream
+		self._dither = dither
+		self._pending = bytearray()
+		
+	def addSamples(self, samples):
+		"""
+		Adds an arbitrary number of samples to the sink.
+		
+		Floating-point samples, in an C{array.array('f')} or C{array.array('d')}
+		or a NumPy floating-point array, as produced by L{parwave.Synthesizer},
+		are quantized as described in L{encodeSamples}. An C{array.array('h')},
+		a NumPy integer array, or any object exposing 16-bit PCM through the
+		buffer protocol, like C{str} or C{bytearray}, is encoded in a single
+		operation; any other sequence is converted to an C{array.array('h')}
+		first.
+		
+		@type samples: sequence|buffer
+		@param samples: A collection of samples on the scale of 16-bit signed
+		    integers. (-32768-32767)
+		
+		@raise IOError: If the sink cannot be written to, either because the
+		    disk is full or the sink has been closed.
+		@raise OverflowError: If a sample value is not in the acceptable integer
+		    range.
+		"""
+		if self._finalized:
+			raise IOError("The waveform has already been finalized.")
+		if instrumentation.enabled:
+			start = instrumentation.clock()
+			
+		data = self._encode(samples)
+		if not self._pending and len(data) >= _BLOCK_BYTES: #Large enough to be written without being copied.
+			self._write(data)
+		else:
+			self._pending += data
+			if len(self._pending) >= _BLOCK_BYTES:
+				self._flush()
+				
+		if instrumentation.enabled:
+			instrumentation.recordStage('encoding', instrumentation.clock() - start)
+			
+	def close(self):
+		"""
+		Writes any data still held in memory and releases the destination.
+		
+		It is safe to call this function multiple times.
+		"""
+		if not self._finalized:
+			try:
+				self._flush()
+			finally:
+				self._finalized = True
+				self._finish()
+				
+	def _encode(self, samples):
+		"""
+		Converts samples into the data written to the destination.
+		
+		@type samples: sequence|buffer
+		@param samples: A collection of samples, as described in L{addSamples}.
+		
+		@rtype: buffer
+		@return: The encoded samples; 16-bit little-endian PCM unless
+		    overridden.
+		"""
+		return encodeSamples(samples, self._dither)
+		
+	def _flush(self):
+		"""
+		Writes any data held in memory to the destination.
+		"""
+		if self._pending:
+			(pending, self._pending) = (self._pending, bytearray())
+			self._write(pending)
+			
+	def _write(self, data):
+		"""
+		Writes encoded data to the destination.
+		
+		@type data: buffer
+		@param data: The data to be written.
+		
+		@raise IOError: If the data cannot be written.
+		"""
+		self._stream.write(data)
+		
+	def _finish(self):
+		"""
+		Releases the destination, once everything has been written to it.
+		"""
+		if self._stream is not None and hasattr(self._stream, 'flush'):
+			self._stream.flush()
+		
+		
+class WaveForm(Sink):
 	"""
 	Provides an interface for dumping 16-bit signed integer data into a wavefile.
 	"""
-	_finalized = False #: True when this file has been closed.
 	_wavefile = None #: The file into which wave data will be written.
 	
-	def __init__(self, filename):
+	def __init__(self, filename, sample_rate=10000, dither=None):
 		"""
-		Opens a wavefile and prepares it to receive data at 10,000Hz.
+		Opens a wavefile and prepares it to receive data at the given rate.
 		
 		@type filename: basestring
 		@param filename: The path to the wavefile to be written.
+		@type sample_rate: int
+		@param sample_rate: The number of frames per second, which must match
+		    the rate at which samples were synthesized.
+		@type dither: L{Dither}|None
+		@param dither: The dither applied as samples are quantized, as
+		    described in L{Sink.__init__}.
 		
 		@raise IOError: If the specified file cannot be opened for writing.
 		"""
+		Sink.__init__(self, None, dither)
 		self._wavefile = wave.open(filename, 'wb')
 		self._wavefile.setnchannels(1) #Mono.
 		self._wavefile.setsampwidth(2) #16-bit.
-		self._wavefile.setframerate(10000) #10000 frames per second.
+		self._wavefile.setframerate(sample_rate)
+		
+	def _write(self, data):
+		self._wavefile.writeframesraw(data) #The header is patched once, on close.
+		
+	def _finish(self):
+		"""
+		Closes the wavefile, thereby finalizing its header and making it possible
+		for conventional playback/analysis software to access its contents.
+		"""
+		self._wavefile.close()
+		
+		
+class RawSink(Sink):
+	"""
+	Provides an interface for writing headerless 16-bit little-endian PCM data
+	to a file, an open file object, or a file descriptor, such as that of a
+	pipe.
+	"""
+	_close_target = False #: True if the target was opened by this sink, and must be closed with it.
+	_fd = None #: The file descriptor being written, if one was given.
+	
+	def __init__(self, target, dither=None):
+		"""
+		Prepares the sink to write to its target.
+		
+		@type target: basestring|int|file
+		@param target: The path of a file to be created, replacing any existing
+		    file; a file descriptor; or a file object open for binary writing.
+		    Descriptors and file objects are left open when the sink is closed.
+		@type dither: L{Dither}|None
+		@param dither: The dither applied as samples are quantized, as
+		    described in L{Sink.__init__}.
+		
+		@raise IOError: If the specified file cannot be opened for writing.
+		"""
+		if isinstance(target, basestring):
+			Sink.__init__(self, open(target, 'wb'), dither)
+			self._close_target = True
+		elif isinstance(target, (int, long)):
+			Sink.__init__(self, None, dither)
+			self._fd = target
+		else:
+			Sink.__init__(self, target, dither)
+			
+	def _write(self, data):
+		if self._fd is None:
+			Sink._write(self, data)
+			return
+			
+		data = memoryview(data)
+		try:
+			while data: #A pipe may accept less than everything at once.
+				data = data[os.write(self._fd, data):]
+		except OSError, e:
+			raise IOError(e.errno, e.strerror)
+			
+	def _finish(self):
+		"""
+		Flushes or closes the target.
+		"""
+		if self._close_target:
+			self._stream.close()
+		else:
+			Sink._finish(self)
+				
+				
+class Float32Sink(RawSink):
+	"""
+	Provides an interface for writing headerless 32-bit little-endian
+	floating-point data, with full scale at -1.0 and 1.0, to the same targets
+	as L{RawSink}.
+	
+	Floating-point samples are only rescaled, never quantized or clipped, so
+	any dither is ignored.
+	"""
+	def _encode(self, samples):
+		if not _isFloat(samples): #16-bit samples, like those of a cached render.
+			pcm = _toString(encodeSamples(samples))
+			if numpy is not None:
+				samples = numpy.frombuffer(pcm, '<i2')
+			else:
+				samples = array.array('h')
+				samples.fromstring(pcm)
+				if _BIG_ENDIAN:
+					samples.byteswap()
+		if numpy is not None:
+			if isinstance(samples, array.array):
+				samples = numpy.frombuffer(samples, samples.typecode) #The typecodes match NumPy's.
+			return (samples / numpy.float32(32768)).astype('<f4').tostring()
+			
+		samples = array.array('f', [sample / 32768.0 for sample in samples])
+		if _BIG_ENDIAN:
+			samples.byteswap()
+		return samples.tostring()
+		
+		
+class BufferSink(Sink):
+	"""
+	Provides an interface for collecting 16-bit little-endian PCM data in
+	memory, for callers that want speech without writing it anywhere.
+	"""
+	_buffer = None #: The bytearray holding every sample written.
+	
+	def __init__(self, dither=None):
+		"""
+		Prepares an empty buffer.
+		
+		@type dither: L{Dither}|None
+		@param dither: The dither applied as samples are quantized, as
+		    described in L{Sink.__init__}.
+		"""
+		Sink.__init__(self, None, dither)
+		self._buffer = bytearray()
+		
+	def getPCM(self):
+		"""
+		Provides every sample added so far.
+		
+		@rtype: bytearray
+		@return: The buffer's contents, as 16-bit little-endian PCM data; it
+		    continues to grow as samples are added.
+		"""
+		self._flush()
+		return self._buffer
+		
+	def _write(self, data):
+		self._buffer += data
+		
+		
+class Dither(object):
+	"""
+	A seedable source of triangular dither, spanning one 16-bit step either
+	side of zero, which is added to floating-point samples before they are
+	rounded, so that quantization error becomes a constant, faint hiss rather
+	than distortion that follows the signal.
+	
+	NumPy's RandomState is used if it is available; otherwise, a private
+	random.Random instance is used.
+	"""
+	_generator = None #: The random number generator.
+	
+	def __init__(self, seed=None):
+		"""
+		Prepares a generator.
+		
+		@type seed: hashable|None
+		@param seed: Any value whose repr() is stable, like an integer or a tuple
+		    of integers; if None, the generator is seeded unpredictably.
+		"""
+		if seed is not None:
+			seed = zlib.crc32(repr(seed)) & 0xffffffff
+		if numpy is None:
+			self._generator = random.Random(seed)
+		else:
+			self._generator = numpy.random.RandomState(seed)
+			
+	def getNoise(self, count):
+		"""
+		Generates a series of dither values between -1.0 and 1.0.
+		
+		@type count: int
+		@param count: The number of values to generate.
+		
+		@rtype: numpy.ndarray|list
+		@return: The generated values; a NumPy array, if NumPy is available.
+		"""
+		if numpy is None:
+			uniform = self._generator.random #Cache for speed.
+			return [uniform() - uniform() for i in xrange(count)]
+		return self._generator.random_sample(count) - self._generator.random_sample(count)
+		
+		
+class MappedWaveForm(object):
+	"""
+	Provides an interface for writing 16-bit signed integer data into a
+	wavefile whose length is known in advance, through a memory-mapped view of
+	the file.
+	
+	Since every sample has a fixed place in the file, any number of processes
+	may open the same wavefile and write their own parts of it, in any order;
+	anything left unwritten is silence.
+	"""
+	_finalized = False #: True when this file has been closed.
+	_file = None #: The wavefile being written.
+	_map = None #: The memory-mapped view of the wavefile, header included.
+	_position = 0 #: The sample at which L{addSamples} writes next.
+	_sample_count = None #: The number of samples the wavefile holds.
+	
+	def __init__(self, filename, sample_rate=10000, sample_count=0, create=True):
+		"""
+		Opens a wavefile, preallocating room for every sample it will hold.
+		
+		@type filename: basestring
+		@param filename: The path to the wavefile to be written.
+		@type sample_rate: int
+		@param sample_rate: The number of frames per second, which must match
+		    the rate at which samples were synthesized.
+		@type sample_count: int
+		@param sample_count: The number of samples the wavefile will hold.
+		@type create: bool
+		@param create: True to create the wavefile, replacing any existing
+		    file; False to open one already created by another instance, with
+		    the same sample count, so that part of it may be written.
+		
+		@raise IOError: If the specified file cannot be opened for writing, or,
+		    if not being created, if it does not hold sample_count samples.
+		"""
+		size = _HEADER_BYTES + sample_count * 2
+		if create:
+			self._file = open(filename, 'w+b')
+			try:
+				self._file.write(getHeader(sample_rate, sample_count))
+				self._file.truncate(size) #Sparse where the filesystem allows it; unwritten samples read as silence.
+			except:
+				self._file.close()
+				raise
+		else:
+			self._file = open(filename, 'r+b')
+			self._file.seek(0, 2)
+			if self._file.tell() != size:
+				self._file.close()
+				raise IOError("'%s' does not hold %i samples." % (filename, sample_count))
+		try:
+			self._map = mmap.mmap(self._file.fileno(), size)
+		except (EnvironmentError, mmap.error), e:
+			self._file.close()
+			raise IOError(str(e))
+		self._sample_count = sample_count
 		
 	def addSamples(self, samples):
 		"""
-		Adds an arbitrary number of integers to the wavefile.
+		Writes an arbitrary number of integers to the wavefile, immediately after
+		those last added.
 		
-		@type samples: sequence
-		@param samples: A collection of 16-bit signed integers. (-32768-32767)
+		@type samples: sequence|buffer
+		@param samples: A collection of 16-bit signed integers, as described in
+		    L{WaveForm.addSamples}.
 		
-		@raise IOError: If the wavefile cannot be written to, either because the
-		    disk is full or the wavefile has been closed.
-		@raise struct.error: If a sample value is not in the acceptable integer
+		@raise IOError: If the wavefile has been closed.
+		@raise OverflowError: If a sample value is not in the acceptable integer
 		    range.
+		@raise ValueError: If the samples do not fit in the wavefile.
+		"""
+		self._position += self.writeSamples(self._position, samples)
+		
+	def writeSamples(self, offset, samples):
+		"""
+		Writes an arbitrary number of integers to the wavefile, at a specific
+		position.
+		
+		@type offset: int
+		@param offset: The index of the sample at which writing begins.
+		@type samples: sequence|buffer
+		@param samples: A collection of 16-bit signed integers, as described in
+		    L{WaveForm.addSamples}.
+		
+		@rtype: int
+		@return: The number of samples written.
+		
+		@raise IOError: If the wavefile has been closed.
+		@raise OverflowError: If a sample value is not in the acceptable integer
+		    range.
+		@raise ValueError: If the samples do not fit in the wavefile.
 		"""
 		if self._finalized:
 			raise IOError("The waveform has already been finalized.")
-		self._wavefile.writeframes(''.join([struct.pack('h', sample) for sample in samples]))
+		if instrumentation.enabled:
+			start = instrumentation.clock()
+			
+		pcm = _toString(encodeSamples(samples)) #Slice-assignment accepts nothing else.
+		sample_count = len(pcm) // 2
+		if offset < 0 or offset + sample_count > self._sample_count:
+			raise ValueError("Samples %i-%i do not fit in a wavefile of %i samples." % (offset, offset + sample_count, self._sample_count))
+		position = _HEADER_BYTES + offset * 2
+		self._map[position:position + len(pcm)] = pcm
+		
+		if instrumentation.enabled:
+			instrumentation.recordStage('encoding', instrumentation.clock() - start)
+		return sample_count
+		
+	def getPCM(self):
+		"""
+		Provides every sample in the wavefile.
+		
+		@rtype: buffer
+		@return: The wavefile's contents, as 16-bit little-endian PCM data,
+		    valid only until the wavefile is closed.
+		"""
+		return buffer(self._map, _HEADER_BYTES)
+		
+	def getSampleCount(self):
+		"""
+		Provides the number of samples the wavefile holds.
+		
+		@rtype: int
+		@return: The number of samples the wavefile holds.
+		"""
+		return self._sample_count
 		
 	def close(self):
 		"""
-		Closes the wavefile, thereby finalizing its header and making it possible
-		for conventional playback/analysis software to access its contents.
+		Writes any changes still in memory to the wavefile and closes it.
 		
 		It is safe to call this function multiple times.
 		"""
 		if not self._finalized:
-			self._wavefile.close()
-			self._finalized = True
-			
\ No newline at end of file
+			try:
+				self._map.flush()
+				self._map.close()
+			finally:
+				self._file.close()
+				self._finalized = True
+				
+				
+def getHeader(sample_rate, sample_count):
+	"""
+	Builds the header of a 16-bit mono PCM wavefile, exactly as the C{wave}
+	module writes it, so that a wavefile can be produced without seeking.
+	
+	@type sample_rate: int
+	@param sample_rate: The number of frames per second.
+	@type sample_count: int
+	@param sample_count: The number of samples that will follow the header.
+	
+	@rtype: str
+	@return: The header, which is always L{_HEADER_BYTES} long.
+	"""
+	return struct.pack('<4sL4s4sLHHLLHH4sL',
+	 'RIFF', _HEADER_BYTES - 8 + sample_count * 2, 'WAVE',
+	 'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16, #PCM, mono, 16-bit.
+	 'data', sample_count * 2
+	)
+	
+def encodeSamples(samples, dither=None):
+	"""
+	Converts a collection of samples into little-endian 16-bit PCM data.
+	
+	This is the only place floating-point samples are quantized: each is
+	truncated towards zero, or, if dithered, rounded to the nearest integer,
+	and clipped to the 16-bit range, in one vectorized pass, if NumPy is
+	available.
+	
+	@type samples: sequence|buffer
+	@param samples: A collection of samples, as described in
+	    L{Sink.addSamples}.
+	@type dither: L{Dither}|None
+	@param dither: The dither added to floating-point samples before they are
+	    quantized, if any.
+	
+	@rtype: buffer
+	@return: The encoded samples.
+	
+	@raise OverflowError: If an integer sample value is not in the acceptable
+	    range.
+	"""
+	if numpy is not None:
+		if isinstance(samples, array.array) and samples.typecode in _FLOAT_TYPECODES:
+			samples = numpy.frombuffer(samples, samples.typecode) #The typecodes match NumPy's.
+		if isinstance(samples, numpy.ndarray):
+			if samples.dtype.kind == 'f':
+				if dither is not None:
+					samples = numpy.floor(samples + dither.getNoise(len(samples)) + 0.5)
+				samples = numpy.clip(samples, -32768.0, 32767.0)
+			elif samples.dtype != numpy.int16 and samples.size and (samples.min() < -32768 or samples.max() > 32767): #astype() would wrap them silently.
+				raise OverflowError("Samples must lie between -32768 and 32767.")
+			return samples.astype('<i2', copy=False).tostring()
+	if isinstance(samples, (str, bytearray, buffer, memoryview)): #Already PCM data.
+		return samples
+		
+	if _isFloat(samples):
+		samples = _quantize(samples, dither)
+		
+	if _BIG_ENDIAN or not isinstance(samples, array.array) or samples.typecode != 'h': #Never byte-swap the caller's data.
+		samples = array.array('h', samples)
+	if _BIG_ENDIAN:
+		samples.byteswap()
+	return samples.tostring()
+	
+def _toString(data):
+	"""
+	Copies encoded data into a C{str}, unless it already is one.
+	
+	@type data: buffer
+	@param data: The data to be copied, as returned by L{encodeSamples}.
+	
+	@rtype: str
+	@return: The data, as a C{str}.
+	"""
+	if isinstance(data, str):
+		return data
+	if isinstance(data, memoryview): #str() would describe it instead.
+		return data.tobytes()
+	return str(data)
+	
+def _isFloat(samples):
+	"""
+	Indicates whether a collection of samples holds floating-point values that
+	have yet to be quantized.
+	
+	@type samples: sequence|buffer
+	@param samples: A collection of samples, as described in
+	    L{Sink.addSamples}.
+	
+	@rtype: bool
+	@return: True if the samples are floating-point values.
+	"""
+	if isinstance(samples, array.array):
+		return samples.typecode in _FLOAT_TYPECODES
+	return numpy is not None and isinstance(samples, numpy.ndarray) and samples.dtype.kind == 'f'
+	
+def _quantize(samples, dither):
+	"""
+	Quantizes floating-point samples one at a time, as described in
+	L{encodeSamples}, for when NumPy is not available.
+	
+	@type samples: array.array
+	@param samples: A collection of floating-point samples.
+	@type dither: L{Dither}|None
+	@param dither: The dither added to each sample before it is quantized, if
+	    any.
+	
+	@rtype: array.array
+	@return: The quantized samples, as native 16-bit integers.
+	"""
+	if dither is not None:
+		samples = [math.floor(sample + noise + 0.5) for (sample, noise) in zip(samples, dither.getNoise(len(samples)))]
+	quantized = array.array('h', (0,)) * len(samples)
+	for (i, sample) in enumerate(samples):
+		if sample >= 32767.0:
+			quantized[i] = 32767
+		elif sample <= -32768.0:
+			quantized[i] = -32768
+		else:
+			quantized[i] = int(sample)
+	return quantized
+	
\ No newline at end of file
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_engines
+
+Purpose
+=======
+ Checks that the 'block' synthesis engine's output matches that of the
+ 'sample' engine to within 1 unit of each 16-bit sample, as documented by
+ L{parwave.BlockSynthesizer}, for every input bundled in data/, so that its
+ FFT-based resonators can't drift away from the reference implementation.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import glob
+import optparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.languages as languages
+import src.parwave as parwave
+import src.transform as transform
+import src.waveform as waveform
+
+try:
+	import numpy
+except ImportError: #The block engine can't be tested without it.
+	numpy = None
+	
+_DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data') #: The directory holding the bundled inputs.
+_SEED = 0 #: The seed from which every render's noise is generated.
+
+def _getOptions(engine, turbo):
+	"""
+	Builds the options with which an input is rendered, as klatt.py's
+	defaults.
+	
+	@type engine: basestring
+	@param engine: The name of the synthesis engine.
+	@type turbo: bool
+	@param turbo: True if turbo mode is enabled.
+	
+	@rtype: optparse.Values
+	@return: The options with which synthesis should occur.
+	"""
+	return optparse.Values({
+	 'debug': False,
+	 'verbose': False,
+	 'turbo': turbo,
+	 'engine': engine,
+	 'cache_size': 0,
+	 'word_cache_size': 1024,
+	 'seed': _SEED,
+	 'continuous': False,
+	 'rate': parwave.SAMPLE_RATE,
+	 'gain': 0.0,
+	 'profile': False,
+	 'language': languages.DEFAULT_LANGUAGE,
+	})
+	
+def _readParagraphs(filename):
+	"""
+	Reads every paragraph in an input file.
+	
+	@type filename: basestring
+	@param filename: The path of the input.
+	
+	@rtype: list
+	@return: Every paragraph in the input, in order, as unicode.
+	"""
+	paragraphs = []
+	for paragraph in open(filename):
+		paragraph = paragraph.strip()
+		if paragraph.startswith('\xef\xbb\xbf'): #Compensate for Microsoft Notepad.
+			paragraph = paragraph[3:]
+		if paragraph:
+			paragraphs.append(paragraph.decode('utf-8'))
+	return paragraphs
+	
+def _render(paragraphs, options):
+	"""
+	Renders paragraphs, reseeding noise for each one exactly as klatt.py does.
+	
+	@type paragraphs: sequence
+	@param paragraphs: The paragraphs to be rendered, as unicode.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: numpy.ndarray
+	@return: Every quantized sample rendered.
+	"""
+	synthesizer = transform.createSynthesizer(options)
+	pcm = []
+	for (i, paragraph) in enumerate(paragraphs):
+		synthesizer.seedNoise((_SEED, i))
+		for sound in transform.paragraphToSound(paragraph, options, synthesizer):
+			pcm.append(waveform.encodeSamples(sound))
+	return numpy.frombuffer(''.join([str(data) for data in pcm]), '<i2').astype(int)
+	
+	
+class EngineAgreementTest(unittest.TestCase):
+	"""
+	Renders every bundled input with both engines and compares the results.
+	"""
+	def _compare(self, turbo):
+		"""
+		Asserts that both engines render every bundled input alike.
+		
+		@type turbo: bool
+		@param turbo: True if turbo mode is enabled.
+		"""
+		if numpy is None:
+			self.skipTest("NumPy is not installed.")
+		filenames = sorted(glob.glob(os.path.join(_DATA_DIRECTORY, '*')))
+		self.assertTrue(filenames, "No inputs were found in '%s'." % (_DATA_DIRECTORY))
+		for filename in filenames:
+			paragraphs = _readParagraphs(filename)
+			reference = _render(paragraphs, _getOptions('sample', turbo))
+			block = _render(paragraphs, _getOptions('block', turbo))
+			self.assertEqual(len(reference), len(block), "%s: %i samples, rather than %i." % (filename, len(block), len(reference)))
+			if len(reference):
+				difference = abs(reference - block).max()
+				self.assertTrue(difference <= 1, "%s: samples differ by up to %i." % (filename, difference))
+				
+	def testEngines(self):
+		self._compare(False)
+		
+	def testTurboEngines(self):
+		self._compare(True)
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file
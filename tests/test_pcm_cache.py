@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_pcm_cache
+
+Purpose
+=======
+ Checks that the on-disk PCM cache stays within its size budget without
+ scanning its directory every time a render is added.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.pcm_cache as pcm_cache
+
+class EvictionTest(unittest.TestCase):
+	"""
+	Checks L{pcm_cache.PCMCache.noteStored}.
+	"""
+	def setUp(self):
+		self._directory = tempfile.mkdtemp()
+		self._listdir = os.listdir
+		self._scans = []
+		def listdir(path):
+			self._scans.append(path)
+			return self._listdir(path)
+		os.listdir = listdir
+		
+	def tearDown(self):
+		os.listdir = self._listdir
+		shutil.rmtree(self._directory)
+		
+	def testScansOnlyOverBudget(self):
+		cache = pcm_cache.PCMCache(self._directory, 10)
+		cache.put('a', '\x00' * 4)
+		cache.put('b', '\x00' * 4)
+		self.assertEqual(len(self._scans), 1) #Only to learn what was already there.
+		
+		os.utime(os.path.join(self._directory, 'a.pcm'), (1, 1))
+		os.utime(os.path.join(self._directory, 'b.pcm'), (2, 2))
+		cache.put('c', '\x00' * 4)
+		self.assertEqual(len(self._scans), 2)
+		self.assertEqual(cache.get('a'), None)
+		self.assertEqual(cache.get('b'), '\x00' * 4)
+		self.assertEqual(cache.get('c'), '\x00' * 4)
+		
+	def testCountsExistingRenders(self):
+		pcm_cache.PCMCache(self._directory, 10).put('a', '\x00' * 8)
+		os.utime(os.path.join(self._directory, 'a.pcm'), (1, 1))
+		pcm_cache.PCMCache(self._directory, 10).put('b', '\x00' * 4)
+		self.assertEqual(sorted(self._listdir(self._directory)), ['b.pcm'])
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_server
+
+Purpose
+=======
+ Checks that the synthesis server answers malformed requests with the
+ documented errors, over the Unix domain socket transport.
+ 
+ Run from the project's root directory:
+  python -m unittest discover tests
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import multiprocessing
+import optparse
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.languages as languages
+import src.parwave as parwave
+import src.server as server
+
+def _getOptions():
+	"""
+	Builds the options with which the server synthesizes speech, as
+	klatt.py's defaults.
+	
+	@rtype: optparse.Values
+	@return: The options with which synthesis should occur.
+	"""
+	return optparse.Values({
+	 'debug': False,
+	 'verbose': True, #Every request is logged, exercising the logging path.
+	 'turbo': False,
+	 'engine': 'sample',
+	 'cache_size': 0,
+	 'word_cache_size': 0,
+	 'seed': 0,
+	 'continuous': False,
+	 'rate': parwave.SAMPLE_RATE,
+	 'gain': 0.0,
+	 'profile': False,
+	 'language': languages.DEFAULT_LANGUAGE,
+	 'jobs': 1,
+	})
+	
+	
+class AddressTest(unittest.TestCase):
+	"""
+	Checks which TCP addresses the server agrees to listen on.
+	"""
+	def testDefaultHost(self):
+		self.assertEqual(server._parseAddress('8080'), ('127.0.0.1', 8080))
+		
+	def testLoopbackHost(self):
+		self.assertEqual(server._parseAddress('localhost:8080'), ('localhost', 8080))
+		
+	def testRemoteHost(self):
+		self.assertRaises(ValueError, server._parseAddress, '0.0.0.0:8080')
+		self.assertEqual(server._parseAddress('0.0.0.0:8080', True), ('0.0.0.0', 8080))
+		
+		
+class UnixSocketTest(unittest.TestCase):
+	"""
+	Sends requests to a server listening on a Unix domain socket.
+	"""
+	_address = None #: The path of the server's socket.
+	_directory = None #: The temporary directory holding the socket.
+	_pool = None #: The pool in which the server renders speech.
+	_server = None #: The server being tested.
+	_stderr = None #: The real standard error, restored once the test is complete.
+	
+	def setUp(self):
+		self._directory = tempfile.mkdtemp()
+		self._address = os.path.join(self._directory, 'klatt.sock')
+		options = _getOptions()
+		self._pool = multiprocessing.Pool(1, server._initWorker, (options,))
+		self._server = server._UnixServer(self._address, self._pool, options)
+		thread = threading.Thread(target=self._server.serve_forever)
+		thread.setDaemon(True)
+		thread.start()
+		(self._stderr, sys.stderr) = (sys.stderr, open(os.devnull, 'w')) #Log lines are expected.
+		
+	def tearDown(self):
+		(sys.stderr, stderr) = (self._stderr, sys.stderr)
+		stderr.close()
+		self._server.shutdown()
+		self._server.server_close()
+		self._pool.terminate()
+		self._pool.join()
+		shutil.rmtree(self._directory)
+		
+	def _request(self, request):
+		"""
+		Sends a raw HTTP request to the server.
+		
+		@type request: str
+		@param request: The request, headers and body included.
+		
+		@rtype: int
+		@return: The status code of the response.
+		"""
+		client = socket.socket(socket.AF_UNIX)
+		try:
+			client.connect(self._address)
+			client.sendall(request)
+			response = ''
+			data = client.recv(4096)
+			while data:
+				response += data
+				data = client.recv(4096)
+		finally:
+			client.close()
+		self.assertTrue(response, "The server sent an empty reply.")
+		return int(response.split(' ', 2)[1])
+		
+	def testInvalidIPA(self):
+		body = '123'
+		self.assertEqual(self._request("POST / HTTP/1.0\r\nContent-Length: %i\r\n\r\n%s" % (len(body), body)), 400)
+		
+	def testUnsupportedFormat(self):
+		self.assertEqual(self._request("POST /?format=mp3 HTTP/1.0\r\nContent-Length: 0\r\n\r\n"), 400)
+		
+	def testNegativeLength(self):
+		self.assertEqual(self._request("POST / HTTP/1.0\r\nContent-Length: -1\r\n\r\n"), 400)
+		
+	def testOversizedBody(self):
+		self.assertEqual(self._request("POST / HTTP/1.0\r\nContent-Length: %i\r\n\r\n" % (server.MAX_REQUEST_BYTES + 1)), 413)
+		
+	def testGet(self):
+		self.assertEqual(self._request("GET / HTTP/1.0\r\n\r\n"), 501)
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_stream
+
+Purpose
+=======
+ Checks that PCM streams can be abandoned safely.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import array
+import optparse
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.languages as languages
+import src.stream as stream
+
+_TIMEOUT = 3.0 #: The number of seconds a thread is given to finish before a test fails.
+
+class _StalledSynthesizer(object):
+	"""
+	A stand-in for L{parwave.Synthesizer} whose sounds aren't ready until it
+	is released, so that a stream's consumer can be made to wait.
+	"""
+	released = None #: A threading.Event that lets sounds be produced once set.
+	
+	def __init__(self):
+		"""
+		Prepares a stalled synthesizer.
+		"""
+		self.released = threading.Event()
+		
+	def generateSilence(self, milliseconds):
+		"""
+		Produces a single sample of silence.
+		
+		@type milliseconds: int
+		@param milliseconds: The number of milliseconds of silence requested.
+		
+		@rtype: array.array
+		@return: A single sample of silence.
+		"""
+		return array.array('h', (0,))
+		
+	def resetState(self):
+		"""
+		Does nothing, since no state is kept.
+		"""
+		pass
+		
+	def synthesize(self, parameters, f0_multiplier, turbo):
+		"""
+		Waits to be released, then produces a single sample.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type turbo: bool
+		@param turbo: Whether turbo mode was requested.
+		
+		@rtype: array.array
+		@return: A single sample.
+		"""
+		self.released.wait()
+		return array.array('h', (1,))
+		
+		
+class CloseTest(unittest.TestCase):
+	"""
+	Closes streams while they are being consumed.
+	"""
+	def testCloseWhileConsumerWaits(self):
+		options = optparse.Values({
+		 'debug': False,
+		 'verbose': False,
+		 'turbo': False,
+		 'word_cache_size': 0,
+		 'profile': False,
+		 'language': languages.DEFAULT_LANGUAGE,
+		})
+		synthesizer = _StalledSynthesizer()
+		pcm_stream = stream.PCMStream(u'kæt.', options, synthesizer)
+		
+		blocks = []
+		consumer = threading.Thread(target=lambda: blocks.extend(pcm_stream))
+		consumer.setDaemon(True)
+		consumer.start()
+		time.sleep(0.2) #Let the consumer start waiting for the first block.
+		
+		closer = threading.Thread(target=pcm_stream.close)
+		closer.setDaemon(True)
+		closer.start()
+		time.sleep(0.2)
+		synthesizer.released.set() #Let the sound being rendered finish, so closing can complete.
+		
+		closer.join(_TIMEOUT)
+		self.assertFalse(closer.isAlive(), "close() did not return.")
+		consumer.join(_TIMEOUT)
+		self.assertFalse(consumer.isAlive(), "The consumer was still waiting after the stream was closed.")
+		self.assertEqual(blocks, [])
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file
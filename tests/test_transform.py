@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_transform
+
+Purpose
+=======
+ Checks how paragraphs are transformed into synthesized speech.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import optparse
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.languages as languages
+import src.parwave as parwave
+import src.transform as transform
+import src.waveform as waveform
+
+def _getOptions(engine, continuous):
+	"""
+	Builds the options with which a paragraph is rendered, as klatt.py's
+	defaults.
+	
+	@type engine: basestring
+	@param engine: The name of the synthesis engine.
+	@type continuous: bool
+	@param continuous: True if state is carried between sounds.
+	
+	@rtype: optparse.Values
+	@return: The options with which synthesis should occur.
+	"""
+	return optparse.Values({
+	 'debug': False,
+	 'verbose': False,
+	 'turbo': False,
+	 'engine': engine,
+	 'cache_size': 0,
+	 'word_cache_size': 0,
+	 'seed': 0,
+	 'continuous': continuous,
+	 'rate': parwave.SAMPLE_RATE,
+	 'gain': 0.0,
+	 'profile': False,
+	 'language': languages.DEFAULT_LANGUAGE,
+	})
+	
+def _render(paragraph, options):
+	"""
+	Renders a paragraph with a new synthesizer.
+	
+	@type paragraph: unicode
+	@param paragraph: The text to be synthesized.
+	@type options: optparse.Values
+	@param options: The options with which synthesis should occur.
+	
+	@rtype: str
+	@return: The paragraph's synthesized speech, as 16-bit PCM data.
+	"""
+	synthesizer = transform.createSynthesizer(options)
+	return ''.join([str(waveform.encodeSamples(sound)) for sound in transform.paragraphToSound(paragraph, options, synthesizer)])
+	
+	
+class SentenceBoundaryTest(unittest.TestCase):
+	"""
+	Checks that every sentence starts from a clean state, even in continuous
+	mode, where state is otherwise carried from each sound into the next.
+	"""
+	def _compare(self, engine):
+		"""
+		Asserts that the second sentence of a paragraph is rendered exactly as
+		it would be on its own.
+		
+		@type engine: basestring
+		@param engine: The name of the synthesis engine.
+		"""
+		for continuous in (False, True):
+			options = _getOptions(engine, continuous)
+			paragraph = _render(u'kæt. ʌ.', options)
+			sentence = _render(u'ʌ.', options)
+			self.assertEqual(paragraph[-len(sentence):], sentence, "The second sentence differs when continuous is %s." % (continuous))
+			
+	def testSampleEngine(self):
+		self._compare('sample')
+		
+	def testBlockEngine(self):
+		if parwave.numpy is None:
+			self.skipTest("NumPy is not installed.")
+		self._compare('block')
+		
+		
+class _SilentSynthesizer(object):
+	"""
+	A stand-in for L{parwave.Synthesizer} that renders nothing, so that
+	transformation can be exercised quickly.
+	"""
+	def generateSilence(self, milliseconds):
+		"""
+		Produces no silence.
+		
+		@type milliseconds: int
+		@param milliseconds: The number of milliseconds of silence requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		return ()
+		
+	def resetState(self):
+		"""
+		Does nothing, since no state is kept.
+		"""
+		pass
+		
+	def synthesize(self, parameters, f0_multiplier, turbo):
+		"""
+		Renders nothing.
+		
+		@type parameters: sequence(33)
+		@param parameters: A collection of synthesis parameters.
+		@type f0_multiplier: number
+		@param f0_multiplier: A modifier to apply to the f0 period.
+		@type turbo: bool
+		@param turbo: Whether turbo mode was requested.
+		
+		@rtype: tuple
+		@return: An empty collection of samples.
+		"""
+		return ()
+		
+		
+class WordCacheTest(unittest.TestCase):
+	"""
+	Checks that the word cache can be shared by paragraphs transformed in
+	several threads at once, as streams do.
+	"""
+	def testConcurrentTransformation(self):
+		options = _getOptions('sample', False)
+		options.word_cache_size = 2 #Every word evicts another.
+		paragraph = u' '.join([u'It sæʌndz lʌjk ðɛɹ wʌz sʌm læst nʌjt'] * 50) + u'.'
+		failures = []
+		def transform_paragraph():
+			try:
+				for sound in transform.paragraphToSound(paragraph, options, _SilentSynthesizer()):
+					pass
+			except Exception, e:
+				failures.append(e)
+				
+		threads = [threading.Thread(target=transform_paragraph) for i in xrange(16)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(failures, [])
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+CPSC 599 module: tests.test_waveform
+
+Purpose
+=======
+ Checks that samples are encoded as 16-bit PCM without ever wrapping around.
+ 
+Legal
+=====
+ All code, unless otherwise indicated, is original, and subject to the
+ terms of the GPLv3, which is provided in COPYING.
+ 
+ (C) Neil Tallim, 2009
+"""
+import array
+import os
+import StringIO
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.waveform as waveform
+
+try:
+	import numpy
+except ImportError: #NumPy cases are skipped without it.
+	numpy = None
+	
+class EncodeSamplesTest(unittest.TestCase):
+	"""
+	Checks L{waveform.encodeSamples}.
+	"""
+	def testIntegerOverflow(self):
+		self.assertRaises(OverflowError, waveform.encodeSamples, [40000])
+		if numpy is not None:
+			self.assertRaises(OverflowError, waveform.encodeSamples, numpy.array([0, 40000]))
+			self.assertRaises(OverflowError, waveform.encodeSamples, numpy.array([-40000, 0]))
+			
+	def testIntegerRange(self):
+		expected = '\x00\x80\x00\x00\xff\x7f' #Little-endian.
+		self.assertEqual(waveform.encodeSamples([-32768, 0, 32767]), expected)
+		if numpy is not None:
+			self.assertEqual(waveform.encodeSamples(numpy.array([-32768, 0, 32767])), expected)
+			
+	def testFloatClipping(self):
+		self.assertEqual(waveform.encodeSamples(array.array('f', [-40000.0, 0.5, 40000.0])), waveform.encodeSamples([-32768, 0, 32767]))
+		
+		
+class SinkTest(unittest.TestCase):
+	"""
+	Checks L{waveform.Sink}.
+	"""
+	def testStream(self):
+		stream = StringIO.StringIO()
+		sink = waveform.Sink(stream)
+		sink.addSamples([-32768, 0, 32767])
+		sink.close()
+		self.assertEqual(stream.getvalue(), waveform.encodeSamples([-32768, 0, 32767]))
+		self.assertFalse(stream.closed) #Left open for the caller.
+		
+		
+if __name__ == '__main__':
+	unittest.main()
+	
\ No newline at end of file